@@ -0,0 +1,102 @@
+import pandas as pd
+import numpy as np
+import re
+
+# Script:   AddressNormalizer.py
+# Purpose:  This script normalizes addresses once, when a data drop is loaded. Every address part is upper-cased, cleaned, and abbreviated the same way,
+#           then joined (skipping blank parts) into one canonical address key - 415 E 12TH ST, KANSAS CITY, MO, 64106.
+#           The geocode cache and the local geocoder use the same rules, so the same address always gets the same key.
+# Author:   Henry Chapman, hchapman@jacksongov.org
+# Dependencies:
+#	 External: Pandas, numpy, re
+#	 Functions: None
+
+#Street Suffixes and Directions, so "EAST 12TH STREET" and "E 12TH ST" are the same street
+streetAbbreviations = {'STREET': 'ST', 'AVENUE': 'AVE', 'AV': 'AVE', 'BOULEVARD': 'BLVD', 'DRIVE': 'DR', 'ROAD': 'RD', 'LANE': 'LN', 'COURT': 'CT', 'PLACE': 'PL',
+	'TERRACE': 'TER', 'TERR': 'TER', 'PARKWAY': 'PKWY', 'HIGHWAY': 'HWY', 'CIRCLE': 'CIR', 'TRAFFICWAY': 'TRFY', 'EXPRESSWAY': 'EXPY',
+	'NORTH': 'N', 'SOUTH': 'S', 'EAST': 'E', 'WEST': 'W', 'NORTHEAST': 'NE', 'NORTHWEST': 'NW', 'SOUTHEAST': 'SE', 'SOUTHWEST': 'SW'}
+abbreviationPattern = r'\b(' + "|".join(streetAbbreviations.keys()) + r')\b'
+
+# Function:  cleanAddressParts
+# Purpose:   This function cleans a column of address parts - upper-cased, float artifacts (".0") and punctuation removed, spaces collapsed, and suffixes/directions abbreviated
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: addressParts (series of one address part - street, city, state, etc.)
+# Return:    Returns a series of cleaned address parts (blank if there wasn't one)
+def cleanAddressParts(addressParts):
+	addressParts = addressParts.astype(object).where(addressParts.notna(), '').astype(str).str.upper()
+	addressParts = addressParts.str.replace(r'\.0$', '', regex = True)
+	addressParts = addressParts.str.replace(r'[^A-Z0-9#/\- ]', ' ', regex = True)
+	addressParts = addressParts.str.replace(abbreviationPattern, lambda match: streetAbbreviations[match.group(1)], regex = True)
+	addressParts = addressParts.str.replace(r'\s+', ' ', regex = True).str.strip()
+	return addressParts.where(addressParts != 'NAN', '')
+
+# Function:  cleanZipCodes
+# Purpose:   This function cleans a column of zip codes down to their first 5 digits (64106.0 and 64106-1234 are both 64106)
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: zipCodes (series of zip codes)
+# Return:    Returns a series of 5 digit zip codes (blank if there wasn't one)
+def cleanZipCodes(zipCodes):
+	return zipCodes.astype(object).where(zipCodes.notna(), '').astype(str).str.extract(r'^\s*(\d{5})', expand = False).fillna('')
+
+# Function:  joinAddressParts
+# Purpose:   This function joins cleaned address parts into the address key, skipping the blank ones
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: addressParts (list of series of cleaned address parts, in order)
+# Return:    Returns a series of address keys (None if every part was blank)
+def joinAddressParts(addressParts):
+	addressKeys = addressParts[0]
+	for addressPart in addressParts[1:]:
+		addressKeys = addressKeys + np.where((addressKeys != '') & (addressPart != ''), ', ', '') + addressPart
+	return addressKeys.where(addressKeys != '', None)
+
+# Function:  normalizeAddressColumns
+# Purpose:   This function normalizes the five Karpel address columns of a whole data drop at once
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: caseType (dataframe of a data drop), street, street2, city, state, zipCode (column names of the address parts)
+# Return:    Returns a dataframe with the Address Key, Street, City, and Zip of each row
+def normalizeAddressColumns(caseType, street, street2, city, state, zipCode):
+	streets = cleanAddressParts(caseType[street])
+	streets2 = cleanAddressParts(caseType[street2])
+	cities = cleanAddressParts(caseType[city])
+	states = cleanAddressParts(caseType[state])
+	zipCodes = cleanZipCodes(caseType[zipCode])
+
+	normalizedAddresses = pd.DataFrame(index = caseType.index)
+	normalizedAddresses['Address Key'] = joinAddressParts([streets, streets2, cities, states, zipCodes])
+	normalizedAddresses['Street'] = joinAddressParts([streets, streets2]).str.replace(', ', ' ', regex = False)
+	normalizedAddresses['City'] = cities
+	normalizedAddresses['Zip'] = zipCodes
+	return normalizedAddresses
+
+# Function:  cleanAddressPart
+# Purpose:   This function cleans one address part with the same rules as cleanAddressParts (for single lookups, where a series would be slower)
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: addressPart (string of one address part)
+# Return:    Returns the cleaned address part (blank if there wasn't one)
+def cleanAddressPart(addressPart):
+	addressPart = re.sub(r'\.0$', '', str(addressPart).upper())
+	addressPart = re.sub(r'[^A-Z0-9#/\- ]', ' ', addressPart)
+	addressPart = re.sub(abbreviationPattern, lambda match: streetAbbreviations[match.group(1)], addressPart)
+	addressPart = re.sub(r'\s+', ' ', addressPart).strip()
+	return '' if addressPart == 'NAN' else addressPart
+
+# Function:  normalizeAddress
+# Purpose:   This function normalizes one address that's already been joined together (old address dictionaries, or a lookup), with the same rules as normalizeAddressColumns
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: address (string of the street address)
+# Return:    Returns the address key (or None if there's nothing left of it)
+def normalizeAddress(address):
+	if address is None or (isinstance(address, float) and address != address):
+		return None
+
+	addressParts = []
+	for addressPart in str(address).split(','):
+		if re.match(r'^\s*\d{5}(\.0|-\d{4})?\s*$', addressPart):
+			addressParts.append(addressPart.strip()[:5])
+		else:
+			addressParts.append(cleanAddressPart(addressPart))
+
+	address = ", ".join([addressPart for addressPart in addressParts if addressPart != ''])
+	if address == "":
+		return None
+	return address
@@ -0,0 +1,351 @@
+import pandas as pd
+import numpy as np
+from HelperMethods import getCaseType, readHelperDataset
+from CaseDetails import disposalCategories
+
+# Script:   AnalysisEngine.py
+# Purpose:  This script runs the dashboard analysis for every crime category (and "All") at once. It merges the charge categories into each
+#           stage (received, not-filed, filed, disposed) one time, then counts every metric with one groupby per stage (category, item),
+#           instead of filtering and re-merging the cases once per category. It writes the same CSVs as DefendantDemographics and CaseDetails.
+# Author:   Henry Chapman, hchapman@jacksongov.org
+# Dependencies:
+#	 External: Pandas, numpy
+#	 Functions: getCaseType, readHelperDataset, disposalCategories
+
+#Histogram Bins (defendant age in years, bond in thousands, age of case in months)
+ageBins = np.arange(0, 110, 10)
+bondBins = np.arange(0, 200, 15)
+caseAgeBins = np.arange(0, 110, 10)
+
+# Function:  mergeCaseCategories
+# Purpose:   This function merges the charge categories into each stage one time. Every row gets a "caseCategory" column, and every case
+#            is repeated once more with the "All" category, so "All" is counted in the same groupby as the other categories.
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: xls (list of received, not-filed, filed, and disposed cases), chargesDictionary (dataframe of ChargeCodeCategories.csv)
+# Return:    Returns a list of 4 dataframes with a caseCategory column
+def mergeCaseCategories(xls, chargesDictionary):
+	analysisXls = []
+	for caseType in xls:
+
+		#Merge In Case Charges (once for every category)
+		categoryCases = caseType.merge(chargesDictionary, on='Ref. Charge Code')
+		categoryCases['caseCategory'] = categoryCases['Category'].astype(object)
+
+		#Every Case also belongs to "All"
+		allCases = caseType.copy()
+		allCases['caseCategory'] = "All"
+
+		analysisXls.append(pd.concat([categoryCases, allCases], ignore_index = True))
+	return analysisXls
+
+# Function:  countByCategory
+# Purpose:   This function counts the rows of each item (race, agency, etc.) within each category
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: caseType (dataframe with a caseCategory column), column (string of the column to count)
+# Return:    Returns a series of counts indexed by (caseCategory, item)
+def countByCategory(caseType, column):
+	return caseType.groupby(['caseCategory', column], observed = True).size()
+
+# Function:  binByCategory
+# Purpose:   This function sorts a column into histogram bins, then counts each bin within each category
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: values (series of numbers to bin), caseCategories (series of categories), bins (array of bin edges)
+# Return:    Returns a dataframe with a row for each category and a column for each bin
+def binByCategory(values, caseCategories, bins):
+
+	#Same bins that value_counts(bins=bins) uses
+	binnedValues = pd.cut(values, bins, include_lowest = True)
+	if values.empty:
+		return pd.DataFrame(columns = binnedValues.cat.categories)
+	binCounts = values.groupby([caseCategories, binnedValues], observed = True).size().unstack(fill_value = 0)
+	return binCounts.reindex(columns = binnedValues.cat.categories, fill_value = 0)
+
+# Function:  getCategoryCounts
+# Purpose:   This function pulls one category's counts out of countByCategory
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: counts (series from countByCategory), tempCaseCategory (string of the category)
+# Return:    Returns a series of counts indexed by item (empty if the category doesn't have any)
+def getCategoryCounts(counts, tempCaseCategory):
+	if tempCaseCategory not in counts.index.get_level_values(0):
+		return pd.Series(dtype = 'int64')
+
+	categoryCounts = counts.xs(tempCaseCategory, level = 0)
+
+	#Use plain values for the index so counts from different case types line up
+	categoryCounts.index = categoryCounts.index.astype(object)
+	return categoryCounts
+
+# Function:  getCategoryBins
+# Purpose:   This function pulls one category's histogram out of binByCategory. Like value_counts, a category without any values gets an empty histogram.
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: binCounts (dataframe from binByCategory), tempCaseCategory (string of the category)
+# Return:    Returns a series of counts indexed by bin
+def getCategoryBins(binCounts, tempCaseCategory):
+	if tempCaseCategory not in binCounts.index:
+		return pd.Series(dtype = 'int64')
+	return pd.Series(binCounts.loc[tempCaseCategory].values, index = binCounts.columns)
+
+# Function:  buildStageTable
+# Purpose:   This function lays out one category's counts the same way the dashboard CSVs always have: a column for each case type, then Year, Item,
+#            zeroes for the case types that weren't counted, and caseCategory
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: stageCounts (dictionary of case type label to series of counts), tempCaseCategory (string of the category), year (integer of year of analysis)
+# Return:    Returns a dataframe ready to export
+def buildStageTable(stageCounts, tempCaseCategory, year):
+	stageTable = pd.DataFrame()
+
+	#The first case type sets the items (same as assigning each column in the old per-category functions)
+	for caseLabel in stageCounts:
+		stageTable[caseLabel] = stageCounts[caseLabel]
+
+	stageTable['Year'] = year
+	stageTable['Item'] = stageTable.index
+
+	#Dummy Columns for the Case Types that weren't counted
+	for caseInput in range(4):
+		if getCaseType(caseInput) not in stageCounts:
+			stageTable[getCaseType(caseInput)] = 0
+
+	stageTable.reset_index(drop = True, inplace = True)
+	stageTable['caseCategory'] = tempCaseCategory
+	return stageTable
+
+# Function:  buildYearTable
+# Purpose:   This function lays out one category's totals ("Received 120", "Filed 80", etc.) as a single row for the year, the same way caseNumbers does
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: listOfData (list of "<case type> <value>" strings), tempCaseCategory (string of the category), year (integer of year of analysis)
+# Return:    Returns a dataframe ready to export
+def buildYearTable(listOfData, tempCaseCategory, year):
+
+	#Split the strings into type and count
+	yearTable = pd.DataFrame(listOfData, columns=['Data'])
+	yearTable = yearTable['Data'].str.split(' ', 3, expand=True)
+	yearTable["Year"] = year
+	yearTable = yearTable.rename(columns={0: "Type", 1:"Count", 2:"Year"})
+
+	#Pivot and Transpose so each case type is a column
+	yearTable = yearTable.reset_index().pivot('Type', 'Year', 'Count')
+	columns = yearTable.columns.tolist()
+	yearTable.reset_index(inplace=True)
+	yearTable = yearTable.set_index('Type').T
+	yearTable['Item'] = columns
+
+	#Year goes first
+	yearTable['Year'] = year
+	col = yearTable.pop("Year")
+	yearTable.insert(0, col.name, col)
+
+	yearTable['caseCategory'] = tempCaseCategory
+	return yearTable
+
+# Function:  getStageCounts
+# Purpose:   This function pulls one category's counts out of each case type
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: countsByStage (list of series from countByCategory, in case type order), tempCaseCategory (string of the category)
+# Return:    Returns a dictionary of case type label to series of counts
+def getStageCounts(countsByStage, tempCaseCategory):
+	stageCounts = {}
+	for caseInput in range(len(countsByStage)):
+		stageCounts[getCaseType(caseInput)] = getCategoryCounts(countsByStage[caseInput], tempCaseCategory)
+	return stageCounts
+
+# Function:  categoryDemographics
+# Purpose:   This function counts defendant race, sex, and age (at referral) for every category
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: uniqueXls (list of case types with one row per category and file number), categories (list of categories), year (integer of year of analysis)
+# Return:    No return values, but saves RaceDemographics, GenderDemographics, and AgeDemographics CSVs for each category
+def categoryDemographics(uniqueXls, categories, year):
+	raceCounts = [countByCategory(caseType, 'Def. Race') for caseType in uniqueXls]
+	sexCounts = [countByCategory(caseType, 'Def. Sex') for caseType in uniqueXls]
+
+	#Age at Referral in Years
+	ageCounts = []
+	for caseType in uniqueXls:
+		caseType = caseType.dropna(subset = ['Def. DOB'])
+		age = (pd.to_datetime(caseType['Enter Dt.']) - pd.to_datetime(caseType['Def. DOB']))/np.timedelta64(1, "Y")
+		ageCounts.append(binByCategory(age, caseType['caseCategory'], ageBins))
+
+	for tempCaseCategory in categories:
+		race = buildStageTable(getStageCounts(raceCounts, tempCaseCategory), tempCaseCategory, year)
+		race.to_csv("DataForDashboard\\" +tempCaseCategory+" - RaceDemographics.csv", encoding='utf-8', index=False)
+
+		#Drop unknown genders (there isn't that many of them)
+		gender = buildStageTable(getStageCounts(sexCounts, tempCaseCategory), tempCaseCategory, year)
+		gender = gender[gender['Item'] != "U"]
+		gender.to_csv("DataForDashboard\\"+tempCaseCategory+" - GenderDemographics.csv", encoding='utf-8', index=False)
+
+		ageStages = {}
+		for caseInput in range(len(ageCounts)):
+			ageStages[getCaseType(caseInput)] = getCategoryBins(ageCounts[caseInput], tempCaseCategory)
+		age = buildStageTable(ageStages, tempCaseCategory, year)
+		age.to_csv("DataForDashboard\\" +tempCaseCategory+" - AgeDemographics.csv", encoding='utf-8', index=False)
+
+# Function:  categoryIncarcerated
+# Purpose:   This function finds the share of open cases with a defendant in jail for every category
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: uniqueXls, categories, year, jailInmateList, disposedCases, notFiledCases
+# Return:    No return values, but saves an incarceratedByYear CSV for each category
+def categoryIncarcerated(uniqueXls, categories, year, jailInmateList, disposedCases, notFiledCases):
+	caseNumbers = []
+	incarceratedNumbers = []
+	for caseType in uniqueXls:
+
+		#Merge in the Inmates, then drop the cases that are closed
+		caseType = caseType.merge(jailInmateList, on = "File #", how = 'left')
+		caseType = caseType[~caseType['File #'].isin(disposedCases['File #'].tolist())]
+		caseType = caseType[~caseType['File #'].isin(notFiledCases['File #'].tolist())]
+
+		caseNumbers.append(caseType.groupby('caseCategory').size())
+		incarceratedNumbers.append(caseType.groupby('caseCategory')['InmateNum'].nunique())
+
+	for tempCaseCategory in categories:
+		listOfData = []
+		for caseInput in range(len(caseNumbers)):
+			tempCaseNumber = int(caseNumbers[caseInput].get(tempCaseCategory, 0))
+			tempIncarceratedNumber = int(incarceratedNumbers[caseInput].get(tempCaseCategory, 0))
+
+			if tempCaseNumber == 0:
+				incarceratingPercentage = 0
+			else:
+				incarceratingPercentage = tempIncarceratedNumber / tempCaseNumber
+			listOfData.append(getCaseType(caseInput) + " " + str(incarceratingPercentage))
+
+		incarceratedByYear = buildYearTable(listOfData, tempCaseCategory, year)
+		incarceratedByYear['Disposed'] = int(caseNumbers[0].get(tempCaseCategory, 0))
+		incarceratedByYear.to_csv("DataForDashboard\\"+tempCaseCategory+" - incarceratedByYear.csv", encoding='utf-8', index=False)
+
+# Function:  categoryBond
+# Purpose:   This function makes a histogram of initial bonds (in thousands) for every category
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: uniqueXls, categories, year, bondAmounts
+# Return:    No return values, but saves a Bonds CSV for each category
+def categoryBond(uniqueXls, categories, year, bondAmounts):
+	bondCounts = []
+	for caseType in uniqueXls:
+		caseType = caseType.merge(bondAmounts, on = 'File #', how = 'left')
+		caseType = caseType.dropna(subset = ['Initial Bond'])
+		bondCounts.append(binByCategory(caseType['Initial Bond']/1000, caseType['caseCategory'], bondBins))
+
+	for tempCaseCategory in categories:
+		bondStages = {}
+		for caseInput in range(len(bondCounts)):
+			bondStages[getCaseType(caseInput)] = getCategoryBins(bondCounts[caseInput], tempCaseCategory)
+		bond = buildStageTable(bondStages, tempCaseCategory, year)
+		bond.to_csv("DataForDashboard\\" +tempCaseCategory+" - Bonds.csv", encoding='utf-8', index=False)
+
+# Function:  categoryCaseDetails
+# Purpose:   This function counts referring agencies, case numbers, decline reasons, and how long it takes to dispose or decline a case for every category
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: analysisXls (from mergeCaseCategories), uniqueXls, categories, year
+# Return:    No return values, but saves ReferringAgencies, CasesByYear, AgeOfCase, DeclinedAgeOfCase, and DeclineReasons CSVs for each category
+def categoryCaseDetails(analysisXls, uniqueXls, categories, year):
+
+	#Referring Agencies - cases without an agency are dropped before the duplicates, same as agency()
+	PDAgency = readHelperDataset("HelperDatasets\\PD Agency.csv")
+	PDAgency['Agency'] = PDAgency['Agency'].astype(int)
+	agencyCounts = []
+	for caseType in analysisXls:
+		caseType = caseType.dropna(subset=['Agency'])
+		caseType = caseType.drop_duplicates(subset = ['caseCategory', 'File #'])
+		caseType['Agency'] = caseType['Agency'].astype(int)
+		caseType = caseType.merge(PDAgency, on='Agency')
+		agencyCounts.append(countByCategory(caseType, 'PD NAME'))
+
+	#Case Numbers
+	caseCounts = [caseType.groupby('caseCategory').size() for caseType in uniqueXls]
+
+	#Age of Case (in Months) for Disposed and Declined Cases
+	caseAgeCounts = {}
+	for caseInput in [3, 1]:
+		caseType = uniqueXls[caseInput]
+		caseAge = (pd.to_datetime(caseType['Disp. Dt.']) - pd.to_datetime(caseType['Enter Dt.']))/np.timedelta64(1, "M")
+		caseAgeCounts[caseInput] = binByCategory(caseAge, caseType['caseCategory'], caseAgeBins)
+
+	#Decline Reasons - unique disposal reasons by case
+	refusalReasonsDataSet = readHelperDataset("HelperDatasets\\RefusalReasons.csv")
+	declinedCases = analysisXls[1].dropna(subset = ['Disp. Code'])
+	declinedCases = declinedCases.drop_duplicates()
+	declinedCases = declinedCases.merge(refusalReasonsDataSet, on = 'Disp. Code')
+	declineCounts = countByCategory(declinedCases, 'Reason')
+
+	for tempCaseCategory in categories:
+		referringAgency = buildStageTable(getStageCounts(agencyCounts, tempCaseCategory), tempCaseCategory, year)
+		referringAgency.to_csv("DataForDashboard\\" + tempCaseCategory + " - ReferringAgencies.csv", encoding='utf-8', index=False)
+
+		listOfData = []
+		for caseInput in range(len(caseCounts)):
+			listOfData.append(getCaseType(caseInput) + " " + str(int(caseCounts[caseInput].get(tempCaseCategory, 0))))
+		caseNumbersByYear = buildYearTable(listOfData, tempCaseCategory, year)
+		caseNumbersByYear.to_csv("DataForDashboard\\"+tempCaseCategory+" - CasesByYear.csv", encoding='utf-8', index=False)
+
+		age = buildStageTable({getCaseType(3): getCategoryBins(caseAgeCounts[3], tempCaseCategory)}, tempCaseCategory, year)
+		age.to_csv("DataForDashboard\\" + tempCaseCategory + " - AgeOfCase.csv", encoding='utf-8', index=False)
+
+		age = buildStageTable({getCaseType(1): getCategoryBins(caseAgeCounts[1], tempCaseCategory)}, tempCaseCategory, year)
+		age.to_csv("DataForDashboard\\" + tempCaseCategory + " - DeclinedAgeOfCase.csv", encoding='utf-8', index=False)
+
+		declineReasons = buildStageTable({getCaseType(1): getCategoryCounts(declineCounts, tempCaseCategory)}, tempCaseCategory, year)
+		declineReasons.to_csv("DataForDashboard\\" + tempCaseCategory + " - DeclineReasons.csv", encoding='utf-8', index=False)
+
+# Function:  categoryDisposals
+# Purpose:   This function runs the trial and disposition outcomes for every category. The categories are split out of the merged cases in one pass.
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: analysisXls (from mergeCaseCategories), categories, year
+# Return:    No return values, but saves TrialCases, TrialOutcomes, and NonTrialOutcomes CSVs for each category
+def categoryDisposals(analysisXls, categories, year):
+	disposedByCategory = dict(tuple(analysisXls[3].groupby('caseCategory', sort = False)))
+	for tempCaseCategory in categories:
+		disposedCases = disposedByCategory.get(tempCaseCategory, analysisXls[3].iloc[0:0])
+		disposalCategories([None, None, None, disposedCases], tempCaseCategory, year)
+
+# Function:  analyzeCategories
+# Purpose:   This is the main runner of the analysis. It merges the categories once, then counts every metric for every category and "All".
+#            If only some categories changed since the previous drop, the Karpel metrics are only recomputed for those categories.
+#            The jail and bond numbers don't come from Karpel, so they're always recomputed.
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: caseStore (CaseStore of the current run), crimeCategoryList (list of categories), jailInmateList, bondAmounts,
+#            changedCategories (set of categories that changed, or None for every category)
+# Return:    No return values, but saves every category's CSVs in DataForDashboard
+def analyzeCategories(caseStore, crimeCategoryList, jailInmateList, bondAmounts, changedCategories):
+
+	#Get the Current Cases and Year from the CaseStore
+	xls = caseStore.xls
+	year = caseStore.year
+
+	#Merge In Case Charges Once
+	chargesDictionary = readHelperDataset("HelperDatasets\\ChargeCodeCategories.csv")
+	analysisXls = mergeCaseCategories(xls, chargesDictionary)
+
+	#if Category is Empty, it skips it, and doesn't analyze it
+	presentCategories = set()
+	for caseType in analysisXls:
+		presentCategories.update(caseType['caseCategory'].unique().tolist())
+	categories = []
+	for tempCaseCategory in crimeCategoryList:
+		if tempCaseCategory in presentCategories:
+			categories.append(tempCaseCategory)
+		else:
+			print("Skipping " + str(tempCaseCategory))
+	categories.append("All")
+
+	#Drop Duplicate File Numbers within each category to isolate cases, not charges
+	allUniqueXls = [caseType.drop_duplicates(subset=['caseCategory', 'File #']) for caseType in analysisXls]
+
+	#Only the changed categories need their Karpel metrics recomputed
+	if changedCategories is None:
+		karpelCategories = categories
+		uniqueXls = allUniqueXls
+	else:
+		karpelCategories = [tempCaseCategory for tempCaseCategory in categories if tempCaseCategory in changedCategories]
+		analysisXls = [caseType[caseType['caseCategory'].isin(karpelCategories)] for caseType in analysisXls]
+		uniqueXls = [caseType[caseType['caseCategory'].isin(karpelCategories)] for caseType in allUniqueXls]
+	print("Analyzing " + str(len(karpelCategories)) + " Categories")
+
+	#Step 2: Defendant Based Analysis and Case Details
+	categoryDemographics(uniqueXls, karpelCategories, year)
+	categoryCaseDetails(analysisXls, uniqueXls, karpelCategories, year)
+	categoryDisposals(analysisXls, karpelCategories, year)
+
+	#The Jail and Bond Numbers are Recomputed for every category
+	categoryIncarcerated(allUniqueXls, categories, year, jailInmateList, caseStore.disposedCases, caseStore.notFiledCases)
+	categoryBond(allUniqueXls, categories, year, bondAmounts)
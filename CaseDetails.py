@@ -2,7 +2,7 @@ import pandas as pd
 from datetime import datetime
 from datetime import date
 from datetime import datetime, timedelta
-from HelperMethods import getCaseType
+from HelperMethods import getCaseType, countByItem, readHelperDataset
 import numpy as np
 import os
 
@@ -11,7 +11,7 @@ import os
 # Author:   Henry Chapman, hchapman@jacksongov.org
 # Dependencies:
 #	 External: Pandas, os, numpy, and datetime
-#	 Functions: getCaseType
+#	 Functions: getCaseType, countByItem, readHelperDataset
 
 # Function:  agency
 # Purpose:   Counts a list of police agencies by case category
@@ -23,7 +23,7 @@ def agency(xls, tempCaseCategory, year):
 	referringAgency = pd.DataFrame()
 	
 	#Read Dictionary of Referring Police Agencies
-	PDAgency = pd.read_csv("HelperDatasets\\PD Agency.csv", encoding = 'utf-8')
+	PDAgency = readHelperDataset("HelperDatasets\\PD Agency.csv")
 	
 	#Convert Agency Labels as Integers for Matching
 	PDAgency['Agency'] = PDAgency['Agency'].astype(int)
@@ -50,7 +50,7 @@ def agency(xls, tempCaseCategory, year):
 		caseType = caseType.merge(PDAgency, on='Agency')
 		
 		#Count Agency Names by numbers
-		referringAgency[caseLabel] = caseType.groupby(['PD NAME']).size()
+		referringAgency[caseLabel] = countByItem(caseType, 'PD NAME')
 		
 		#Increment caseInput by 1
 		caseInput = caseInput + 1
@@ -135,87 +135,29 @@ def caseNumbers(xls, tempCaseCategory, year):
 	#Export Dataframe to CSV
 	caseNumbersByYear.to_csv("DataForDashboard\\"+tempCaseCategory+" - CasesByYear.csv", encoding='utf-8', index=False)
 
-# Function:  trialCase
-# Purpose:   Function determines if a disposed case went to trial or not
+# Function:  disposalFlags
+# Purpose:   Function flags every charge with each outcome, then rolls the flags up so each case gets one row. A case has an outcome if any of its charges do.
+#            Trial Case - an Activity of "Trial", Guilty - a Reason of "Guilty", Guilty Plea, Drug Court, Outside Referral, No Prosecution - the Activity
+#            contains it, Entire Case Dismissed - the Reason contains "Entire Dismissal"
 # Author:    Henry Chapman, hchapman@jacksongov.org
-# Arguments: dataframe (of disposed cases)
-# Return:    String - "Trial Case" or "Not Trial Case"
-def trialCase(dataframe):
-
-	#Filters DataFrame by "Trial"
-	dataframe = dataframe[dataframe['Activity']=='Trial']
-
-	#If Activity contains trial at all, then the case went to trial, return "Trial Case"
-	if dataframe['Activity'].str.contains('Trial').any() == True:
-		return "Trial Case"
-	else:
-		return "Not Trial Case"
-
-# Function:  guiltyVerdict
-# Purpose:   Function determines if a case has a guilty trial verdict
-# Author:    Henry Chapman, hchapman@jacksongov.org
-# Arguments: dataframe (of disposed cases)
-# Return:    String - "Guilty" or "Not Guilty"
-def guiltyVerdict(dataframe):
-
-	#Filters dataframe by "Guilty" reasons for verdicts
-	dataframe = dataframe[dataframe['Reason']=='Guilty']
-
-	#If Reasons contains the word guilty, then it's a guilty verdict
-	if dataframe['Reason'].str.contains('Guilty').any() == True:
-		return "Guilty"
-	else:
-		return "Not Guilty"
-
-# Function:  guiltyPlea
-# Purpose:   Function determines if a case has a guilty plea
-# Author:    Henry Chapman, hchapman@jacksongov.org
-# Arguments: dataframe (of disposed cases)
-# Return:    String - "Guilty Plea" or "Not Guilty Plea"
-def guiltyPlea(dataframe):
-	if dataframe['Activity'].str.contains("Guilty Plea").any() == True:
-		return "Guilty Plea"
-	return "Not Guilty Plea"
-
-# Function:  drugCourt
-# Purpose:   Function determines if a case has a drug court outcome
-# Author:    Henry Chapman, hchapman@jacksongov.org
-# Arguments: dataframe (of disposed cases)
-# Return:    String - "Drug Court" or "Not Drug Court"
-def drugCourt(dataframe):
-	if dataframe['Activity'].str.contains("Drug Court").any() == True:
-		return "Drug Court"
-	return "Not Drug Court"
-
-# Function:  entireCaseDismissal
-# Purpose:   Function determines if a case was dismissed
-# Author:    Henry Chapman, hchapman@jacksongov.org
-# Arguments: dataframe (of disposed cases)
-# Return:    String - "Entire Case Dismissed" or "Case Not Dismissed"
-def entireCaseDismissal(dataframe):
-	if dataframe['Reason'].str.contains("Entire Dismissal").any() == True:
-		return "Entire Case Dismissed"
-	return "Case Not Dismissed"
-
-# Function:  outsideReferral
-# Purpose:   Function determines if a case was dismissed
-# Author:    Henry Chapman, hchapman@jacksongov.org
-# Arguments: dataframe (of disposed cases)
-# Return:    String - "Referred to Other Agency" or "Not Referred to Other Agency"
-def outsideReferral(dataframe):
-	if dataframe['Activity'].str.contains("Outside Referral").any() == True:
-		return "Referred to Other Agency"
-	return "Not Referred to Other Agency"
-
-# Function:  noProsecutionReason
-# Purpose:   Function determines if a case was Not Prosecuted
-# Author:    Henry Chapman, hchapman@jacksongov.org
-# Arguments: dataframe (of disposed cases)
-# Return:    String - "No Prosecution" or "None"
-def noProsecutionReason(dataframe):
-	if dataframe['Activity'].str.contains("No Prosecution").any() == True:
-		return "No Prosecution"
-	return "None"
+# Arguments: dataframe (of disposed cases, with the disposal codes merged in), justFileNumbers (list of unique file numbers)
+# Return:    Returns a dataframe of True/False flags, with one row for each file number (in the same order as justFileNumbers)
+def disposalFlags(dataframe, justFileNumbers):
+	activity = dataframe['Activity'].astype(str)
+	reason = dataframe['Reason'].astype(str)
+
+	#Flag Each Charge
+	chargeFlags = pd.DataFrame({'File #': dataframe['File #'],
+		'Trial Case': activity == 'Trial',
+		'Guilty': reason == 'Guilty',
+		'Guilty Plea': activity.str.contains("Guilty Plea", regex = False),
+		'Drug Court': activity.str.contains("Drug Court", regex = False),
+		'Entire Case Dismissed': reason.str.contains("Entire Dismissal", regex = False),
+		'Referred to Other Agency': activity.str.contains("Outside Referral", regex = False),
+		'No Prosecution': activity.str.contains("No Prosecution", regex = False)})
+
+	#Roll the flags up to each case
+	return chargeFlags.groupby('File #').any().reindex(justFileNumbers, fill_value = False)
 
 # Function:  disposalCategories
 # Purpose:   This function determines outcomes for each case. It uses a ranking algorithm to first determine trial cases, then cases that didn't go to trial. 
@@ -227,7 +169,7 @@ def disposalCategories(xls, tempCaseCategory, year):
 	caseType = xls[3]
 
 	#Reading the Disposition Codes as a dictionary
-	disposalCodes = pd.read_csv("HelperDatasets\\Disposition Codes.csv", encoding = 'utf-8')
+	disposalCodes = readHelperDataset("HelperDatasets\\Disposition Codes.csv")
 	
 	#This Bit Handles The Outcome Part of the Code
 	#Initializes DataFrames
@@ -244,60 +186,26 @@ def disposalCategories(xls, tempCaseCategory, year):
 	#Initialises Strings for Disposed and Year for later use
 	caseLabel = "Disposed"
 	yearText = year
-
-	#Initializes Lists for Later Analysis
-	trialFileNumbers = []
-	caseTrial = []
-	trialGuilt = []
-	nonTrialFileNumbers = []
-	nonTrialGuilt = []
-	nonTrialStatus = []
 		
 	#Generates a list of unique file numbers
 	justFileNumbers = list(set(caseType['File #'].tolist()))
 	
 	#Creates a column for unique file numbers in the tempYear trial dataframe
 	tempYearTrial['File #'] = justFileNumbers
-		
-	#Loops through File Numbers
-	for fileNumber in justFileNumbers:
-		
-		#Let's Look at Just One Case
-		indCaseCharges = caseType[caseType['File #'] == fileNumber]
-		
-		#Appending the trial status of that one case to the caseTrial List
-		caseTrial.append(trialCase(indCaseCharges))
-
-		#First Look at Whether There's a Trial Verdict
-		if trialCase(indCaseCharges) == "Trial Case":
-			trialFileNumbers.append(fileNumber)
-			trialGuilt.append(guiltyVerdict(indCaseCharges))
-
-		#If There's No Trial Verdict
-		elif trialCase(indCaseCharges) != "Trial Case":
-			nonTrialFileNumbers.append(fileNumber)
-
-			#Check Guilty Plea
-			if guiltyPlea(indCaseCharges) == "Guilty Plea":
-				nonTrialStatus.append("Guilty Plea")
-
-			#Check Drug Court
-			elif drugCourt(indCaseCharges) == "Drug Court":
-				nonTrialStatus.append("Drug Court")
 
-			#Check Case Dismissal
-			elif entireCaseDismissal(indCaseCharges) == "Entire Case Dismissed":
-				nonTrialStatus.append("Entire Case Dismissed")
+	#Flag the outcomes of every case at once
+	caseFlags = disposalFlags(caseType, justFileNumbers)
+	isTrial = caseFlags['Trial Case'].values
 
-			#Check Outside Referral
-			elif outsideReferral(indCaseCharges) == "Referred to Other Agency":
-				nonTrialStatus.append("Referred to Other Agency")
+	#First Look at Whether There's a Trial Verdict
+	caseTrial = np.where(isTrial, "Trial Case", "Not Trial Case")
+	trialFileNumbers = caseFlags.index[isTrial].tolist()
+	trialGuilt = np.where(caseFlags['Guilty'].values[isTrial], "Guilty", "Not Guilty")
 
-			#Check No Prosecution Reasons
-			elif noProsecutionReason(indCaseCharges) == "No Prosecution":
-				nonTrialStatus.append("No Prosecution")
-			else:
-				nonTrialStatus.append("Other")
+	#If There's No Trial Verdict, take the first outcome in order (Guilty Plea, Drug Court, Dismissal, Outside Referral, No Prosecution)
+	nonTrialFileNumbers = caseFlags.index[~isTrial].tolist()
+	nonTrialRanking = ["Guilty Plea", "Drug Court", "Entire Case Dismissed", "Referred to Other Agency", "No Prosecution"]
+	nonTrialStatus = np.select([caseFlags[status].values[~isTrial] for status in nonTrialRanking], nonTrialRanking, default = "Other")
 
 	#Constructing DataFrame Based on Whether Case Went To Trial (Trial/No Trial)
 	tempYearTrial['Status'] = caseTrial
@@ -452,7 +360,7 @@ def refusalReasons(xls, tempCaseCategory, year):
 	caseType = xls[1]
 
 	#Load Refusal Reasons
-	refusalReasonsDataSet = pd.read_csv("HelperDatasets\\RefusalReasons.csv", encoding = 'utf-8')
+	refusalReasonsDataSet = readHelperDataset("HelperDatasets\\RefusalReasons.csv")
 
 	#Drop NA - Those without a disposal code
 	caseType = caseType.dropna(subset = ['Disp. Code'])
@@ -467,7 +375,7 @@ def refusalReasons(xls, tempCaseCategory, year):
 	caseType = caseType.merge(refusalReasonsDataSet, on = 'Disp. Code')
 	
 	#GroupBy Disposal Reasons, then add it to our new export dataframe
-	declineReasons[caseLabel] = caseType.groupby(['Reason']).size()
+	declineReasons[caseLabel] = countByItem(caseType, 'Reason')
 
 	#Create Dummy Columns, then export the dataframe
 	declineReasons['Year'] = year
@@ -508,7 +416,7 @@ def attorneys(xls, tempCaseCategory, year):
 		caseLabel = getCaseType(caseInput)
 
 		#Count Agency Names by numbers
-		attorneyDataFrame[caseLabel] = caseType.groupby(['Assigned Atty']).size()
+		attorneyDataFrame[caseLabel] = countByItem(caseType, 'Assigned Atty')
 		
 		#Increment caseInput by 1
 		caseInput = caseInput + 1
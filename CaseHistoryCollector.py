@@ -2,6 +2,12 @@ import pandas as pd
 import os
 from openpyxl import load_workbook
 import sys, os
+from DropSnapshots import readDropFile
+from KarpelSchema import applyKarpelSchema
+from AddressNormalizer import normalizeAddressColumns
+from ConsolidatedHistory import partitionConsolidatedHistory, readStageHistory, writeStagePartition
+from HelperMethods import loadConcurrently, readHelperDataset
+from functools import partial
 
 def generateCSV(homeFolder):
 	path = homeFolder + "KCPD Clearance Dashboard\\Sankeys\\KarpelDashboard\\"
@@ -12,6 +18,11 @@ def generateCSV(homeFolder):
 	links = []
 
 	for item in sankeys:
+
+		#Skip the shared plotly.min.js (and anything else that isn't a Sankey page)
+		if not item.endswith(".html"):
+			continue
+
 		justName = item.split(".")[0]
 		dataSource.append("LinksToSankeys")
 		names.append(justName.split(" - ")[1])
@@ -91,16 +102,21 @@ def loadMostRecentFile(newestFile, weeklyUpload):
 		if newestFile in item and ("Disp" in item or "Rcvd" in item or "Fld" in item) and ("_1800" in item):
 
 			#Load the Most Recent File as a DataFrame
-			tempUpdatedDF = pd.read_csv(weeklyUpload + item)
+			tempUpdatedDF = readDropFile(weeklyUpload, item)
 
 			#Fix the Misspelled/Incorrect Column Headers/Standardize Column Headers
 			fixedRowLabel = pd.read_excel(fixedRowlabels, sheet_name = fixedRowlabels.sheet_names[i])
 			fixedRowLabelDict = pd.Series(fixedRowLabel['New Name'].values,index=fixedRowLabel['Original Name']).to_dict()
 			tempUpdatedDF = tempUpdatedDF.rename(columns=fixedRowLabelDict)
 
-			#Concatenates Address Field into One Field, and drops the old fields that we don't need. 
-			tempUpdatedDF["Def. Street Address"] = tempUpdatedDF["Def. Street Address"].fillna('').astype(str) + ", " + tempUpdatedDF["Def. Street Address2"].fillna('').astype(str) + ", " + tempUpdatedDF["Def. City"].fillna('').astype(str) + ", " + tempUpdatedDF["Def. State"].fillna('').astype(str) + ", " + tempUpdatedDF["Def. Zipcode"].fillna('').astype(str)
-			tempUpdatedDF["Offense Street Address"] = tempUpdatedDF["Offense Street Address"].fillna('').astype(str) + ", " + tempUpdatedDF["Offense Street Address 2"].fillna('').astype(str) + ", " + tempUpdatedDF["Offense City"].fillna('').astype(str) + ", " + tempUpdatedDF["Offense State"].fillna('').astype(str) + ", " + tempUpdatedDF["Off. Zipcode"].fillna('').astype(str)
+			#Normalizes the Address Fields into One Address Key (and the Offense Street, City, and Zip), and drops the old fields that we don't need.
+			defendantAddresses = normalizeAddressColumns(tempUpdatedDF, "Def. Street Address", "Def. Street Address2", "Def. City", "Def. State", "Def. Zipcode")
+			offenseAddresses = normalizeAddressColumns(tempUpdatedDF, "Offense Street Address", "Offense Street Address 2", "Offense City", "Offense State", "Off. Zipcode")
+			tempUpdatedDF["Def. Street Address"] = defendantAddresses['Address Key']
+			tempUpdatedDF["Offense Street Address"] = offenseAddresses['Address Key']
+			tempUpdatedDF["Offense Address Street"] = offenseAddresses['Street']
+			tempUpdatedDF["Offense Address City"] = offenseAddresses['City']
+			tempUpdatedDF["Offense Address Zip"] = offenseAddresses['Zip']
 			tempUpdatedDF = tempUpdatedDF.drop(columns=["Def. Street Address2", "Def. City", "Def. State", "Def. Zipcode", "Offense Street Address 2", "Offense City", "Offense State", "Off. Zipcode", "Def. SSN"])
 
 			updatedCompleteDFs.append(tempUpdatedDF)
@@ -108,69 +124,95 @@ def loadMostRecentFile(newestFile, weeklyUpload):
 
 	return updatedCompleteDFs
 
+#Columns Kept from Each Stage of the Consolidated History
+receivedColumns = ['File #', "CRN", "Agency", "Enter Dt.","Def. Name", "Def. Race", "Def. Sex", "Def. DOB", "Ref. Charge Code", "Ref. Charge Description", "Year"]
+filedColumns = ['File #', "CRN", "Agency", "Enter Dt.", "Filing Dt.", "Def. Name", "Def. Sex", "Def. Race", "Def. DOB", "Ref. Charge Code", "Ref. Charge Description", "Year"]
+disposedColumns = ["File #", "CRN", "Agency", "Disp. Dt.", "Enter Dt.",  "Ref. Charge Code", "Ref. Charge Description", "Disp. Code", "Year"]
+refusedColumns = ["File #", "CRN", "Disp. Code", "Disp. Dt.", "Agency", "Enter Dt.", 'Ref. Charge Code', 'Ref. Charge Description', "Year"]
+
+#Column Labels in Each Data Drop that need to be Standardized
+receivedLabels = {'Def  Name': 'Def. Name', 'Enter Dt ': 'Enter Dt.', 'Def  DOB': "Def. DOB", "Def  Race":"Def. Race", "Def Sex":"Def. Sex", "Ref  Charge":"Ref. Charge Code", "Ref  Charge Desctiption": "Ref. Charge Description"}
+filedLabels = {'Def  Name': 'Def. Name', 'Enter Dt ': 'Enter Dt.', 'Def  DOB': "Def. DOB", "Def  Race":"Def. Race", "Def Sex":"Def. Sex", "Ref. Charge":"Ref. Charge Code", "Ref. Charge Desctiption": "Ref. Charge Description", 'Filing Date.': 'Filing Dt.'}
+disposedLabels = {'Def  Name': 'Def. Name', 'Enter Dt ': 'Enter Dt.', 'Def  DOB': "Def. DOB", "Def  Race":"Def. Race", "Def Sex":"Def. Sex", "Charge Code":"Ref. Charge Code", "Charge Desctiption": "Ref. Charge Description", 'Filing Date.': 'Filing Dt.'}
+refusedLabels = {'Def  Name': 'Def. Name', 'Enter Dt ': 'Enter Dt.', 'Def  DOB': "Def. DOB", "Def  Race":"Def. Race", "Def Sex":"Def. Sex", "Charge Code":"Ref. Charge Code", "Ref.Charge Desctiption": "Ref. Charge Description", 'Filing Date.': 'Filing Dt.'}
+
+# Function:  getDropColumns
+# Purpose:   This function lists the columns to read from a data drop - the columns we keep, plus their original (misspelled) labels
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: columns (list of standardized columns), columnLabels (dictionary of original labels to standardized labels)
+# Return:    Returns a list of columns to read
+def getDropColumns(columns, columnLabels):
+	return columns + [originalLabel for originalLabel, newLabel in columnLabels.items() if newLabel in columns]
+
+# Function:  loadConsolidatedCases
+# Purpose:   This function loads the consolidated case history (received, filed, disposed, refused). Past years come from the year partitions,
+#            and the current year comes from the most recent data drop, which then replaces the current year's partition.
+#            Only the columns we keep are ever read, and every file is read at the same time.
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: directory (FilePath Location of Karpel Data Drop), mostRecent (string of the most recent date - 20220323), homeFolder
+# Return:    Returns a list of 4 dataframes (Received, Filed, Disposed, Refused)
 def loadConsolidatedCases(directory, mostRecent, homeFolder):
 	karpelDataFrames = []
 
-	#Old Received Cases
-	oldReceivedCases = pd.read_csv("RawDataConsolidated\\1 - Received.csv")
-	oldReceivedCases = oldReceivedCases[oldReceivedCases['Year']!=2022]
-	oldReceivedCases = oldReceivedCases[['File #', "CRN", "Agency", "Enter Dt.", "Def. Name", "Def. Sex", "Def. Race", "Def. DOB", "Ref. Charge Code", "Ref. Charge Description", "Year"]]
+	#The Current Year is the year of the most recent drop
+	currentYear = int(mostRecent[:4])
+
+	#Split the Consolidated CSVs into partitions the first time through
+	partitionConsolidatedHistory()
+
+	#Load the Old Cases, the New Cases, and the Reason Lookups all at once
+	oldReceivedCases, receivedCases, oldFiledCases, filedCases, oldDisposedCases, disposedCases, oldRefusedCases, notFiledCases, dispositionReasons, refusalReasons = loadConcurrently([
+		partial(readStageHistory, '1 - Received', [currentYear], receivedColumns),
+		partial(readDropFile, directory, "Rcvd_"+mostRecent+"_1800.CSV", getDropColumns(receivedColumns + ['Referral Date'], receivedLabels)),
+		partial(readStageHistory, '2 - Filed', [currentYear], filedColumns),
+		partial(readDropFile, directory, "Fld_" + mostRecent + "_1800.CSV", getDropColumns(filedColumns, filedLabels)),
+		partial(readStageHistory, '3 - Disposed', [currentYear], disposedColumns),
+		partial(readDropFile, directory, "Disp_"+mostRecent+"_1800.CSV", getDropColumns(disposedColumns, disposedLabels)),
+		partial(readStageHistory, '4 - Refused', [currentYear], refusedColumns),
+		partial(readDropFile, directory, "Ntfld_"+mostRecent+"_1800.csv", getDropColumns(refusedColumns, refusedLabels)),
+		partial(readHelperDataset, "Disposition Codes.csv"),
+		partial(readHelperDataset, "RefusalReasons.csv")])
 
 	#New Received Cases
-	receivedCases = pd.read_csv(directory + "Rcvd_"+mostRecent+"_1800.CSV", encoding='utf-8')
 	receivedCases['Referral Date'] = pd.to_datetime(receivedCases["Referral Date"])
-	receivedCases = receivedCases[(receivedCases['Referral Date'] > '2022-1-1')]
-	receivedCases['Year'] = 2022
+	receivedCases = receivedCases[(receivedCases['Referral Date'] > str(currentYear) + '-1-1')]
+	receivedCases['Year'] = currentYear
 
-	receivedCases = receivedCases.rename({'Def  Name': 'Def. Name', 'Enter Dt ': 'Enter Dt.', 'Def  DOB': "Def. DOB", "Def  Race":"Def. Race", "Def Sex":"Def. Sex", "Ref  Charge":"Ref. Charge Code", "Ref  Charge Desctiption": "Ref. Charge Description"}, axis=1) 
-	receivedCases = receivedCases[['File #', "CRN", "Agency", "Enter Dt.","Def. Name", "Def. Race", "Def. Sex", "Def. DOB", "Ref. Charge Code", "Ref. Charge Description", "Year"]]
+	receivedCases = receivedCases.rename(receivedLabels, axis=1) 
+	receivedCases = applyKarpelSchema(receivedCases[receivedColumns])
+	writeStagePartition('1 - Received', currentYear, receivedCases)
 	
-	oldReceivedCases = pd.concat([oldReceivedCases, receivedCases])
+	oldReceivedCases = applyKarpelSchema(pd.concat([oldReceivedCases, receivedCases]))
 	karpelDataFrames.append(oldReceivedCases)
 
-	#Old Filed Cases
-	oldFiledCases = pd.read_csv("RawDataConsolidated\\2 - Filed.csv")
-	oldFiledCases = oldFiledCases[oldFiledCases['Year']!=2022]
-	oldFiledCases = oldFiledCases[['File #', "CRN", "Agency", "Enter Dt.", "Filing Dt.", "Def. Name", "Def. Sex", "Def. Race", "Def. DOB", "Ref. Charge Code", "Ref. Charge Description"]]
-
 	#New Filed Cases
-	filedCases = pd.read_csv(directory + "Fld_" + mostRecent + "_1800.CSV", encoding='utf-8')
-	filedCases = filedCases.rename(columns={'Def  Name': 'Def. Name', 'Enter Dt ': 'Enter Dt.', 'Def  DOB': "Def. DOB", "Def  Race":"Def. Race", "Def Sex":"Def. Sex", "Ref. Charge":"Ref. Charge Code", "Ref. Charge Desctiption": "Ref. Charge Description", 'Filing Date.': 'Filing Dt.'})
-	filedCases = filedCases[['File #', "CRN", "Agency", "Enter Dt.", "Filing Dt.", "Def. Name", "Def. Sex", "Def. Race", "Def. DOB", "Ref. Charge Code", "Ref. Charge Description"]]
-	oldFiledCases = pd.concat([oldFiledCases, filedCases])
+	filedCases = filedCases.rename(columns=filedLabels)
+	filedCases['Year'] = currentYear
+	filedCases = applyKarpelSchema(filedCases[filedColumns])
+	writeStagePartition('2 - Filed', currentYear, filedCases)
+	oldFiledCases = applyKarpelSchema(pd.concat([oldFiledCases, filedCases]))
 	karpelDataFrames.append(oldFiledCases)
 
-	#Old Disposed Cases
-	oldDisposedCases = pd.read_csv("RawDataConsolidated\\3 - Disposed.csv")
-	oldDisposedCases = oldDisposedCases[oldDisposedCases['Year']!=2022]
-	oldDisposedCases = oldDisposedCases[["File #", "CRN","Agency", "Disp. Dt.", "Enter Dt.",  "Ref. Charge Code", "Ref. Charge Description", "Disp. Code", ]]
-
 	#New Disposed Cases
-	disposedCases = pd.read_csv(directory + "Disp_"+mostRecent+"_1800.CSV", encoding='utf-8')
-	disposedCases = disposedCases.rename(columns={'Def  Name': 'Def. Name', 'Enter Dt ': 'Enter Dt.', 'Def  DOB': "Def. DOB", "Def  Race":"Def. Race", "Def Sex":"Def. Sex", "Charge Code":"Ref. Charge Code", "Charge Desctiption": "Ref. Charge Description", 'Filing Date.': 'Filing Dt.'})
-	disposedCases = disposedCases[["File #", "CRN", "Agency", "Disp. Dt.", "Enter Dt.",  "Ref. Charge Code", "Ref. Charge Description", "Disp. Code", ]]
+	disposedCases = disposedCases.rename(columns=disposedLabels)
+	disposedCases['Year'] = currentYear
+	disposedCases = applyKarpelSchema(disposedCases[disposedColumns])
+	writeStagePartition('3 - Disposed', currentYear, disposedCases)
 	oldDisposedCases = pd.concat([oldDisposedCases, disposedCases])
 
-	
-	dispositionReasons = pd.read_csv("Disposition Codes.csv")
-	oldDisposedCases = oldDisposedCases.merge(dispositionReasons, on = "Disp. Code", how = 'left')
 
-	karpelDataFrames.append(oldDisposedCases)
+	oldDisposedCases = applyKarpelSchema(oldDisposedCases.merge(dispositionReasons, on = "Disp. Code", how = 'left'))
 
-	#Old Refused Cases
-	oldRefusedCases = pd.read_csv("RawDataConsolidated\\4 - Refused.csv")
-	oldRefusedCases = oldRefusedCases[oldRefusedCases['Year']!=2022]
-	disposedCases = disposedCases.rename(columns={'Def  Name': 'Def. Name', 'Enter Dt ': 'Enter Dt.', 'Def  DOB': "Def. DOB", "Def  Race":"Def. Race", "Def Sex":"Def. Sex", "Charge Code":"Ref. Charge Code", "Charge Desctiption": "Ref. Charge Description", 'Filing Date.': 'Filing Dt.'})
-	oldRefusedCases = oldRefusedCases[["File #", "CRN", "Disp. Code", "Disp. Dt.", "Agency", "Enter Dt.", 'Ref. Charge Code', 'Ref. Charge Description', ]]
+	karpelDataFrames.append(oldDisposedCases)
 
 	#New Refused Cases
-	notFiledCases = pd.read_csv(directory + "Ntfld_"+mostRecent+"_1800.csv")
-	notFiledCases = notFiledCases.rename(columns={'Def  Name': 'Def. Name', 'Enter Dt ': 'Enter Dt.', 'Def  DOB': "Def. DOB", "Def  Race":"Def. Race", "Def Sex":"Def. Sex", "Charge Code":"Ref. Charge Code", "Ref.Charge Desctiption": "Ref. Charge Description", 'Filing Date.': 'Filing Dt.'})
-	notFiledCases = notFiledCases[["File #", "CRN", "Disp. Code", "Disp. Dt.", "Agency", "Enter Dt.", 'Ref. Charge Code', 'Ref. Charge Description', ]]
+	notFiledCases = notFiledCases.rename(columns=refusedLabels)
+	notFiledCases['Year'] = currentYear
+	notFiledCases = applyKarpelSchema(notFiledCases[refusedColumns])
+	writeStagePartition('4 - Refused', currentYear, notFiledCases)
 	oldRefusedCases = pd.concat([oldRefusedCases, notFiledCases])
 
-	refusalReasons = pd.read_csv("RefusalReasons.csv", encoding = 'utf-8')
-	oldRefusedCases = oldRefusedCases.merge(refusalReasons, on = 'Disp. Code', how = 'left')
+	oldRefusedCases = applyKarpelSchema(oldRefusedCases.merge(refusalReasons, on = 'Disp. Code', how = 'left'))
 	#oldRefusedCases = oldRefusedCases[["File #", "CRN", "Reason",  "Disp. Dt.", "Agency", "Enter Dt.", "Ref. Charge Code", "Ref. Charge Description"]]
 	oldRefusedCases = oldRefusedCases.rename(columns = {'Reason':'Disp. Code'})
 
@@ -0,0 +1,87 @@
+import pandas as pd
+import numpy as np
+from DispositionCounter import getDisposalReasons, getDeclineReasons
+
+# Script:   CaseLifecycle.py
+# Purpose:  This script builds the case lifecycle table once per run. It has one row per File #, with the year it was received, its categories,
+#           where it is now (Declined, Under Review, Active, Disposed), its filing/disposal/decline dates, and its winning disposal or decline reason.
+#           Every Sankey is a groupby on this table, so new slices (agency, attorney, etc.) don't need their own pass through the case history.
+# Author:   Henry Chapman, hchapman@jacksongov.org
+# Dependencies:
+#	 External: Pandas, numpy
+#	 Functions: getDisposalReasons, getDeclineReasons
+
+# Function:  buildCaseLifecycle
+# Purpose:   This function builds the case lifecycle table from the consolidated case history. A case is filed if it's in the filed history, disposed if it's
+#            filed and in the disposed history, declined if it isn't filed and is in the refused history, and under review otherwise.
+#            Cases that aren't in the received history still get a state, but no received year or categories.
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: caseStore (CaseStore of the current run - its consolidated received, filed, disposed, and refused cases), chargesDictionary (dataframe of ChargeCodeCategories.csv)
+# Return:    Returns a dataframe indexed by File #
+def buildCaseLifecycle(caseStore, chargesDictionary):
+	receivedCases, filedCases, disposedCases, refusedCases = caseStore.consolidatedCases
+
+	#One Row per Received Case (plus any case that only shows up in a later stage, so every file number has a state)
+	caseLifecycle = receivedCases.groupby('File #').agg(**{'Received Year': ('Year', 'min'), 'Agency': ('Agency', 'first')})
+	laterFileNumbers = pd.concat([filedCases['File #'], disposedCases['File #'], refusedCases['File #']]).dropna().unique()
+	caseLifecycle = caseLifecycle.reindex(caseLifecycle.index.union(pd.Index(laterFileNumbers)))
+
+	#Every Category the Case's Charges are in
+	caseCategories = receivedCases[['File #', 'Ref. Charge Code']].merge(chargesDictionary[['Ref. Charge Code', 'Category']], on = 'Ref. Charge Code')
+	caseCategories = caseCategories.dropna(subset = ['Category']).groupby('File #')['Category'].agg(lambda categories: frozenset(categories.astype(str)))
+	caseLifecycle['Categories'] = caseCategories.reindex(caseLifecycle.index)
+	caseLifecycle['Categories'] = caseLifecycle['Categories'].apply(lambda categories: categories if isinstance(categories, frozenset) else frozenset())
+
+	#Dates - first filing, last disposal, and first decline
+	filingDates = filedCases.groupby('File #')['Filing Dt.'].min()
+	disposalDates = disposedCases.groupby('File #')['Disp. Dt.'].max()
+	declineDates = refusedCases.groupby('File #')['Disp. Dt.'].min()
+
+	#Where the Case is Now
+	isFiled = caseLifecycle.index.isin(filingDates.index)
+	isDisposed = isFiled & caseLifecycle.index.isin(disposalDates.index)
+	isDeclined = ~isFiled & caseLifecycle.index.isin(declineDates.index)
+	caseLifecycle['Filed'] = isFiled
+	caseLifecycle['State'] = np.select([isDisposed, isFiled, isDeclined], ['Disposed', 'Active', 'Declined'], default = 'Under Review')
+
+	caseLifecycle['Filing Dt.'] = filingDates.reindex(caseLifecycle.index)
+	caseLifecycle['Disp. Dt.'] = disposalDates.reindex(caseLifecycle.index).where(isDisposed)
+	caseLifecycle['Decline Dt.'] = declineDates.reindex(caseLifecycle.index).where(isDeclined)
+
+	#Winning Disposal and Decline Reasons
+	caseLifecycle['Disposal Reason'] = getDisposalReasons(disposedCases).reindex(caseLifecycle.index).where(isDisposed)
+	caseLifecycle['Decline Reason'] = getDeclineReasons(refusedCases).reindex(caseLifecycle.index).where(isDeclined)
+
+	return caseLifecycle
+
+# Function:  getLifecycleSlice
+# Purpose:   This function pulls the lifecycle rows for a list of received file numbers. File numbers that aren't in the table are under review.
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: caseLifecycle (dataframe from buildCaseLifecycle), receivedFileNumbers (list of file numbers)
+# Return:    Returns a dataframe with one row per file number
+def getLifecycleSlice(caseLifecycle, receivedFileNumbers):
+	lifecycleSlice = caseLifecycle.reindex(list(set(receivedFileNumbers)))
+	lifecycleSlice['State'] = lifecycleSlice['State'].fillna('Under Review')
+	return lifecycleSlice
+
+# Function:  caseHistorySlices
+# Purpose:   This function merges the charge categories into the received history once, then hands out the received file numbers of each
+#            (year, category) one at a time, followed by "All" for that year. Categories without any cases that year are skipped.
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: receivedCases (dataframe of the consolidated received cases), chargesDictionary (dataframe of ChargeCodeCategories.csv), crimeCategoryList (list of categories)
+# Return:    Yields (year, category, list of received file numbers)
+def caseHistorySlices(receivedCases, chargesDictionary, crimeCategoryList):
+
+	#Merge In Case Charges Once
+	categoryCases = receivedCases[['File #', 'Year', 'Ref. Charge Code']].merge(chargesDictionary[['Ref. Charge Code', 'Category']], on = 'Ref. Charge Code')
+
+	#Group the File Numbers by Year and Category, and by Year for "All"
+	categoryFileNumbers = categoryCases.groupby(['Year', 'Category'], observed = True)['File #'].unique().to_dict()
+	yearFileNumbers = categoryCases.groupby('Year')['File #'].unique().to_dict()
+
+	for year in list(set(receivedCases['Year'].tolist())):
+		for tempCaseCategory in crimeCategoryList:
+			if (year, tempCaseCategory) in categoryFileNumbers:
+				yield year, tempCaseCategory, list(categoryFileNumbers[(year, tempCaseCategory)])
+
+		yield year, "All", list(yearFileNumbers.get(year, []))
@@ -0,0 +1,61 @@
+from KarpelStarter import karpelStarter
+from CaseHistoryCollector import caseHistoryCollector
+from HelperMethods import getCaseYear, loadConcurrently, preloadHelperDatasets
+from functools import partial
+
+# Script:   CaseStore.py
+# Purpose:  This script builds the CaseStore, which holds every dataset the dashboard needs for one run in memory.
+#           It's built once per run, and the analysis, case history, and map stages all take it as their input.
+# Author:   Henry Chapman, hchapman@jacksongov.org
+# Dependencies:
+#	 External: functools
+#	 Functions: karpelStarter, caseHistoryCollector, getCaseYear, loadConcurrently, preloadHelperDatasets
+
+# Class:     CaseStore
+# Purpose:   Holds the current year's received, not-filed, filed, and disposed dataframes, the consolidated case history, and the filed file numbers
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: xls (list of received, not-filed, filed, and disposed dataframes), consolidatedCases (list of consolidated received, filed, disposed, and refused dataframes),
+#            filedCRNs (list of every filed file number), disposedCases (dataframe of disposed file numbers), notFiledCases (dataframe of not-filed file numbers),
+#            changedChargeCodes (set of charge codes that changed since the last analyzed drop, or None), analyzedDrop (record of today's drop for recordAnalyzedDrop)
+class CaseStore:
+	def __init__(self, xls, consolidatedCases, filedCRNs, disposedCases, notFiledCases, changedChargeCodes, analyzedDrop):
+
+		#Current Year Cases (in the same order as xls everywhere else)
+		self.xls = xls
+		self.received = xls[0]
+		self.notFiled = xls[1]
+		self.filed = xls[2]
+		self.disposed = xls[3]
+
+		#Consolidated Case History (received, filed, disposed, refused)
+		self.consolidatedCases = consolidatedCases
+
+		#Every File Number that has ever been filed
+		self.filedCRNs = set(filedCRNs)
+
+		#File Numbers of Disposed and Not Filed Cases
+		self.disposedCases = disposedCases
+		self.notFiledCases = notFiledCases
+
+		#Charge Codes that changed since the last analyzed drop (None means everything has to be recomputed)
+		self.changedChargeCodes = changedChargeCodes
+
+		#Record of Today's Drop - it's saved once the analysis finishes, so the next run compares against it
+		self.analyzedDrop = analyzedDrop
+
+		#Year of the Current Cases
+		self.year = getCaseYear(xls)
+
+# Function:  buildCaseStore
+# Purpose:   This function loads everything for the run exactly once - the most recent Karpel cases and the consolidated case history
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: homeFolder (FilePath of the Dashboards folder)
+# Return:    Returns a CaseStore
+def buildCaseStore(homeFolder):
+
+	#Load the Helper Datasets (charge categories, agencies, reasons) while the cases load
+	#Collect, Clean, and Save the Most Recent Karpel Cases, and Collect the Consolidated Case History, at the same time
+	karpelCases, consolidatedCases, _ = loadConcurrently([karpelStarter, partial(caseHistoryCollector, homeFolder), preloadHelperDatasets])
+	xls, filedCRNs, disposedCases, notFiledCases, changedChargeCodes, analyzedDrop = karpelCases
+
+	return CaseStore(xls, consolidatedCases, filedCRNs, disposedCases, notFiledCases, changedChargeCodes, analyzedDrop)
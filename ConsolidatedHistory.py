@@ -0,0 +1,108 @@
+import pandas as pd
+import pyarrow.parquet as pq
+import shutil
+import os
+from DropSnapshots import prepareForSnapshot, getSnapshotColumns
+from KarpelSchema import applyKarpelSchema, readKarpelCSV
+
+# Script:   ConsolidatedHistory.py
+# Purpose:  This script stores the consolidated case history (received, filed, disposed, and refused) partitioned by stage and year.
+#           Each run only reads the partitions it needs, and only replaces the current year's partition, instead of rewriting the whole history.
+# Author:   Henry Chapman, hchapman@jacksongov.org
+# Dependencies:
+#	 External: Pandas, pyarrow, shutil, os
+#	 Functions: prepareForSnapshot, getSnapshotColumns, applyKarpelSchema, readKarpelCSV
+
+#Folder of the Consolidated History, and the Partitions inside it (Partitions\<Stage>\Year=<Year>.parquet)
+historyFolder = "RawDataConsolidated\\"
+partitionFolder = historyFolder + "Partitions\\"
+
+#Stages are partitioned in here first, then moved into partitionFolder once every year is written
+partialFolder = historyFolder + "PartitionsInProgress\\"
+
+#Stages of the Consolidated History (also the names of the original consolidated CSVs)
+historyStages = ['1 - Received', '2 - Filed', '3 - Disposed', '4 - Refused']
+
+# Function:  getPartitionPath
+# Purpose:   This function gets the file path of one stage/year partition
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: stage (string from historyStages), year (int of year, or "Unknown"), folder (FilePath of the partitions - partitionFolder unless it's still being partitioned)
+# Return:    Returns a string of the file path
+def getPartitionPath(stage, year, folder = partitionFolder):
+	return folder + stage + "\\Year=" + str(year) + ".parquet"
+
+# Function:  getPartitionYears
+# Purpose:   This function lists the years that have a partition for a stage
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: stage (string from historyStages)
+# Return:    Returns a list of years (ints, or "Unknown" for rows without a year)
+def getPartitionYears(stage):
+	partitionYears = []
+	for item in os.listdir(partitionFolder + stage):
+		partitionYear = item.split("=")[1].split(".")[0]
+		if partitionYear.isdigit():
+			partitionYear = int(partitionYear)
+		partitionYears.append(partitionYear)
+	return partitionYears
+
+# Function:  writeStagePartition
+# Purpose:   This function writes (or replaces) one stage/year partition
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: stage (string from historyStages), year (int of year), caseType (dataframe of that stage and year), folder (FilePath of the partitions)
+# Return:    None
+def writeStagePartition(stage, year, caseType, folder = partitionFolder):
+	if not os.path.exists(folder + stage):
+		os.makedirs(folder + stage)
+	prepareForSnapshot(caseType.copy()).to_parquet(getPartitionPath(stage, year, folder), index = False)
+
+# Function:  partitionConsolidatedHistory
+# Purpose:   This function splits the original consolidated CSVs into stage/year partitions. It only runs for a stage that hasn't been partitioned yet.
+#            Each stage is written to partialFolder and only moved into partitionFolder once every year is written, so a crash partway through starts that stage over.
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: None
+# Return:    None
+def partitionConsolidatedHistory():
+	for stage in historyStages:
+
+		#Skip stages that have already been partitioned
+		if os.path.exists(partitionFolder + stage):
+			continue
+
+		print("Partitioning " + stage)
+		consolidatedCases = readKarpelCSV(historyFolder + stage + ".csv")
+
+		#Clear out anything left over from a run that crashed while partitioning
+		if os.path.exists(partialFolder + stage):
+			shutil.rmtree(partialFolder + stage)
+		os.makedirs(partialFolder + stage)
+
+		#Write one partition per year - rows without a year go in their own partition
+		for year, yearCases in consolidatedCases.groupby(consolidatedCases['Year'].astype(object).fillna("Unknown")):
+			writeStagePartition(stage, year, yearCases, partialFolder)
+
+		#Every year is written, so move the stage into place
+		os.makedirs(partitionFolder, exist_ok = True)
+		os.replace(partialFolder + stage, partitionFolder + stage)
+
+# Function:  readStageHistory
+# Purpose:   This function reads the partitions of a stage, skipping the years that aren't needed. Only the wanted columns are read off disk.
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: stage (string from historyStages), excludeYears (list of years to skip - usually the current year, which gets replaced from the drop),
+#            columns (list of columns to read, or None for every column)
+# Return:    Returns a dataframe of that stage's history
+def readStageHistory(stage, excludeYears, columns = None):
+	partitions = []
+	for year in getPartitionYears(stage):
+		if year not in excludeYears:
+			partitionPath = getPartitionPath(stage, year)
+			partitions.append(pd.read_parquet(partitionPath, columns = getSnapshotColumns(partitionPath, columns)))
+
+	#If every partition was skipped (e.g. the only one is the current year), return an empty dataframe with the same columns
+	if len(partitions) == 0:
+		if columns is None:
+			columns = []
+			for year in getPartitionYears(stage):
+				columns = pq.read_schema(getPartitionPath(stage, year)).names
+		return applyKarpelSchema(pd.DataFrame(columns = columns))
+
+	return applyKarpelSchema(pd.concat(partitions, ignore_index = True))
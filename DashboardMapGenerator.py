@@ -1,296 +1,222 @@
-from HelperMethods import readDataForList, getCaseType
-from locationiq.geocoder import LocationIQ
+from HelperMethods import getCaseType, readHelperDataset
+from GeocodingClient import GeocodingClient, LocationIQBackend, GeocoderHTTPError
+from GeocodeCache import GeocodeCache, GeocodeJournal
+from LocalGeocoder import loadLocalGeocoder
+from HexGrid import HexGrid
+from GeoJSONWriter import GeoJSONWriter, readGeoJSONFeatures
 import pandas as pd 
-import time
-from datetime import datetime, timedelta
-import geopandas as gpd
-from shapely.geometry import Point, Polygon
-from pyproj import CRS, Proj, transform
-import numpy as np
 import os
 
 # Script:   DashboardMapGenerator.py
-# Purpose:  This script handles the map portion of the dashboard. It looks for cases that aren't geocoded, assigned as latitute/longitude coordinates, then caches the results.
-#			Next, it uses uniform hexes in Jackson County, and counts points by uniform hex. It does this by case categories
+# Purpose:  This script handles the map portion of the dashboard. It looks for addresses that aren't geocoded, assigned as latitute/longitude coordinates, then caches the results.
+#			Next, it uses uniform hexes in Jackson County, and counts points by uniform hex. It does this by case categories, then streams the counts into the master spatial layer
 # Author:   Henry Chapman, hchapman@jacksongov.org
 # Dependencies:
-#	 External: Pandas, GeoPandas, LocationIQ, datetime, shapley, pyproj, numpy, os
-#	 Functions: readDataForList, getCaseType
+#	 External: Pandas, os
+#	 Functions: getCaseType, readHelperDataset, GeocodingClient, LocationIQBackend, GeocoderHTTPError, GeocodeCache, GeocodeJournal, loadLocalGeocoder, HexGrid, GeoJSONWriter, readGeoJSONFeatures
 
 
-# Function:  findNonGeocodedCases
-# Purpose:   This function finds the addresses that haven't been geocoded yet
+# Function:  getCaseAddresses
+# Purpose:   This function gets every case's address key (normalized when the drop was loaded), skipping blank addresses
 # Author:    Henry Chapman, hchapman@jacksongov.org
-# Arguments: addressDictionary (dataFrame of addresses associated with file numbers), xls (list of dataframes of caseTypes - received, filed, disposed, not-filed)
-# Return:    Returns a dataframe of cases with no geocoding
-def findNonGeocodedCases(addressDictionary, xls):
-	
-	#Gets a list of all the file numbers that have been geocoded
-	geocodedAddressList = addressDictionary['File #'].tolist()
-
-	#Initialize lists and blank dataframe
-	nonGeocodedAddressFileNumbers = []
-	nonGeocodedAddresses = []
-	nonGeocodedAddressDataFrame = pd.DataFrame()
-
-	#Loop Through Each CaseType
-	for caseType in xls:
-		#Drop Duplicate File Numbers
-		caseType = caseType.drop_duplicates(subset=['File #'])
-		
-		#Filter Out the dataframes that have already been geocoded
-		caseType = caseType[~caseType['File #'].isin(geocodedAddressList)]
-
-		#Add the addresses and file numbers to our non-geocoded addresses
-		nonGeocodedAddressFileNumbers.extend(caseType['File #'].tolist())
-		nonGeocodedAddresses.extend(caseType['Offense Street Address'].tolist())
-
-	#If there aren't any, return the empty dataframe
-	if len(nonGeocodedAddresses)==0:
-		return nonGeocodedAddressDataFrame
+# Arguments: xls (list of dataframes of caseTypes - received, filed, disposed, not-filed)
+# Return:    Returns a dataframe of File # and Street Address (one row per file number)
+def getCaseAddresses(xls):
+	caseAddresses = pd.concat([caseType[['File #', 'Offense Street Address']] for caseType in xls]).drop_duplicates(subset=['File #'])
+	return caseAddresses.rename(columns={'Offense Street Address': 'Street Address'}).dropna(subset=['Street Address'])
 
-	#Add the addresses and file numbers the non-Geocoded dataframe
-	nonGeocodedAddressDataFrame['File #'] = nonGeocodedAddressFileNumbers
-	nonGeocodedAddressDataFrame['Street Address'] = nonGeocodedAddresses
+# Function:  findNonGeocodedCases
+# Purpose:   This function records every case's address key in the geocode cache, then finds the addresses that haven't been geocoded yet
+#            (or that failed and are due for a retry). Addresses are looked up once each, no matter how many files share them.
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: geocodeCache (GeocodeCache), caseAddresses (dataframe from getCaseAddresses)
+# Return:    Returns a list of addresses that need to be geocoded
+def findNonGeocodedCases(geocodeCache, caseAddresses):
 
-	#Cleaning Up Addresses - Replacing Blank Addresses
-	nonGeocodedAddressDataFrame['Street Address'] = nonGeocodedAddressDataFrame['Street Address'].astype(str).str.replace(', , , , ', ',')
-	nonGeocodedAddressDataFrame['Street Address'] = nonGeocodedAddressDataFrame['Street Address'].str.replace(', , , ', ',')
-	nonGeocodedAddressDataFrame['Street Address'] = nonGeocodedAddressDataFrame['Street Address'].str.replace(', , ', ',')
-	nonGeocodedAddressDataFrame['Street Address'] = nonGeocodedAddressDataFrame['Street Address'].str.replace('.0', '', regex=True)
-	
-	#Dropping NA/Duplicate Addresses and resetting index
-	nonGeocodedAddressDataFrame = nonGeocodedAddressDataFrame.drop_duplicates(subset=['File #'])
-	nonGeocodedAddressDataFrame = nonGeocodedAddressDataFrame.dropna(subset=['Street Address'])
-	nonGeocodedAddressDataFrame = nonGeocodedAddressDataFrame.reset_index()
+	#Record Each File's Address
+	geocodeCache.setFileAddresses(dict(zip(caseAddresses['File #'].tolist(), caseAddresses['Street Address'].tolist())))
 
-	return nonGeocodedAddressDataFrame
+	return geocodeCache.findUncachedAddresses(caseAddresses['Street Address'].tolist())
 
 # Function:  geocodeCases
-# Purpose:   This function geocodes the addresses that have been identified as "non-geocoded"
+# Purpose:   This function geocodes the addresses that have been identified as "non-geocoded". The local geocoder (if there is one) goes first,
+#            and the addresses it can't find go through the GeocodingClient (several at a time, at our plan's rate).
+#            Results - including the addresses the geocoder couldn't find - are appended to the geocode journal one batch at a time, then compacted into the cache at the end.
+#            Addresses whose requests failed (outages, quota, dropped connections) aren't journaled, so they aren't cached and get retried next run.
+#            If LocationIQ rejects the key (401/403), geocoding stops there, and the map is built from the addresses that are already cached.
 # Author:    Henry Chapman, hchapman@jacksongov.org
-# Arguments: addressDictionary (dataFrame of addresses associated with file numbers), nonGeocodedAddressDataFrame (dataframe of addresses that haven't been geocoded yet)
-# Return:    Returns a dataframe of cases with no geocoding
+# Arguments: geocodeCache (GeocodeCache), geocodeJournal (GeocodeJournal), nonGeocodedAddresses (list of addresses that haven't been geocoded yet),
+#            geocodingClient (optional GeocodingClient - defaults to LocationIQ with the key in key.txt), batchSize (addresses per journal batch),
+#            localGeocoder (optional LocalGeocoderBackend)
+# Return:    Returns False if there wasn't anything to geocode
 
-def geocodeCases(addressDictionary, nonGeocodedAddressDataFrame):
+def geocodeCases(geocodeCache, geocodeJournal, nonGeocodedAddresses, geocodingClient = None, batchSize = 100, localGeocoder = None):
 
 	#If there aren't any addresses to geocode, return false
-	if len(nonGeocodedAddressDataFrame.index)==0:
+	if len(nonGeocodedAddresses)==0:
 		return False
 
-	#Initialize Lists
-	allLatitude = []
-	allLongitude = []
-	allFileNumbers = []
-	allStreetAddresses = []
-
-	text_file = open("key.txt", "r")
-	key = text_file.read()
-	
-	#Loop Through Each non-geocoded address
-	for i, row in nonGeocodedAddressDataFrame.iterrows():
-		
-		#Initialize Coordinates and completed geocoding dataframe
-		completedGeocoding = pd.DataFrame()
-		tempCoordinates = []
-		#Load geocoder with API Key
-		geocoder = LocationIQ(key)
-
-		#Try This - if errors, put the point at null island
-		try:
-			h = geocoder.geocode(row["Street Address"])
-			latitude = [h[0]['lat']]
-			longitude = [h[0]['lon']]
-
-		except:
-			latitude = [0]
-			longitude = [0]
+	#Geocode What We Can Locally, and Only Send the Rest to the Remote Geocoder
+	if localGeocoder is not None:
+		localResults = localGeocoder.geocodeAll(nonGeocodedAddresses)
+		geocodeJournal.append(localResults)
+		print("Geocoded " + str(len(localResults)) + " out of " + str(len(nonGeocodedAddresses)) + " Addresses Locally")
+		nonGeocodedAddresses = [address for address in nonGeocodedAddresses if address not in localResults]
 
-		#Extend the Completed Lists
-		allFileNumbers.extend([row['File #']])
-		allStreetAddresses.extend([row["Street Address"]])
-		allLatitude.extend(latitude)
-		allLongitude.extend(longitude)
-
-		#Sleep to give the geocoder a break
-		time.sleep(1)
-
-		#Update the geocoding dataframe
-		completedGeocoding['File #'] = allFileNumbers
-		completedGeocoding['Street Address'] = allStreetAddresses
-		completedGeocoding['Latitude'] = allLatitude
-		completedGeocoding['Longitude'] = allLongitude
+	#If the local geocoder found all of them, we're done
+	if len(nonGeocodedAddresses)==0:
+		geocodeJournal.compact(geocodeCache)
+		return
 
-		#Print out the update
-		print(str(i+1) + " out of " + str(len(nonGeocodedAddressDataFrame.index) + 1) + " " + str(row['File #']) + " " + row['Street Address'] + " " + str(longitude) +" " +str(latitude))
+	#Load geocoder with API Key
+	if geocodingClient is None:
+		text_file = open("key.txt", "r")
+		key = text_file.read().strip()
+		text_file.close()
+		geocodingClient = GeocodingClient(LocationIQBackend(key))
 
-	#Sets the coordinates as floats
-	completedGeocoding['Latitude'] = completedGeocoding['Latitude'].astype(float)
-	completedGeocoding['Longitude'] = completedGeocoding['Longitude'].astype(float)
+	#Geocode Each Batch of Addresses, then Journal the Results
+	failedAddresses = []
+	for batchStart in range(0, len(nonGeocodedAddresses), batchSize):
 
-	#Appends to the updated address dictionary, and resets the index
-	addressDictionary = pd.concat([addressDictionary, completedGeocoding])
-	addressDictionary.reset_index()
+		#Print out the update as each address finishes
+		def printProgress(completed, total, address, coordinates):
+			print(str(batchStart + completed) + " out of " + str(len(nonGeocodedAddresses)) + " " + str(address) + " " + str(coordinates))
 
-	#Exports it as a CSV when it's finisehd
-	addressDictionary.to_csv("HelperDatasets\\AddressDictionary.csv", index = False, encoding = 'utf-8')
+		#A Rejected Key Fails Every Address the Same Way - Stop Geocoding, but Keep Building the Map from the Cache
+		try:
+			batchResults, batchFailures = geocodingClient.geocodeAll(nonGeocodedAddresses[batchStart:batchStart + batchSize], printProgress)
+		except GeocoderHTTPError as error:
+			print("Geocoding Stopped - " + str(error) + " - Check the Key in key.txt. " + str(len(nonGeocodedAddresses) - batchStart) + " Addresses will be Retried Next Run")
+			break
+		geocodeJournal.append(batchResults)
+		failedAddresses.extend(batchFailures)
 
-# Function:  pointsInPolygons
-# Purpose:   This function takes a dataframe of charged cases, then counts the number of points per hex
-# Author:    Henry Chapman, hchapman@jacksongov.org
-# Arguments: year (integer of year), tempCaseCategory (string of case category), tempCaseStage (string of case stage), tempCaseCategoryDataFrame (filtered dataframe of case categories)
-# Return:    Returns a dataframe of cases with no geocoding
-def pointsInPolygons(year, tempCaseCategory, tempCaseStage, tempCaseCategoryDataFrame):
-
-	#Set CRS
-	crs = 'epsg:4326'
-
-	#Load Jackson County Hexes (Pre-Determined)
-	JacksonCountyHexes = gpd.GeoDataFrame.from_file("Maps\\JacksonCountyHexes.geojson").to_crs(crs)
-	
-	#Drops Duplicates to Get Individual Cases
-	tempCaseCategoryDataFrame = tempCaseCategoryDataFrame.drop_duplicates(subset=['File #'])
-	
-	#Set Index as ObjectID
-	JacksonCountyHexes['objectid'] = JacksonCountyHexes.index
-	
-	#Set Geometry as latitutde and longitude points
-	geometry = [Point(xy) for xy in zip(tempCaseCategoryDataFrame['Longitude'], tempCaseCategoryDataFrame['Latitude'])]
-	
-	#Create a DataFrame with those geocoded points
-	points = gpd.GeoDataFrame(tempCaseCategoryDataFrame, crs=crs, geometry=geometry)
-
-	#Creates a border, then filters the points within Jackson County's Border
-	JacksonCountyBorder = JacksonCountyHexes.geometry.unary_union
-	points = points[points.geometry.within(JacksonCountyBorder)]
-
-	#If the points dataframe is empty, return false
-	if len(points.index)==0:
-		return False
+	if len(failedAddresses) != 0:
+		print(str(len(failedAddresses)) + " Addresses Failed to Geocode - They'll be Retried Next Run")
 
-	#Creates a New Column with C
-	points['Case'] = "Cases"
-
-	#Does a spatial join to join Points with Polygons
-	dfsjoin = gpd.sjoin(JacksonCountyHexes, points) #Spatial join Points to polygons
-	
-	#Makes a pivot table 
-	dfpivot = pd.pivot_table(dfsjoin,index='objectid', columns='Case',aggfunc={'Case':len})
-	
-	#Drops Level on those columns
-	dfpivot.columns = dfpivot.columns.droplevel()
-	
-	#Merges those into a new dataframe
-	dfpolynew = JacksonCountyHexes.merge(dfpivot, how='left',on='objectid')
-
-	
-	#Drop the Hexes that don't have any points
-	dfpolynew = dfpolynew[dfpolynew['Cases']>0]
-
-	#Adding Columns for Later Concatenation
-	dfpolynew['Year'] = str(year)
-	dfpolynew['Cases'] = dfpolynew['Cases'].astype(str)
-
-	if tempCaseCategory == "All":
-		dfpolynew['Case Category'] = "*All"
-	else:
-		dfpolynew['Case Category'] = tempCaseCategory
-	
-	dfpolynew['Case Stage'] = tempCaseStage
-
-	#Export json based on year and case stage
-	dfpolynew.to_file("Maps\\TempDataForMap\\"+tempCaseStage+"-"+str(year) + "-" + tempCaseCategory+".json", driver = "GeoJSON")
+	#Compact the Journal into the Cache
+	geocodeJournal.compact(geocodeCache)
 
 # Function:  countPointsinHexes
-# Purpose:   This function loops through each case category, and generates cases per hex
+# Purpose:   This function counts cases per hex for every stage and case category (and "All") in one pass. Every case already has its hex from the geocode cache,
+#            so the charges and addresses are merged in once, and the counts come from one groupby instead of a spatial join per category.
 # Author:    Henry Chapman, hchapman@jacksongov.org
-# Arguments: addressDictionary, chargesDictionary, xls, year
-# Return:    None
-def countPointsinHexes(addressDictionary, chargesDictionary, xls, year):
-	#Get a list of charge code categories
-	listOfChargeCategories = list(set(chargesDictionary['Category'].tolist()))
-
-	#Initialize Case Label
-	caseLabel = 0
-
-	#For Each case Type
-	for caseType in xls:
-
-		#Merge in Charges Dictionary and Addresses for Points
-		caseType = pd.merge(caseType, chargesDictionary, on ='Ref. Charge Code', how ='left')
-		caseType = pd.merge(caseType, addressDictionary, on ='File #', how ='left')
+# Arguments: addressDictionary (dataframe of File #, Latitude, Longitude, and Hex), chargesDictionary, xls
+# Return:    Returns a dataframe of Case Stage, Category, objectid, and Cases (only hexes with cases)
+def countPointsinHexes(addressDictionary, chargesDictionary, xls):
 
-		#Get the label for the temp case Stage
-		tempCaseStage = getCaseType(caseLabel)
+	#Stack Every Case Type with its Stage
+	stageCases = pd.concat([caseType[['File #', 'Ref. Charge Code']].assign(**{'Case Stage': getCaseType(caseLabel)}) for caseLabel, caseType in enumerate(xls)], ignore_index = True)
 
-		#Loop Through Each List of Charge Code Categories
-		for tempCaseCategory in listOfChargeCategories:
+	#Merge in Charges Dictionary and Hexes Once
+	stageCases = pd.merge(stageCases, chargesDictionary[['Ref. Charge Code', 'Category']], on ='Ref. Charge Code', how ='left')
+	stageCases = pd.merge(stageCases, addressDictionary[['File #', 'Hex']], on ='File #', how ='left')
 
-			#Filter Down by that category
-			tempCaseCategoryDataFrame = caseType[caseType['Category']==tempCaseCategory]
-			
-			#If the dataframe isn't empty, call points in polygons to count up the points per hexes
-			if len(tempCaseCategoryDataFrame.index)!=0:
-				pointsInPolygons(year, tempCaseCategory, tempCaseStage, tempCaseCategoryDataFrame)
+	#Only the Cases in a Jackson County Hex
+	stageCases = stageCases[stageCases['Hex'] >= 0].copy()
+	stageCases['objectid'] = stageCases['Hex'].astype(int)
 
-		#Run Points in polygons for a non-filtered dataframe to get a broader picture
-		pointsInPolygons(year, "All", tempCaseStage, caseType)
+	#Count Each Case Once per Stage, Category, and Hex - and once per Stage and Hex for "All"
+	categoryCases = stageCases.dropna(subset=['Category']).drop_duplicates(subset=['Case Stage', 'Category', 'File #'])
+	categoryCounts = categoryCases.groupby(['Case Stage', 'Category', 'objectid'], observed = True).size().reset_index(name = 'Cases')
+	allCounts = stageCases.drop_duplicates(subset=['Case Stage', 'File #']).groupby(['Case Stage', 'objectid']).size().reset_index(name = 'Cases')
+	allCounts['Category'] = "All"
 
-		#Increment Case Label By 1
-		caseLabel = caseLabel + 1
+	return pd.concat([categoryCounts.astype({'Category': str}), allCounts], ignore_index = True)
 
 
-# Function:  concatenateGeoDataFrame
-# Purpose:   This Function Concatenates the Gigantic DataFrame of all the various points
+# Function:  buildHexPyramid
+# Purpose:   This function builds the case counts at every hex resolution. Each coarser resolution is summed from the one before it (every hex is in exactly one coarser hex),
+#            so there's no spatial join per resolution.
 # Author:    Henry Chapman, hchapman@jacksongov.org
-# Arguments: 
-# Return:    
-def concatenateGeoDataFrame():
-	#Initialize It
-	hugeDataFrame = gpd.GeoDataFrame()
-
-	#Get The Base Directory for All The Data
-	baseDirectory = "Maps\\TempDataForMap\\"
-
-	#Get a a list of all the items in the base directory
-	file = os.listdir(baseDirectory)
-	#Get A List to Generate Paths
-	path = [os.path.join(baseDirectory, i) for i in file if ".json" in i]
+# Arguments: hexCounts (dataframe from countPointsinHexes), hexGrid (HexGrid loaded once for the run)
+# Return:    Returns a dataframe of Resolution, Case Stage, Category, objectid (hex id at that resolution), and Cases
+def buildHexPyramid(hexCounts, hexGrid):
+	resolutionCounts = [hexCounts.assign(Resolution = 0)]
+
+	for resolution in hexGrid.getResolutions()[1:]:
+		finerCounts = resolutionCounts[-1]
+		coarserCounts = finerCounts.assign(objectid = finerCounts['objectid'].map(hexGrid.getParentHexes(resolution)))
+		coarserCounts = coarserCounts.groupby(['Case Stage', 'Category', 'objectid'])['Cases'].sum().reset_index()
+		resolutionCounts.append(coarserCounts.assign(Resolution = resolution))
+
+	return pd.concat(resolutionCounts, ignore_index = True)
+
+# Function:  writeMasterSpatialData
+# Purpose:   This function streams the hex counts straight into the master spatial layer the dashboard publishes, one feature per resolution, hex, stage, and category.
+#            Each feature has its Resolution, so the dashboard can filter by zoom. Earlier years' features are carried over from the last master layer, and this year's are replaced.
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: hexCounts (dataframe from buildHexPyramid), year (integer of year), hexGrid (HexGrid loaded once for the run), path (FilePath of the master layer)
+# Return:    None
+def writeMasterSpatialData(hexCounts, year, hexGrid, path = "Maps\\MasterSpatialDataFixedV2.geojson"):
 
-	#Concatenate the GeoDataFrame
-	hugeDataFrame = gpd.GeoDataFrame(pd.concat([gpd.read_file(i) for i in path], ignore_index=True), crs=gpd.read_file(path[0]).crs)
+	#Features From Earlier Years
+	earlierFeatures = [feature for feature in readGeoJSONFeatures(path) if feature['properties'].get('Year') != str(year)]
 
-	#Drop The Columns that we don't need
-	hugeDataFrame = hugeDataFrame.drop(columns=['objectid', 'left', 'bottom', 'right', 'top'])
+	hexFeatures = {resolution: hexGrid.getHexFeatures(resolution) for resolution in hexGrid.getResolutions()}
+	with GeoJSONWriter(path, "MasterSpatialDataFixedV2") as masterSpatialData:
 
-	#Convert the dataframe to the correct CRS
-	hugeDataFrame = hugeDataFrame.to_crs(gpd.read_file(path[0]).crs)
+		#Features written before there were resolutions are the base hexes
+		for feature in earlierFeatures:
+			feature['properties'].setdefault('Resolution', 0)
+			masterSpatialData.writeFeature(feature['properties'], feature['geometry'])
 
-	#Export, import, export to make sure all the file headers are correct
-	hugeDataFrame.to_file("Maps\\MasterSpatialDataV2.GeoJSON", driver= "GeoJSON", index = False)
-	hugeDataFrame = gpd.GeoDataFrame.from_file("Maps\\MasterSpatialDataV2.geojson").to_crs(gpd.read_file(path[0]).crs)
-	hugeDataFrame.to_file("Maps\\MasterSpatialDataFixedV2.geojson", driver= "GeoJSON", index=False)
+		#This Year's Features (Cases are published as text of a float - "3.0")
+		for resolution, tempCaseStage, tempCaseCategory, objectid, cases in zip(hexCounts['Resolution'].tolist(), hexCounts['Case Stage'].tolist(), hexCounts['Category'].tolist(), hexCounts['objectid'].tolist(), hexCounts['Cases'].tolist()):
+			hexProperties, hexGeometry = hexFeatures[resolution][objectid]
+			properties = dict(hexProperties)
+			properties['Cases'] = str(float(cases))
+			properties['Year'] = str(year)
+			properties['Case Category'] = "*All" if tempCaseCategory == "All" else tempCaseCategory
+			properties['Case Stage'] = tempCaseStage
+			properties['Resolution'] = resolution
+			masterSpatialData.writeFeature(properties, hexGeometry)
 
 
 # Function:  geocoderRunner
 # Purpose:   This handles all the geocoding for the Karpel Dashboard
 # Author:    Henry Chapman, hchapman@jacksongov.org
-# Arguments: xls (list of dataframes of various case types), year (int of year)
+# Arguments: caseStore (CaseStore of the current run)
 # Return:    
-def geocoderRunner(xls, year):
+def geocoderRunner(caseStore):
+
+	#Get the Current Cases and Year from the CaseStore
+	xls = caseStore.xls
+	year = caseStore.year
+
+	#Get Every Case's Address Key
+	caseAddresses = getCaseAddresses(xls)
 
-	#Load Charges and Address Dictionary
-	chargesDictionary = pd.read_csv("HelperDatasets\\ChargeCodeCategories.csv", encoding = 'utf-8')
-	addressDictionary = pd.read_csv("HelperDatasets\\AddressDictionary.csv", encoding = 'utf-8')
+	#Load Charges and the Geocode Cache (seeding a new cache from the old Address Dictionary, matched by File #)
+	chargesDictionary = readHelperDataset("HelperDatasets\\ChargeCodeCategories.csv")
+	geocodeCache = GeocodeCache()
+	if geocodeCache.newCache and os.path.exists("HelperDatasets\\AddressDictionary.csv"):
+		geocodeCache.importAddressDictionary(pd.read_csv("HelperDatasets\\AddressDictionary.csv", encoding = 'utf-8'), caseAddresses)
+
+	#Resume - compact any batches a previous run journaled but didn't finish
+	geocodeJournal = GeocodeJournal()
+	resumedAddresses = geocodeJournal.compact(geocodeCache)
+	if resumedAddresses != 0:
+		print("Resumed " + str(resumedAddresses) + " Geocoded Addresses From The Journal")
 
 	#Get Non-Geocoded Addresses
-	nonGeocodedAddressDataFrame = findNonGeocodedCases(addressDictionary, xls)
+	nonGeocodedAddresses = findNonGeocodedCases(geocodeCache, caseAddresses)
+	print("Geocode Cache - " + str(geocodeCache.getStats()))
+
+	#Geocode Non-Geocoded Cases (locally first, if we have the county address points)
+	geocodeCases(geocodeCache, geocodeJournal, nonGeocodedAddresses, localGeocoder = loadLocalGeocoder())
 
-	#Geocode Non-Geocoded Cases
-	geocodeCases(addressDictionary,nonGeocodedAddressDataFrame)
+	#Assign Hexes to the Newly Geocoded Addresses (once each), then Export the Address Dictionary
+	hexGrid = HexGrid()
+	geocodeCache.assignHexes(hexGrid)
+	addressDictionary = geocodeCache.getAddressDictionary()
+	addressDictionary.to_csv("HelperDatasets\\AddressDictionary.csv", index = False, encoding = 'utf-8')
+	geocodeCache.close()
 
-	#Count Up the Points in Each Hex
-	countPointsinHexes(addressDictionary, chargesDictionary, xls, year)
+	#Count Up the Cases in Each Hex, then Aggregate them into the Coarser Hexes
+	hexCounts = countPointsinHexes(addressDictionary, chargesDictionary, xls)
+	hexCounts = buildHexPyramid(hexCounts, hexGrid)
 
-	#Concatenate All The Various DataFrames, then Export it
-	concatenateGeoDataFrame()
\ No newline at end of file
+	#Write the Counts Straight into the Master Spatial Layer
+	writeMasterSpatialData(hexCounts, year, hexGrid)
\ No newline at end of file
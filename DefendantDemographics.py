@@ -5,7 +5,7 @@ import datetime
 import numpy as np
 import os
 from datetime import datetime, timedelta
-from HelperMethods import getCaseType
+from HelperMethods import getCaseType, countByItem
 
 # Script: DefendantDemographics.py
 # Purpose:  This script takes in a dataframe of received, filed and disposed charges. It returns csv files for demographics of the defendants 
@@ -38,7 +38,7 @@ def defendantRace(xls, tempCaseCategory, year):
 		caseLabel = getCaseType(caseInput)
 
 		#Get get a series of counts for each type of case
-		race[caseLabel] = caseType.groupby(['Def. Race']).size()
+		race[caseLabel] = countByItem(caseType, 'Def. Race')
 
 		#increment counter for caseType by one
 		caseInput = caseInput + 1
@@ -79,7 +79,7 @@ def defendantSex(xls, tempCaseCategory, year):
 		caseLabel = getCaseType(caseInput)
 
 		#Add a new column for the case type (Received, Filed, Disposed, etc.)
-		gender[caseLabel] = caseType.groupby(['Def. Sex']).size()
+		gender[caseLabel] = countByItem(caseType, 'Def. Sex')
 
 		#increment caseType by 1
 		caseInput = caseInput + 1
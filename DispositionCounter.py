@@ -3,88 +3,78 @@ import numpy as np
 import plotly.graph_objects as go
 
 
-def disposedCaseCounter(fnList, disposedCaseDF):
+#Priority Rules - each case gets the first reason (from the top) that any of its charges has as an Activity. Cases without any of them are "Other".
+#Here's the prioritization of disposed cases
+disposalRules = [
+    ('Trial', ['Trial']),
+    ('Guilty Plea', ['Guilty Plea']),
+    ('Drug Court', ['Drug Court']),
+    ('Entire Dismissal', ['Entire Dismissal']),
+    ('No Prosecution', ['No Prosecution']),
+]
 
-    #Here we're trying to get one disposition reason per disposed case
-    #Here's the prioritization of disposed cases
-        #1. Trial
-        #2. Guilty Plea
-        #3. No Prosecution
+#Here's the prioritization of declined cases
+declineRules = [
+    ('Pending Further Investigation', ['Pending Further Investigation']),
+    ('Lack of Evidence', ['Lack of Evidence', 'Evidence Issues']),
+    ('Other Jurisdiction', ['Other Jurisdiction']),
+    ('Diversion', ['Diversion']),
+]
 
-    fnList = list(set(fnList))
-    dispositionReasons = []
 
-    for tempFN in fnList:
+def rankCaseReasons(caseDF, rules):
+
+    #Give each Activity the rank of the first rule it's in
+    activityRanks = {}
+    for rank, (reason, activities) in enumerate(rules):
+        for activity in activities:
+            activityRanks.setdefault(activity, rank)
+
+    #The winning reason is the best rank of any of the case's charges
+    chargeRanks = caseDF['Activity'].astype(object).map(activityRanks)
+    caseRanks = chargeRanks.groupby(caseDF['File #']).min().fillna(len(rules)).astype(int)
+
+    reasons = np.array([reason for reason, activities in rules] + ["Other"])
+    return pd.Series(reasons[caseRanks.values], index = caseRanks.index)
+
+
+def getDisposalReasons(disposedCaseDF):
+    return rankCaseReasons(disposedCaseDF, disposalRules)
+
+
+def getDeclineReasons(declinedCaseDF):
+    return rankCaseReasons(declinedCaseDF, declineRules)
+
 
-        justThatCase = disposedCaseDF[disposedCaseDF['File #'] == tempFN]
+def countCaseReasons(fnList, caseReasons, source, targetPrefix):
 
-        if "Trial" in justThatCase["Activity"].tolist():
-            dispositionReasons.append("Trial")
-        elif "Guilty Plea" in justThatCase['Activity'].tolist():
-            dispositionReasons.append("Guilty Plea")
-        elif "Drug Court" in justThatCase['Activity'].tolist():
-            dispositionReasons.append("Drug Court")
-        elif "Entire Dismissal" in justThatCase['Activity'].tolist():
-            dispositionReasons.append("Entire Dismissal")
-        elif "No Prosecution" in justThatCase['Activity'].tolist():
-            dispositionReasons.append("No Prosecution")
-        else:
-            dispositionReasons.append("Other")
+    fnList = list(set(fnList))
 
     dispositionReasonDF = pd.DataFrame()
     dispositionReasonDF['File #'] = fnList
-    dispositionReasonDF['Disp. Reason'] = dispositionReasons
+    dispositionReasonDF['Disp. Reason'] = caseReasons.reindex(fnList).fillna("Other").values
     dispositionReasonDF = dispositionReasonDF.groupby('Disp. Reason').size().to_frame().reset_index()
-    dispositionReasonDF['source'] = 'C - Cases Disposed'
+    dispositionReasonDF['source'] = source
     dispositionReasonDF = dispositionReasonDF.rename(columns={0: 'value'})
 
-    dispositionReasonDF['target'] = "D - " + dispositionReasonDF['Disp. Reason'].astype(str)
+    dispositionReasonDF['target'] = targetPrefix + dispositionReasonDF['Disp. Reason'].astype(str)
     dispositionReasonDF = dispositionReasonDF[['source', 'target', 'value']]
     return dispositionReasonDF
 
 
-def declinedCaseCounter(fnList, declinedCaseDF):
-
-    #print(declinedCaseDF.columns)
+def disposedCaseCounter(fnList, disposedCaseDF, disposalReasons = None):
 
-    #Here we're trying to get one disposition reason per declined case
-    #Here's the prioritization of declined cases
-        #1. Pending Further Investigation
-        #2. Other Case Pending
-        #3. Evidence Issues
-        #Self Defense
-        #Suspect Deceased
+    #Here we're trying to get one disposition reason per disposed case (the reasons can be ranked once with getDisposalReasons and passed in)
+    if disposalReasons is None:
+        disposalReasons = getDisposalReasons(disposedCaseDF)
 
-        #4. Lack of Evidence
-        #5. Other Case
-        #Last. Other
-        #2. Guilty Plea
-        #3. No Prosecution
+    return countCaseReasons(fnList, disposalReasons, 'C - Cases Disposed', "D - ")
 
-    fnList = list(set(fnList))
-    declineReasons = []
 
-    for tempFN in fnList:
+def declinedCaseCounter(fnList, declinedCaseDF, declineReasons = None):
 
-        justThatCase = declinedCaseDF[declinedCaseDF['File #'] == tempFN]
+    #Here we're trying to get one disposition reason per declined case (the reasons can be ranked once with getDeclineReasons and passed in)
+    if declineReasons is None:
+        declineReasons = getDeclineReasons(declinedCaseDF)
 
-        if "Pending Further Investigation" in justThatCase["Activity"].tolist():
-            declineReasons.append("Pending Further Investigation")
-        elif ("Lack of Evidence" in justThatCase['Activity'].tolist()) or ("Evidence Issues" in justThatCase['Activity'].tolist()):
-            declineReasons.append("Lack of Evidence")
-        elif "Other Jurisdiction" in justThatCase['Activity'].tolist():
-            declineReasons.append("Other Jurisdiction")
-        elif "Diversion" in justThatCase['Activity'].tolist():
-            declineReasons.append("Diversion")
-        else:
-            declineReasons.append("Other")
-
-    dispositionReasonDF = pd.DataFrame()
-    dispositionReasonDF['File #'] = fnList
-    dispositionReasonDF['Disp. Reason'] = declineReasons
-    dispositionReasonDF = dispositionReasonDF.groupby('Disp. Reason').size().to_frame().reset_index()
-    dispositionReasonDF['source'] = 'B - Declined'
-    dispositionReasonDF = dispositionReasonDF.rename(columns={0: 'value'})
-    dispositionReasonDF['target'] = "C - " + dispositionReasonDF['Disp. Reason'].astype(str)
-    dispositionReasonDF = dispositionReasonDF[['source', 'target', 'value']]
-    return dispositionReasonDF
\ No newline at end of file
+    return countCaseReasons(fnList, declineReasons, 'B - Declined', "C - ")
@@ -0,0 +1,194 @@
+import pandas as pd
+import hashlib
+import os
+from DropSnapshots import snapshotFolder, prepareForSnapshot, hashDropFile
+from HelperMethods import getCaseType
+
+# Script:   DropDeltas.py
+# Purpose:  This script compares today's Karpel data drop to the last drop that was actually analyzed. Each run saves a fingerprint of every charge in each stage
+#           (received, not-filed, filed, disposed), matched on File # and charge code, and the delta is found by comparing fingerprints, so the old drop never has to be loaded again.
+#           The analyzed drop is only recorded after the analysis succeeds, so a run that crashes (or is skipped) gets its changes picked up by the next one.
+# Author:   Henry Chapman, hchapman@jacksongov.org
+# Dependencies:
+#	 External: Pandas, hashlib, os
+#	 Functions: snapshotFolder, prepareForSnapshot, hashDropFile, getCaseType
+
+#Columns that identify a charge within a stage
+deltaKeys = ['File #', 'Ref. Charge Code']
+
+#Record of the Last Analyzed Drop (its date, its fingerprints, and the hash of the helper datasets it was analyzed with)
+analyzedDropPath = snapshotFolder + "AnalyzedDrop.csv"
+analyzedDropColumns = ['Drop Date', 'Fingerprints', 'Input Hash']
+
+#Helper Datasets that change the analysis without changing the drop - if any of them change, everything is recomputed
+#(ChargeCodeCategories moves charges between categories, and FiledFileNumbers moves cases in and out of not-filed)
+deltaInputPaths = ["HelperDatasets\\ChargeCodeCategories.csv", "HelperDatasets\\FiledFileNumbers.csv"]
+
+# Function:  hashDeltaInputs
+# Purpose:   This function hashes the helper datasets in deltaInputPaths, so we can tell if they've changed since the last analyzed drop
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: None
+# Return:    Returns a string of the md5 hash
+def hashDeltaInputs():
+	inputHash = hashlib.md5()
+	for path in deltaInputPaths:
+		inputHash.update(hashDropFile(path).encode('utf-8'))
+	return inputHash.hexdigest()
+
+# Function:  loadAnalyzedDrop
+# Purpose:   This function loads the record of the last analyzed drop
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: None
+# Return:    Returns the record (Drop Date, Fingerprints, Input Hash), or None if no drop has been analyzed yet
+def loadAnalyzedDrop():
+	if not os.path.exists(analyzedDropPath):
+		return None
+
+	analyzedDrop = pd.read_csv(analyzedDropPath, dtype = str, encoding = 'utf-8')
+	if len(analyzedDrop.index) == 0:
+		return None
+
+	return analyzedDrop.iloc[-1]
+
+# Function:  recordAnalyzedDrop
+# Purpose:   This function records the drop that was just analyzed. The runner calls it only after the analysis finishes, so the next run compares against it.
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: analyzedDrop (list of the drop date, fingerprint file name, and input hash - from findChangedChargeCodes)
+# Return:    None
+def recordAnalyzedDrop(analyzedDrop):
+	tempPath = analyzedDropPath + ".tmp"
+	pd.DataFrame([analyzedDrop], columns = analyzedDropColumns).to_csv(tempPath, index = False, encoding = 'utf-8')
+	os.replace(tempPath, analyzedDropPath)
+
+# Function:  chargeFingerprints
+# Purpose:   This function hashes every row of a stage, then combines the hashes for each charge (File # and charge code) into one fingerprint
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: caseType (dataframe of one stage)
+# Return:    Returns a dataframe with one fingerprint per charge
+def chargeFingerprints(caseType):
+
+	#Hash each row
+	rowHashes = caseType[deltaKeys].copy()
+	rowHashes['Fingerprint'] = pd.util.hash_pandas_object(caseType, index = False).values
+
+	#Sum the Hashes per Charge (so duplicate rows and row order don't matter)
+	return rowHashes.groupby(deltaKeys, dropna = False, observed = True)['Fingerprint'].sum().reset_index()
+
+# Function:  saveDropFingerprints
+# Purpose:   This function fingerprints every stage of today's drop and saves them in the snapshot folder. The file is named by the drop date and a hash of
+#            the fingerprints, so a drop that's re-delivered with different contents doesn't overwrite the fingerprints of the one that was analyzed.
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: updatedCompleteDFs (list of dataframes from today's drop), newestFile (string of today's date)
+# Return:    Returns a dataframe of the fingerprints (with a "Stage" column), and the file name they were saved under
+def saveDropFingerprints(updatedCompleteDFs, newestFile):
+	stageFingerprints = []
+
+	caseInput = 0
+	for caseType in updatedCompleteDFs:
+		fingerprints = chargeFingerprints(caseType)
+		fingerprints['Stage'] = getCaseType(caseInput)
+		stageFingerprints.append(fingerprints)
+		caseInput = caseInput + 1
+
+	fingerprints = prepareForSnapshot(pd.concat(stageFingerprints, ignore_index = True))
+	fingerprintHash = hashlib.md5(pd.util.hash_pandas_object(fingerprints, index = False).values.tobytes()).hexdigest()
+
+	fingerprintName = newestFile + " - " + fingerprintHash[:12] + " - Fingerprints.parquet"
+	if not os.path.exists(snapshotFolder + fingerprintName):
+		fingerprints.to_parquet(snapshotFolder + fingerprintName, index = False)
+
+	return fingerprints, fingerprintName
+
+# Function:  computeStageDelta
+# Purpose:   This function finds the inserted, changed, and removed charges of one stage
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: previousFingerprints (fingerprints of the stage in the analyzed drop), fingerprints (fingerprints of the stage in today's drop)
+# Return:    Returns a dataframe of the charges that changed, with a "Change" column (Inserted, Changed, Removed)
+def computeStageDelta(previousFingerprints, fingerprints):
+
+	#Match up the fingerprints of each charge
+	fingerprints = previousFingerprints.merge(fingerprints, on = deltaKeys, how = 'outer', suffixes = (' Previous', ''), indicator = True)
+
+	inserted = fingerprints[fingerprints['_merge'] == 'right_only'][deltaKeys].copy()
+	inserted['Change'] = "Inserted"
+	removed = fingerprints[fingerprints['_merge'] == 'left_only'][deltaKeys].copy()
+	removed['Change'] = "Removed"
+	changed = fingerprints[(fingerprints['_merge'] == 'both') & (fingerprints['Fingerprint'] != fingerprints['Fingerprint Previous'])][deltaKeys].copy()
+	changed['Change'] = "Changed"
+
+	return pd.concat([inserted, changed, removed], ignore_index = True)
+
+# Function:  computeDropDelta
+# Purpose:   This function compares every stage of today's drop to the analyzed drop, then saves the delta in the snapshot folder
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: previousFingerprints (fingerprints of the analyzed drop), fingerprints (fingerprints of today's drop), newestFile (string of today's date)
+# Return:    Returns a dataframe of every changed charge, with "Change" and "Stage" columns
+def computeDropDelta(previousFingerprints, fingerprints, newestFile):
+	stageDeltas = []
+
+	#Loop through each stage (received, not-filed, filed, disposed)
+	for stage in fingerprints['Stage'].unique().tolist():
+		stageDelta = computeStageDelta(previousFingerprints[previousFingerprints['Stage'] == stage][deltaKeys + ['Fingerprint']], fingerprints[fingerprints['Stage'] == stage][deltaKeys + ['Fingerprint']])
+		stageDelta['Stage'] = stage
+		print(stage + " - " + str(stageDelta['Change'].value_counts().to_dict()))
+		stageDeltas.append(stageDelta)
+
+	dropDelta = pd.concat(stageDeltas, ignore_index = True)
+
+	#Save the Delta next to the Snapshots
+	prepareForSnapshot(dropDelta.copy()).to_parquet(snapshotFolder + newestFile + " - Delta.parquet", index = False)
+
+	return dropDelta
+
+# Function:  getChangedChargeCodes
+# Purpose:   This function finds every charge code that belongs to a case with a change. A case that changed in one stage can move in or out of
+#            another (e.g. a newly filed case drops out of Not-Filed), so this looks at all of that case's charges in both drops.
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: dropDelta (dataframe from computeDropDelta), previousFingerprints (fingerprints of the analyzed drop), fingerprints (fingerprints of today's drop)
+# Return:    Returns a set of charge codes
+def getChangedChargeCodes(dropDelta, previousFingerprints, fingerprints):
+
+	#Get the File Numbers that changed
+	changedFileNumbers = set(dropDelta['File #'].tolist())
+
+	#Collect the charge codes of those cases
+	changedChargeCodes = set()
+	for stageFingerprints in [previousFingerprints, fingerprints]:
+		changedChargeCodes.update(stageFingerprints[stageFingerprints['File #'].isin(changedFileNumbers)]['Ref. Charge Code'].tolist())
+
+	return changedChargeCodes
+
+# Function:  findChangedChargeCodes
+# Purpose:   This function fingerprints today's drop and compares it to the last analyzed drop. Everything is recomputed if no drop has been analyzed yet,
+#            if its fingerprints are gone, if the stages don't line up, or if the helper datasets in deltaInputPaths changed since then.
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: updatedCompleteDFs (list of dataframes from today's drop), newestFile (string of today's date)
+# Return:    Returns the set of charge codes that changed (None if everything has to be recomputed), and the record to pass to recordAnalyzedDrop once the analysis is done
+def findChangedChargeCodes(updatedCompleteDFs, newestFile):
+	fingerprints, fingerprintName = saveDropFingerprints(updatedCompleteDFs, newestFile)
+	inputHash = hashDeltaInputs()
+	analyzedDrop = [newestFile, fingerprintName, inputHash]
+
+	#Check if there's an analyzed drop we can compare to
+	previousDrop = loadAnalyzedDrop()
+	if previousDrop is None:
+		print("No Analyzed Drop - Recomputing Everything")
+		return None, analyzedDrop
+
+	if previousDrop['Input Hash'] != inputHash:
+		print("Helper Datasets Changed - Recomputing Everything")
+		return None, analyzedDrop
+
+	previousPath = snapshotFolder + previousDrop['Fingerprints']
+	if not os.path.exists(previousPath):
+		print("Analyzed Drop's Fingerprints are Missing - Recomputing Everything")
+		return None, analyzedDrop
+
+	previousFingerprints = pd.read_parquet(previousPath)
+	if set(previousFingerprints['Stage'].unique().tolist()) != set(fingerprints['Stage'].unique().tolist()):
+		return None, analyzedDrop
+
+	#Compare it to the Analyzed Drop
+	print("Comparing to Analyzed Drop " + previousDrop['Drop Date'])
+	dropDelta = computeDropDelta(previousFingerprints, fingerprints, newestFile)
+	return getChangedChargeCodes(dropDelta, previousFingerprints, fingerprints), analyzedDrop
@@ -0,0 +1,165 @@
+import pandas as pd
+import pyarrow.parquet as pq
+import hashlib
+import threading
+import os
+
+# Script:   DropSnapshots.py
+# Purpose:  This script converts each daily Karpel data drop (Rcvd_/Ntfld_/Fld_/Disp_<date>_1800.CSV) into a typed, columnar snapshot (Parquet) the first time it sees it.
+#           Snapshots are keyed by drop date and file hash, and every loader reads the snapshot afterward instead of re-parsing the CSV off the H Drive.
+# Author:   Henry Chapman, hchapman@jacksongov.org
+# Dependencies:
+#	 External: Pandas, pyarrow, hashlib, threading, os
+#	 Functions: None
+
+#Local Folder Where Snapshots (and the manifest that tracks them) Live
+snapshotFolder = "Snapshots\\"
+manifestPath = snapshotFolder + "SnapshotManifest.csv"
+manifestColumns = ['File Name', 'Drop Date', 'Size', 'Modified', 'Hash', 'Snapshot']
+
+#Drops can be loaded on several threads at once, so only one of them touches the manifest at a time
+manifestLock = threading.Lock()
+
+#One Lock per Drop File, so when several threads ask for the same new drop, it's only converted once and the others wait for its snapshot
+dropLocks = {}
+
+# Function:  hashDropFile
+# Purpose:   This function hashes a data drop file in chunks so we can tell if a file has changed
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: path (FilePath of the data drop file)
+# Return:    Returns a string of the md5 hash
+def hashDropFile(path):
+
+	#Initialize Hash
+	fileHash = hashlib.md5()
+
+	#Read the file 1 MB at a time
+	with open(path, "rb") as dropFile:
+		for chunk in iter(lambda: dropFile.read(1024 * 1024), b""):
+			fileHash.update(chunk)
+
+	return fileHash.hexdigest()
+
+# Function:  loadSnapshotManifest
+# Purpose:   This function loads the manifest of every data drop that has already been converted into a snapshot
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: None
+# Return:    Returns a dataframe of the manifest (empty if there isn't one yet)
+def loadSnapshotManifest():
+
+	#If there isn't a manifest yet, return a blank one
+	if not os.path.exists(manifestPath):
+		return pd.DataFrame(columns = manifestColumns)
+
+	return pd.read_csv(manifestPath, dtype = {'Drop Date': str, 'Modified': str, 'Hash': str}, encoding = 'utf-8')
+
+# Function:  updateSnapshotManifest
+# Purpose:   This function adds (or replaces) a drop file's entry in the manifest.
+#            The modified time is stored as whole nanoseconds, so it reads back exactly and can be compared with ==
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: item (file name of the data drop), fileStats (os.stat of the file), fileHash (md5 of the file), snapshotName (file name of the snapshot)
+# Return:    None
+def updateSnapshotManifest(item, fileStats, fileHash, snapshotName):
+	with manifestLock:
+		manifest = loadSnapshotManifest()
+		newEntry = pd.DataFrame([[item.lower(), item.split("_")[1], fileStats.st_size, str(fileStats.st_mtime_ns), fileHash, snapshotName]], columns = manifestColumns)
+		manifest = manifest[manifest['File Name'] != item.lower()]
+		manifest = pd.concat([manifest, newEntry])
+		manifest.to_csv(manifestPath, index = False, encoding = 'utf-8')
+
+# Function:  prepareForSnapshot
+# Purpose:   Parquet needs one type per column. Karpel text columns sometimes mix numbers and strings, so this stores those values as strings.
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: dropDF (dataframe of a data drop)
+# Return:    Returns a dataframe that can be written to Parquet
+def prepareForSnapshot(dropDF):
+	for column in dropDF.columns:
+		if dropDF[column].dtype == object:
+			dropDF[column] = dropDF[column].where(dropDF[column].isna(), dropDF[column].astype(str))
+	return dropDF
+
+# Function:  getSnapshotColumns
+# Purpose:   This function narrows a list of wanted columns down to the ones that are actually in a Parquet file, so only those get read
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: path (FilePath of the Parquet file), columns (list of wanted columns, or None for every column)
+# Return:    Returns a list of columns (or None for every column)
+def getSnapshotColumns(path, columns):
+	if columns is None:
+		return None
+
+	availableColumns = pq.read_schema(path).names
+	return [column for column in columns if column in availableColumns]
+
+# Function:  convertDropToSnapshot
+# Purpose:   This function parses a data drop CSV once, then saves it as a Parquet snapshot and records it in the manifest
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: weeklyUpload (FilePath Location of Karpel Data Drop), item (file name of the data drop), fileHash (md5 of the file),
+#            columns (list of columns to return, or None for every column)
+# Return:    Returns the dataframe of the data drop
+def convertDropToSnapshot(weeklyUpload, item, fileHash, columns = None):
+
+	#Parse the whole CSV at once so every column gets one consistent type
+	dropDF = pd.read_csv(weeklyUpload + item, encoding = 'utf-8', low_memory = False)
+	dropDF = prepareForSnapshot(dropDF)
+
+	#Save the Snapshot - named by the drop file and its hash. It's written to a temp file first in case another thread is converting the same drop.
+	snapshotName = item.split(".")[0] + " - " + fileHash[:12] + ".parquet"
+	tempSnapshotPath = snapshotFolder + snapshotName + "." + str(threading.get_ident()) + ".tmp"
+	dropDF.to_parquet(tempSnapshotPath, index = False)
+	os.replace(tempSnapshotPath, snapshotFolder + snapshotName)
+
+	#Record the Snapshot in the manifest
+	updateSnapshotManifest(item, os.stat(weeklyUpload + item), fileHash, snapshotName)
+
+	#The Snapshot keeps every column, but only return the ones that were asked for
+	if columns is not None:
+		dropDF = dropDF[[column for column in columns if column in dropDF.columns]]
+
+	return dropDF
+
+# Function:  readDropFile
+# Purpose:   This function is what every loader calls to read a data drop. If the file hasn't changed since it was last seen, it reads the local snapshot.
+#            Otherwise, it converts the CSV into a new snapshot first. Threads reading the same drop file wait for each other, so it's only converted once.
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: weeklyUpload (FilePath Location of Karpel Data Drop), item (file name of the data drop - Rcvd_20220323_1800.CSV),
+#            columns (list of columns to read - columns that aren't in the drop are skipped. None reads every column)
+# Return:    Returns a dataframe of the data drop
+def readDropFile(weeklyUpload, item, columns = None):
+
+	#Make sure the snapshot folder exists, and get this drop file's lock
+	with manifestLock:
+		if not os.path.exists(snapshotFolder):
+			os.makedirs(snapshotFolder)
+		dropLock = dropLocks.setdefault(item.lower(), threading.Lock())
+
+	#Only one thread checks (or converts) a drop file at a time - the others wait, then find its snapshot in the manifest
+	with dropLock:
+		with manifestLock:
+			manifest = loadSnapshotManifest()
+
+		fileStats = os.stat(weeklyUpload + item)
+
+		#Look for a snapshot of this drop file
+		knownDrop = manifest[manifest['File Name'] == item.lower()]
+
+		#If the size and modified time (in nanoseconds) match, the file hasn't changed, so we don't even need to hash it
+		if len(knownDrop.index) != 0:
+			knownDrop = knownDrop.iloc[-1]
+			sameFile = (knownDrop['Size'] == fileStats.st_size) and (knownDrop['Modified'] == str(fileStats.st_mtime_ns))
+
+			#Otherwise, hash it to see if the contents actually changed
+			if not sameFile:
+				fileHash = hashDropFile(weeklyUpload + item)
+				sameFile = knownDrop['Hash'] == fileHash
+				if not sameFile:
+					return convertDropToSnapshot(weeklyUpload, item, fileHash, columns)
+
+				#Same contents, new timestamp - update the manifest so we don't hash it again next time
+				updateSnapshotManifest(item, fileStats, fileHash, knownDrop['Snapshot'])
+
+			snapshotPath = snapshotFolder + knownDrop['Snapshot']
+			if os.path.exists(snapshotPath):
+				return pd.read_parquet(snapshotPath, columns = getSnapshotColumns(snapshotPath, columns))
+
+		#If we've never seen this file (or the snapshot is missing), convert it
+		return convertDropToSnapshot(weeklyUpload, item, hashDropFile(weeklyUpload + item), columns)
@@ -0,0 +1,71 @@
+import numpy as np
+import json
+import os
+
+# Script:   GeoJSONWriter.py
+# Purpose:  This script writes a GeoJSON FeatureCollection one feature at a time, straight into the final file. It's written to a temp file first,
+#           then swapped into place when it's finished, so the published layer is never half-written.
+# Author:   Henry Chapman, hchapman@jacksongov.org
+# Dependencies:
+#	 External: numpy, json, os
+#	 Functions: None
+
+# Function:  toJSONValue
+# Purpose:   This function converts the numpy values pandas hands back (int64, float64, etc.) into values json can write
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: value (numpy value)
+# Return:    Returns the plain python value
+def toJSONValue(value):
+	if isinstance(value, np.generic):
+		return value.item()
+	raise TypeError("Can't write " + str(type(value)) + " to GeoJSON")
+
+# Function:  readGeoJSONFeatures
+# Purpose:   This function reads the features of a GeoJSON file (an empty list if there isn't one)
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: path (FilePath of the GeoJSON)
+# Return:    Returns a list of feature dictionaries
+def readGeoJSONFeatures(path):
+	if not os.path.exists(path):
+		return []
+
+	with open(path, "r", encoding = 'utf-8') as geoJSONFile:
+		return json.load(geoJSONFile).get('features', [])
+
+# Class:     GeoJSONWriter
+# Purpose:   Streams features into a GeoJSON FeatureCollection (one feature per line). Use it in a with block - the file is only put in place if the block finishes.
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: path (FilePath of the GeoJSON), name (name of the layer)
+class GeoJSONWriter:
+	def __init__(self, path, name):
+		self.path = path
+		self.name = name
+		self.tempPath = path + ".tmp"
+		self.features = 0
+
+	def __enter__(self):
+		self.geoJSONFile = open(self.tempPath, "w", encoding = 'utf-8')
+		self.geoJSONFile.write('{\n"type": "FeatureCollection",\n"name": ' + json.dumps(self.name) + ',\n')
+		self.geoJSONFile.write('"crs": { "type": "name", "properties": { "name": "urn:ogc:def:crs:OGC:1.3:CRS84" } },\n"features": [\n')
+		return self
+
+	#Writes one feature (properties dictionary, and geometry as a GeoJSON dictionary or as a pre-encoded JSON string)
+	def writeFeature(self, properties, geometry):
+		if not isinstance(geometry, str):
+			geometry = json.dumps(geometry, default = toJSONValue)
+
+		if self.features != 0:
+			self.geoJSONFile.write(",\n")
+		self.geoJSONFile.write('{ "type": "Feature", "properties": ' + json.dumps(properties, default = toJSONValue) + ', "geometry": ' + geometry + ' }')
+		self.features = self.features + 1
+
+	def __exit__(self, exceptionType, exceptionValue, traceback):
+		if exceptionType is not None:
+			self.geoJSONFile.close()
+			os.remove(self.tempPath)
+			return False
+
+		self.geoJSONFile.write("\n]\n}\n")
+		self.geoJSONFile.close()
+		os.replace(self.tempPath, self.path)
+		return False
@@ -0,0 +1,175 @@
+import pandas as pd
+import sqlite3
+import json
+import time
+import os
+
+# Script:   GeocodeCache.py
+# Purpose:  This script keeps every geocoding result in a local SQLite database, keyed by the normalized street address instead of the file number.
+#           An address shared by many files (apartment complexes, the jail, police HQ) is only geocoded once, and addresses the geocoder couldn't find
+#           are remembered too, so they're retried on a schedule instead of every run (or never). A separate table maps each file number to its address.
+#           While geocoding, results are appended to a journal after every batch, so a crash only loses the batch in progress.
+#           Each geocoded address also caches the hex it's in, so a point is only assigned to a hex once.
+# Author:   Henry Chapman, hchapman@jacksongov.org
+# Dependencies:
+#	 External: Pandas, sqlite3, json, time, os
+#	 Functions: None
+
+#Location of the Cache, and of the Journal of results that haven't been compacted into it yet
+geocodeCachePath = "HelperDatasets\\GeocodeCache.sqlite"
+geocodeJournalPath = "HelperDatasets\\GeocodeJournal.jsonl"
+
+#Addresses the geocoder couldn't find are retried after negativeTTLDays. Every miss after that doubles the wait, up to maxNegativeTTLDays.
+#(Requests that failed - outages, quota, bad keys - are never cached, so they're retried the next run.)
+negativeTTLDays = 7
+maxNegativeTTLDays = 180
+
+# Class:     GeocodeCache
+# Purpose:   The SQLite cache of geocoded addresses, and of which address each file number has. It also counts cache hits and misses for the run.
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: path (FilePath of the SQLite database)
+class GeocodeCache:
+	def __init__(self, path = geocodeCachePath):
+		self.path = path
+		newCache = not os.path.exists(path)
+		self.connection = sqlite3.connect(path)
+		self.connection.execute("CREATE TABLE IF NOT EXISTS geocodes (address TEXT PRIMARY KEY, latitude REAL, longitude REAL, found INTEGER, attempts INTEGER, updated REAL)")
+		self.connection.execute("CREATE TABLE IF NOT EXISTS fileAddresses (fileNumber PRIMARY KEY, address TEXT)")
+		self.connection.execute("CREATE TABLE IF NOT EXISTS hexGrid (gridHash TEXT)")
+
+		#Each geocoded address also caches its hex (caches made before hexes were cached get the column added)
+		if 'hexId' not in [column[1] for column in self.connection.execute("PRAGMA table_info(geocodes)")]:
+			self.connection.execute("ALTER TABLE geocodes ADD COLUMN hexId INTEGER")
+		self.connection.commit()
+		self.newCache = newCache
+		self.hits = 0
+		self.negativeHits = 0
+		self.misses = 0
+
+	def close(self):
+		self.connection.close()
+
+	#Seeds a new cache from the old file number keyed AddressDictionary.csv. Its street addresses were built the old way and can't be turned into today's address keys,
+	#so its coordinates are matched to the current cases by File # (caseAddresses - dataframe of File # and Street Address) and stored under each file's address key.
+	#Old (0, 0) results are stored as failures that are due for a retry.
+	def importAddressDictionary(self, addressDictionary, caseAddresses):
+		addressDictionary = addressDictionary[['File #', 'Latitude', 'Longitude']].dropna(subset = ['File #']).copy()
+		addressDictionary['File #'] = addressDictionary['File #'].astype(str)
+		caseAddresses = caseAddresses[['File #', 'Street Address']].copy()
+		caseAddresses['File #'] = caseAddresses['File #'].astype(str)
+		addressDictionary = addressDictionary.drop_duplicates(subset = ['File #']).merge(caseAddresses.rename(columns = {'Street Address': 'Address Key'}), on = 'File #')
+
+		found = addressDictionary['Latitude'].notna() & addressDictionary['Longitude'].notna() & ((addressDictionary['Latitude'] != 0) | (addressDictionary['Longitude'] != 0))
+		foundAddresses = addressDictionary[found].drop_duplicates(subset = ['Address Key'])
+		failedAddresses = addressDictionary[~found & ~addressDictionary['Address Key'].isin(foundAddresses['Address Key'])].drop_duplicates(subset = ['Address Key'])
+
+		self.connection.executemany("INSERT OR REPLACE INTO geocodes (address, latitude, longitude, found, attempts, updated) VALUES (?, ?, ?, 1, 1, ?)",
+			[(address, latitude, longitude, time.time()) for address, latitude, longitude in zip(foundAddresses['Address Key'].tolist(), foundAddresses['Latitude'].tolist(), foundAddresses['Longitude'].tolist())])
+		self.connection.executemany("INSERT OR IGNORE INTO geocodes (address, latitude, longitude, found, attempts, updated) VALUES (?, NULL, NULL, 0, 1, 0)", [(address,) for address in failedAddresses['Address Key'].tolist()])
+		self.connection.commit()
+
+	#Records which address each file number has (dictionary of file number to normalized address)
+	def setFileAddresses(self, fileAddresses):
+		self.connection.executemany("INSERT OR REPLACE INTO fileAddresses VALUES (?, ?)", list(fileAddresses.items()))
+		self.connection.commit()
+
+	#Returns the addresses that need to be geocoded - ones that aren't in the cache, and failures whose TTL has run out. Counts hits and misses as it goes.
+	def findUncachedAddresses(self, addresses):
+		cachedAddresses = {}
+		for address, found, attempts, updated in self.connection.execute("SELECT address, found, attempts, updated FROM geocodes"):
+			cachedAddresses[address] = (found, attempts, updated)
+
+		uncachedAddresses = []
+		for address in dict.fromkeys(addresses):
+			if address not in cachedAddresses:
+				self.misses = self.misses + 1
+				uncachedAddresses.append(address)
+				continue
+
+			found, attempts, updated = cachedAddresses[address]
+			if found:
+				self.hits = self.hits + 1
+			elif time.time() - updated > min(negativeTTLDays * (2 ** (attempts - 1)), maxNegativeTTLDays) * 86400:
+				self.misses = self.misses + 1
+				uncachedAddresses.append(address)
+			else:
+				self.negativeHits = self.negativeHits + 1
+
+		return uncachedAddresses
+
+	#Stores geocoding results (dictionary of address to (latitude, longitude), or None if the geocoder couldn't find it). Only pass real answers -
+	#an address whose request failed shouldn't be stored, or it would wait out the negative TTL before it's tried again.
+	def storeResults(self, results):
+		now = time.time()
+		found = [(address, coordinates[0], coordinates[1], now) for address, coordinates in results.items() if coordinates is not None]
+		failed = [(address, now) for address, coordinates in results.items() if coordinates is None]
+
+		self.connection.executemany("INSERT OR REPLACE INTO geocodes (address, latitude, longitude, found, attempts, updated) VALUES (?, ?, ?, 1, 1, ?)", found)
+		self.connection.executemany("INSERT INTO geocodes (address, latitude, longitude, found, attempts, updated) VALUES (?, NULL, NULL, 0, 1, ?) ON CONFLICT(address) DO UPDATE SET attempts = attempts + 1, updated = excluded.updated", failed)
+		self.connection.commit()
+
+	#Assigns a hex to every geocoded address that doesn't have one yet (-1 if it's outside the county). If the hex grid changed, every address gets reassigned.
+	def assignHexes(self, hexGrid):
+		cachedGridHash = self.connection.execute("SELECT gridHash FROM hexGrid").fetchone()
+		if cachedGridHash is None or cachedGridHash[0] != hexGrid.gridHash:
+			self.connection.execute("UPDATE geocodes SET hexId = NULL")
+			self.connection.execute("DELETE FROM hexGrid")
+			self.connection.execute("INSERT INTO hexGrid VALUES (?)", (hexGrid.gridHash,))
+
+		unassignedAddresses = pd.read_sql_query("SELECT address, latitude, longitude FROM geocodes WHERE found = 1 AND hexId IS NULL", self.connection)
+		if len(unassignedAddresses.index) != 0:
+			hexIds = hexGrid.assignHexes(unassignedAddresses['longitude'].values, unassignedAddresses['latitude'].values)
+			self.connection.executemany("UPDATE geocodes SET hexId = ? WHERE address = ?", list(zip(hexIds.tolist(), unassignedAddresses['address'].tolist())))
+		self.connection.commit()
+
+	#Returns the address dictionary - File #, Street Address, Latitude, Longitude, and Hex of every file number with a geocoded address
+	def getAddressDictionary(self):
+		return pd.read_sql_query("SELECT fileAddresses.fileNumber AS \"File #\", fileAddresses.address AS \"Street Address\", geocodes.latitude AS Latitude, geocodes.longitude AS Longitude, geocodes.hexId AS Hex " +
+			"FROM fileAddresses JOIN geocodes ON fileAddresses.address = geocodes.address WHERE geocodes.found = 1", self.connection)
+
+	#Returns the hit/miss statistics of this run
+	def getStats(self):
+		lookups = self.hits + self.negativeHits + self.misses
+		return {'Hits': self.hits, 'Negative Hits': self.negativeHits, 'Misses': self.misses, 'Hit Rate': (self.hits + self.negativeHits) / lookups if lookups != 0 else 0}
+
+# Class:     GeocodeJournal
+# Purpose:   An append-only journal of geocoding results (one JSON line per address). Each batch is flushed to disk as soon as it's geocoded.
+#            After a crash, replaying the journal recovers every finished batch, and compacting moves the results into the cache and empties the journal.
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: path (FilePath of the journal)
+class GeocodeJournal:
+	def __init__(self, path = geocodeJournalPath):
+		self.path = path
+
+	#Appends a batch of results (dictionary of address to (latitude, longitude), or None) and flushes it to disk
+	def append(self, results):
+		with open(self.path, "a", encoding = 'utf-8') as journalFile:
+			for address, coordinates in results.items():
+				journalFile.write(json.dumps({'address': address, 'coordinates': list(coordinates) if coordinates is not None else None}) + "\n")
+			journalFile.flush()
+			os.fsync(journalFile.fileno())
+
+	#Returns every result in the journal. A line cut off by a crash is skipped, and later lines win.
+	def replay(self):
+		results = {}
+		if not os.path.exists(self.path):
+			return results
+
+		with open(self.path, "r", encoding = 'utf-8') as journalFile:
+			for line in journalFile:
+				try:
+					entry = json.loads(line)
+				except ValueError:
+					continue
+				results[entry['address']] = tuple(entry['coordinates']) if entry['coordinates'] is not None else None
+
+		return results
+
+	#Moves the journal's results into the cache, then empties the journal. Returns how many results were compacted.
+	def compact(self, geocodeCache):
+		results = self.replay()
+		if len(results) != 0:
+			geocodeCache.storeResults(results)
+		if os.path.exists(self.path):
+			os.remove(self.path)
+		return len(results)
@@ -0,0 +1,169 @@
+import requests
+import threading
+import time
+import random
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Script:   GeocodingClient.py
+# Purpose:  This script geocodes addresses on a small pool of threads. A token bucket keeps the requests at the rate our plan allows,
+#           429s and server errors are retried with backoff, and every request goes through one shared connection pool.
+#           The geocoder itself is a backend, so the remote service can be swapped for a local or fake one.
+# Author:   Henry Chapman, hchapman@jacksongov.org
+# Dependencies:
+#	 External: requests, threading, time, random, concurrent.futures
+#	 Functions: None
+
+#LocationIQ Plan Limits (requests per second, and how many can go out at once)
+locationIQRate = 2
+locationIQBurst = 2
+
+#Status Codes Worth Retrying (rate limited or a server error)
+retryStatusCodes = [429, 500, 502, 503, 504]
+
+#Status Codes that Stop the Whole Run (a bad or disabled key - every other address would fail the same way)
+fatalStatusCodes = [401, 403]
+
+# Class:     GeocoderHTTPError
+# Purpose:   Raised by a backend when the geocoder answers with an error status code
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: statusCode (int of the HTTP status code)
+class GeocoderHTTPError(Exception):
+	def __init__(self, statusCode):
+		Exception.__init__(self, "Geocoder returned status " + str(statusCode))
+		self.statusCode = statusCode
+
+# Class:     TokenBucket
+# Purpose:   Limits how fast requests go out. Tokens refill at a steady rate up to the burst size, and each request takes one (waiting if there aren't any).
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: rate (tokens per second), burst (most tokens the bucket can hold)
+class TokenBucket:
+	def __init__(self, rate, burst):
+		self.rate = float(rate)
+		self.burst = float(burst)
+		self.tokens = float(burst)
+		self.updated = time.monotonic()
+		self.lock = threading.Lock()
+
+	def acquire(self):
+		while True:
+			with self.lock:
+
+				#Refill the Bucket for the time that has passed
+				now = time.monotonic()
+				self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+				self.updated = now
+
+				if self.tokens >= 1:
+					self.tokens = self.tokens - 1
+					return
+
+				#Wait until the next token
+				wait = (1 - self.tokens) / self.rate
+			time.sleep(wait)
+
+# Class:     LocationIQBackend
+# Purpose:   Geocodes addresses with the LocationIQ search API, reusing one requests Session (and its connection pool) for every request
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: key (LocationIQ API key), poolSize (number of connections to keep open), timeout (seconds to wait for a response)
+class LocationIQBackend:
+	url = "https://us1.locationiq.com/v1/search.php"
+
+	def __init__(self, key, poolSize = 4, timeout = 30):
+		self.key = key
+		self.timeout = timeout
+		self.session = requests.Session()
+		adapter = requests.adapters.HTTPAdapter(pool_connections = poolSize, pool_maxsize = poolSize)
+		self.session.mount("https://", adapter)
+
+	#Returns (latitude, longitude), or None if the address couldn't be found
+	def geocode(self, address):
+		response = self.session.get(self.url, params = {'key': self.key, 'q': address, 'format': 'json', 'limit': 1}, timeout = self.timeout)
+
+		#LocationIQ answers 404 when it can't find an address
+		if response.status_code == 404:
+			return None
+		if response.status_code != 200:
+			raise GeocoderHTTPError(response.status_code)
+
+		results = response.json()
+		if len(results) == 0:
+			return None
+		return (float(results[0]['lat']), float(results[0]['lon']))
+
+# Class:     DictionaryBackend
+# Purpose:   A fake geocoder that looks addresses up in a dictionary, so the geocoding can be run without the remote service
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: coordinates (dictionary of address to (latitude, longitude)), failures (optional dictionary of address to a list of status codes to raise first)
+class DictionaryBackend:
+	def __init__(self, coordinates, failures = None):
+		self.coordinates = coordinates
+		self.failures = failures if failures is not None else {}
+		self.calls = 0
+		self.lock = threading.Lock()
+
+	def geocode(self, address):
+		with self.lock:
+			self.calls = self.calls + 1
+			if len(self.failures.get(address, [])) != 0:
+				raise GeocoderHTTPError(self.failures[address].pop(0))
+		return self.coordinates.get(address)
+
+# Class:     GeocodingClient
+# Purpose:   Geocodes a list of addresses on a thread pool through a backend, at no more than the bucket's rate, retrying rate limits and server errors
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: backend (LocationIQBackend, DictionaryBackend, or anything with geocode(address)), rate (requests per second), burst, maxWorkers,
+#            maxRetries (retries per address), backoff (seconds before the first retry - it doubles each time)
+class GeocodingClient:
+	def __init__(self, backend, rate = locationIQRate, burst = locationIQBurst, maxWorkers = 4, maxRetries = 5, backoff = 1.0):
+		self.backend = backend
+		self.bucket = TokenBucket(rate, burst)
+		self.maxWorkers = maxWorkers
+		self.maxRetries = maxRetries
+		self.backoff = backoff
+
+	#Geocodes one address. Returns (latitude, longitude), None if it wasn't found, or raises the last error once the retries run out.
+	def geocode(self, address):
+		attempt = 0
+		while True:
+			self.bucket.acquire()
+			try:
+				return self.backend.geocode(address)
+			except (GeocoderHTTPError, requests.exceptions.ConnectionError, requests.exceptions.Timeout) as error:
+
+				#Only retry rate limits, server errors, and dropped connections
+				if isinstance(error, GeocoderHTTPError) and error.statusCode not in retryStatusCodes:
+					raise
+				if attempt >= self.maxRetries:
+					raise
+
+				#Back off (with a little jitter so the workers don't retry together)
+				time.sleep(self.backoff * (2 ** attempt) * (1 + random.random() / 2))
+				attempt = attempt + 1
+
+	#Geocodes every address. Returns a dictionary of address to (latitude, longitude), or None if the geocoder answered that it couldn't find it,
+	#and a list of the addresses whose requests kept failing (those aren't in the dictionary, so they can be retried next run).
+	#progress (optional) is called with (number done, total, address, result) as each address finishes.
+	#A fatal status code (fatalStatusCodes) cancels the addresses that haven't started yet, and is raised.
+	def geocodeAll(self, addresses, progress = None):
+		addresses = list(dict.fromkeys(addresses))
+		results = {}
+		failedAddresses = []
+
+		with ThreadPoolExecutor(max_workers = self.maxWorkers) as executor:
+			futures = {executor.submit(self.geocode, address): address for address in addresses}
+			for future in as_completed(futures):
+				address = futures[future]
+				try:
+					results[address] = future.result()
+				except Exception as error:
+					if isinstance(error, GeocoderHTTPError) and error.statusCode in fatalStatusCodes:
+						for pendingFuture in futures:
+							pendingFuture.cancel()
+						raise
+					print("Geocoding Failed - " + str(address) + " - " + str(error))
+					failedAddresses.append(address)
+
+				if progress is not None:
+					progress(len(results) + len(failedAddresses), len(addresses), address, results.get(address))
+
+		return results, failedAddresses
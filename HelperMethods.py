@@ -3,14 +3,69 @@ import os
 import datetime
 from datetime import datetime, timedelta, date
 import shutil
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from DropSnapshots import readDropFile
+from KarpelSchema import readKarpelCSV
 
 # Script:   HelperMethods.py
 # Purpose:  This script provides helper methods for the karpelDashboard
 # Author:   Henry Chapman, hchapman@jacksongov.org
 # Dependencies:
-#	 External: Pandas, os, shutil, datetime
+#	 External: Pandas, os, shutil, datetime, re, threading, concurrent.futures, functools
 #	 Functions: KarpelStarter, DefendantDemographics, Case Details, HelperMethods, DashboardMapGenerator, DataUploaderRunner
 
+#Set to False to load files one after another instead of on a thread pool
+concurrentLoading = True
+
+#Helper Datasets that have already been loaded this run (by file path)
+helperDatasets = {}
+helperDatasetLock = threading.Lock()
+
+# Function:  loadConcurrently
+# Purpose:   This function runs a list of loaders on a thread pool. Reading off the network share is mostly waiting, so overlapping the reads
+#            makes the load take about as long as the slowest file.
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: loaders (list of functions that take no arguments), maxWorkers (int of how many threads to use)
+# Return:    Returns a list of what each loader returned, in the same order as the loaders
+def loadConcurrently(loaders, maxWorkers = 8):
+
+	#If concurrent loading is turned off, run them in order
+	if not concurrentLoading or len(loaders) <= 1:
+		return [loader() for loader in loaders]
+
+	with ThreadPoolExecutor(max_workers = min(maxWorkers, len(loaders))) as executor:
+		futures = [executor.submit(loader) for loader in loaders]
+		return [future.result() for future in futures]
+
+# Function:  readHelperDataset
+# Purpose:   This function loads a helper dataset (ChargeCodeCategories.csv, PD Agency.csv, etc.) once per run, then hands out copies of it
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: path (FilePath of the helper dataset)
+# Return:    Returns a dataframe of the helper dataset
+def readHelperDataset(path):
+	with helperDatasetLock:
+		cached = path in helperDatasets
+
+	if not cached:
+		helperDataset = readKarpelCSV(path, encoding = 'utf-8')
+		with helperDatasetLock:
+			helperDatasets[path] = helperDataset
+
+	#Return a copy so nobody changes the cached dataset
+	return helperDatasets[path].copy()
+
+# Function:  preloadHelperDatasets
+# Purpose:   This function loads every helper dataset at the same time, so later calls to readHelperDataset don't have to wait on the share
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: None
+# Return:    None
+def preloadHelperDatasets():
+	helperPaths = ["HelperDatasets\\ChargeCodeCategories.csv", "HelperDatasets\\PD Agency.csv", "HelperDatasets\\Disposition Codes.csv", "HelperDatasets\\RefusalReasons.csv", "Disposition Codes.csv", "RefusalReasons.csv"]
+	loadConcurrently([partial(readHelperDataset, path) for path in helperPaths])
+
 # Function:  getNewestFile
 # Purpose:   This function gets the latest date (or most recent file) from the Karpel Weekly Data Drop
 # Author:    Henry Chapman, hchapman@jacksongov.org
@@ -56,10 +111,9 @@ def getUniqueListOfFiledCases(weeklyUpload):
 	
 	#Get newest filed cases
 	newestFile = getNewestFile(weeklyUpload)
-	newestFiledCases = pd.read_csv(weeklyUpload + "Fld_" + str(newestFile) + "_1800.CSV", encoding = 'utf-8')
-	
-	#Filter the dataset down to just file numbers
-	newestFiledCases = newestFiledCases[['File #']]
+
+	#Only read the file numbers
+	newestFiledCases = readDropFile(weeklyUpload, "Fld_" + str(newestFile) + "_1800.CSV", ['File #'])
 
 	#Append the new filed cases to the list of older filed cases
 
@@ -78,6 +132,43 @@ def getUniqueListOfFiledCases(weeklyUpload):
 
 	return filedFileNumbers
 
+# Function:  loadTestDefendantBlocklist
+# Purpose:   This function loads the blocklist of known "test" defendants (Bogus, Darth Vader, etc.), then builds one pattern out of it
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: None
+# Return:    Returns the compiled pattern and a list of rule names (in the same order as the pattern's groups)
+def loadTestDefendantBlocklist():
+
+	#Load the Blocklist - each rule is a regular expression matched against the defendant's name
+	blocklist = pd.read_csv("HelperDatasets\\TestDefendants.csv", encoding = 'utf-8')
+	ruleNames = blocklist['Rule'].tolist()
+
+	#Give each rule its own named group so we can count what it removed. Patterns are case-sensitive (a rule can use (?i:...) to ignore case).
+	rulePatterns = ["(?P<rule" + str(i) + ">" + pattern + ")" for i, pattern in enumerate(blocklist['Pattern'].tolist())]
+	blocklistPattern = re.compile("|".join(rulePatterns))
+
+	return blocklistPattern, ruleNames
+
+# Function:  scrubTestDefendants
+# Purpose:   This function drops every "test" defendant in one pass, and prints how many rows each rule removed
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: caseType (dataframe of cases), blocklistPattern (compiled pattern), ruleNames (list of rule names) - both from loadTestDefendantBlocklist
+# Return:    Returns the dataframe without the test defendants
+def scrubTestDefendants(caseType, blocklistPattern, ruleNames):
+
+	#Match every name against the pattern once, then keep just the rule groups
+	ruleMatches = caseType['Def. Name'].fillna('').astype(str).str.extract(blocklistPattern)
+	ruleMatches = ruleMatches[["rule" + str(i) for i in range(len(ruleNames))]].notna()
+
+	#Print how many rows each rule removed
+	ruleCounts = ruleMatches.sum()
+	for i in range(len(ruleNames)):
+		if ruleCounts.iloc[i] > 0:
+			print("Removed " + str(ruleCounts.iloc[i]) + " rows - " + ruleNames[i])
+
+	#Drop every row that matched any rule
+	return caseType[~ruleMatches.any(axis = 1).values]
+
 # Function:  getCaseYear
 # Purpose:   This function returns the case year from a list of cases
 # Author:    Henry Chapman, hchapman@jacksongov.org
@@ -128,6 +219,18 @@ def getCaseType(caseInput):
 		return "Disposed"
 
 
+# Function:  countByItem
+# Purpose:   Helper Method to count rows by the values of one column. Categorical columns only count the values that actually appear.
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: caseType (dataframe), column (string of the column name)
+# Return:    Returns a series of counts indexed by the column's values
+def countByItem(caseType, column):
+	counts = caseType.groupby([column], observed = True).size()
+
+	#Use plain values for the index so counts from different case types line up
+	counts.index = counts.index.astype(object)
+	return counts
+
 # Function:  getListOfCrimeCategories
 # Purpose:   Method to load the list of charge code categories
 # Author:    Henry Chapman, hchapman@jacksongov.org
@@ -136,11 +239,43 @@ def getCaseType(caseInput):
 def getListOfCrimeCategories():
 	crimeCategoryList = []
 
-	chargesDictionary = pd.read_csv("HelperDatasets\\ChargeCodeCategories.csv", encoding = 'utf-8')
+	chargesDictionary = readHelperDataset("HelperDatasets\\ChargeCodeCategories.csv")
 	crimeCategoryList = list(set(chargesDictionary["Category"].tolist()))
 
 	return crimeCategoryList
 
+# Function:  getChangedCategories
+# Purpose:   Method to get the charge code categories that have changed since the previous data drop
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: changedChargeCodes (set of charge codes, or None)
+# Return:    Returns a set of changed categories (including "All" if anything changed), or None if every category has to be recomputed
+def getChangedCategories(changedChargeCodes):
+
+	#If there isn't a previous drop to compare to, everything has to be recomputed
+	if changedChargeCodes is None:
+		return None
+
+	#If nothing changed, nothing has to be recomputed
+	if len(changedChargeCodes) == 0:
+		return set()
+
+	#Get the categories of those charge codes
+	chargesDictionary = readHelperDataset("HelperDatasets\\ChargeCodeCategories.csv")
+	changedCategories = set(chargesDictionary[chargesDictionary['Ref. Charge Code'].isin(changedChargeCodes)]['Category'].tolist())
+	changedCategories.add("All")
+
+	return changedCategories
+
+# Function:  removeCategoryCSVs
+# Purpose:   Method to remove the analysis CSVs of a category from DataForDashboard before they're recomputed
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: caseCategory (string of case category)
+# Return:    None
+def removeCategoryCSVs(caseCategory):
+	for item in os.listdir("DataForDashboard"):
+		if item.startswith(caseCategory + " - "):
+			os.remove("DataForDashboard\\" + item)
+
 # Function:  dropCurrentCases
 # Purpose:   Method to drop all current cases from CombinedData.CSV
 # Author:    Henry Chapman, hchapman@jacksongov.org
@@ -227,68 +362,3 @@ def combineAllCSVs(year):
 
 	#Exporting DataFrame to CSV
 	currentYear.to_csv("CombinedDataV2.csv", encoding='utf-8', index = False)
-
-# Function:  readDataForList
-# Purpose:   Method to Read All Data into one list of dataframes
-# Author:    Henry Chapman, hchapman@jacksongov.org
-# Arguments: None
-# Return:    xls (list of received, not-filed, filed, and disposed dataframes)
-def readDataForList():
-
-	#initialize list
-	xls = []
-
-	#Get Directory of Karpel Data Drop
-	weeklyUpload = "H:\\Units Attorneys and Staff\\01 - Units\\DT Crime Strategies Unit\\Weekly Update\\"
-
-	#For Each Item in the data folder
-	for item in os.listdir("RawData"):
-
-		#Load the csv file
-		xl = pd.read_csv('RawData\\'+item)
-		
-		#If it's a not-filed case, drop out the file numbers that have been filed
-		if "Not Filed" in item:
-			uniqueFiledCRNs = getUniqueListOfFiledCases(weeklyUpload)
-			xl = xl[~xl['File #'].isin(uniqueFiledCRNs)]
-
-			#Reset the index
-			xl = xl.reset_index()
-		#Append the caseType to the master list, then return it
-		xls.append(xl)
-	return xls
-
-# Function:  filterLargerDataFrame
-# Purpose:   Method to Filter DataFrame based on charge code category
-# Author:    Henry Chapman, hchapman@jacksongov.org
-# Arguments: xls (list of case types - received, filed, not-filed, disposed), caseCategory (string of case category)
-# Return:    filtered dataframe
-def filterLargerDataFrame(xls, caseCategory):
-	#Initialize List
-	filteredXLS = []
-
-	#Load Charge Code Categories
-	chargesDictionary = pd.read_csv("HelperDatasets\\ChargeCodeCategories.csv", encoding = 'utf-8')
-
-	#Initialize blank counts
-	blankCount = 0 
-	for caseType in xls:
-
-		#Merge In Case Charges
-		caseType = caseType.merge(chargesDictionary, on='Ref. Charge Code')
-		
-		#Filter DataFrame based on those charges
-		caseType = caseType[caseType['Category']==caseCategory]
-
-		#If DataFrame is empty, add to blank count
-		if caseType.empty:
-			blankCount = blankCount + 1
-
-		#Append Filtered dataframe to list
-		filteredXLS.append(caseType)
-
-	#If 4 Empty dataframes in caseTypes, return false, otherwise return that dataframe
-	if blankCount == 4:
-		return False
-	else:
-		return filteredXLS
\ No newline at end of file
@@ -0,0 +1,285 @@
+import pandas as pd
+import numpy as np
+import json
+import geopandas as gpd
+from shapely.prepared import prep
+from shapely.geometry import mapping
+from pyproj import Transformer
+from DropSnapshots import hashDropFile
+from GeoJSONWriter import toJSONValue
+
+# Script:   HexGrid.py
+# Purpose:  This script loads the Jackson County hexes once per run. The hex grid holds the hexes, a prepared county border, and the hexes' spatial index (an STRtree),
+#           so every stage and category of the map reuses the same geometry instead of re-reading the hexes and rebuilding the border each time.
+#           Since the hexes are a uniform tessellation, points can also be binned arithmetically - projected, then rounded to axial hex coordinates with numpy -
+#           which is checked against the spatial index when the grid loads. The lattice also gives coarser hexes for the map's lower zoom levels.
+# Author:   Henry Chapman, hchapman@jacksongov.org
+# Dependencies:
+#	 External: Pandas, numpy, json, GeoPandas, shapely, pyproj
+#	 Functions: hashDropFile, toJSONValue
+
+#Location of the Jackson County Hexes (Pre-Determined), and the CRS the map uses
+hexGridPath = "Maps\\JacksonCountyHexes.geojson"
+hexGridCRS = 'epsg:4326'
+
+#How points are assigned to hexes - 'arithmetic' (axial hex coordinates, falling back to the spatial index if the grid doesn't check out) or 'spatial'
+hexBinning = 'arithmetic'
+
+#Projected CRS the hexes are uniform in, if the hexes file isn't already projected
+hexLatticeCRS = 'epsg:3857'
+
+#Random points (plus every hex's center) checked against the spatial index before arithmetic binning is trusted
+latticeCheckPoints = 5000
+
+#Hex Columns that aren't published with the map (the grid's bounding boxes)
+unpublishedHexColumns = ['objectid', 'left', 'bottom', 'right', 'top']
+
+#Offset that keeps axial coordinates positive when they're packed into one key
+axialKeyOffset = 2 ** 20
+
+#Hex Sizes Published with the Map, as multiples of the base hex size. Resolution 0 is the base hexes, and each coarser resolution is aggregated from the one before it.
+hexResolutions = [1, 3, 9]
+
+# Function:  cubeRound
+# Purpose:   This function rounds fractional axial hex coordinates to the hex they fall in (rounding in cube coordinates, then fixing the coordinate that rounded the furthest)
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: q, r (numpy arrays of fractional axial coordinates)
+# Return:    Returns (q, r) numpy arrays of whole axial coordinates
+def cubeRound(q, r):
+	s = -q - r
+	roundedQ = np.round(q)
+	roundedR = np.round(r)
+	roundedS = np.round(s)
+
+	qDifference = np.abs(roundedQ - q)
+	rDifference = np.abs(roundedR - r)
+	sDifference = np.abs(roundedS - s)
+
+	fixQ = (qDifference > rDifference) & (qDifference > sDifference)
+	fixR = ~fixQ & (rDifference > sDifference)
+	roundedQ = np.where(fixQ, -roundedR - roundedS, roundedQ)
+	roundedR = np.where(fixR, -roundedQ - roundedS, roundedR)
+	return roundedQ, roundedR
+
+# Function:  axialCoordinates
+# Purpose:   This function converts projected coordinates to fractional axial hex coordinates. The lattice is rotated so its hexes are flat-topped, with hex (0, 0) at the origin.
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: x, y (numpy arrays of projected coordinates), lattice (dictionary from buildHexLattice)
+# Return:    Returns (q, r) numpy arrays of fractional axial coordinates
+def axialCoordinates(x, y, lattice):
+	dx = x - lattice['Origin'][0]
+	dy = y - lattice['Origin'][1]
+	rotatedX = dx * np.cos(lattice['Rotation']) + dy * np.sin(lattice['Rotation'])
+	rotatedY = -dx * np.sin(lattice['Rotation']) + dy * np.cos(lattice['Rotation'])
+
+	q = (2 / 3 * rotatedX) / lattice['Size']
+	r = (-1 / 3 * rotatedX + np.sqrt(3) / 3 * rotatedY) / lattice['Size']
+	return q, r
+
+# Function:  axialKeys
+# Purpose:   This function packs whole axial coordinates into one integer key per hex
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: q, r (numpy arrays of whole axial coordinates)
+# Return:    Returns a numpy array of int64 keys
+def axialKeys(q, r):
+	return (q.astype(np.int64) + axialKeyOffset) * (2 * axialKeyOffset) + (r.astype(np.int64) + axialKeyOffset)
+
+# Function:  axialCenters
+# Purpose:   This function converts whole axial hex coordinates back to the projected centers of those hexes
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: q, r (numpy arrays of whole axial coordinates), lattice (dictionary from buildHexLattice)
+# Return:    Returns a numpy array of projected centers (n x 2)
+def axialCenters(q, r, lattice):
+	flatX = lattice['Size'] * 1.5 * q
+	flatY = lattice['Size'] * np.sqrt(3) * (r + q / 2)
+	x = flatX * np.cos(lattice['Rotation']) - flatY * np.sin(lattice['Rotation']) + lattice['Origin'][0]
+	y = flatX * np.sin(lattice['Rotation']) + flatY * np.cos(lattice['Rotation']) + lattice['Origin'][1]
+	return np.column_stack([x, y])
+
+# Function:  buildHexLattice
+# Purpose:   This function works out the hex lattice (origin, size, and rotation) from one hex, then checks every hex's center falls on it
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: centers (numpy array of every hex's projected center, n x 2), firstHexVertices (numpy array of the first hex's 6 projected vertices), objectids (numpy array of every hex's objectid)
+# Return:    Returns a dictionary of the lattice, or None if the hexes aren't a uniform hex tessellation
+def buildHexLattice(centers, firstHexVertices, objectids):
+	if len(firstHexVertices) != 6:
+		return None
+
+	#Size is the distance from the center to a vertex, and Rotation is how far the vertices are turned from a flat-topped hex
+	offsets = firstHexVertices - centers[0]
+	radii = np.hypot(offsets[:, 0], offsets[:, 1])
+	angles = np.arctan2(offsets[:, 1], offsets[:, 0])
+	rotation = np.mod(angles[0], np.pi / 3)
+	angleErrors = np.abs(np.mod(angles - rotation + np.pi / 6, np.pi / 3) - np.pi / 6)
+	if radii.max() - radii.min() > radii.mean() * 1e-6 or angleErrors.max() > 1e-6:
+		return None
+
+	lattice = {'Origin': centers[0], 'Size': radii.mean(), 'Rotation': rotation}
+
+	#Every Hex's Center has to Land on Whole Axial Coordinates, and Each Hex Needs its Own
+	q, r = axialCoordinates(centers[:, 0], centers[:, 1], lattice)
+	if max(np.abs(q - np.round(q)).max(), np.abs(r - np.round(r)).max()) > 1e-3:
+		return None
+	keys = axialKeys(np.round(q), np.round(r))
+	if len(np.unique(keys)) != len(keys):
+		return None
+
+	sortOrder = np.argsort(keys)
+	lattice['Keys'] = keys[sortOrder]
+	lattice['Objectids'] = objectids[sortOrder]
+	lattice['Centers'] = centers
+	return lattice
+
+# Class:     HexGrid
+# Purpose:   The Jackson County hexes, their county border (prepared, so point tests are fast), their spatial index, and (if the hexes are uniform) their hex lattice
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: path (FilePath of the hexes geojson), crs (CRS to put the hexes in), binning ('arithmetic' or 'spatial')
+class HexGrid:
+	def __init__(self, path = hexGridPath, crs = hexGridCRS, binning = hexBinning):
+		self.crs = crs
+
+		#Hash of the Hexes File, so cached hex assignments can tell when the grid changed
+		self.gridHash = hashDropFile(path)
+
+		#Load Jackson County Hexes, and Set Index as ObjectID
+		sourceHexes = gpd.GeoDataFrame.from_file(path)
+		self.hexes = sourceHexes.to_crs(crs)
+		self.hexes['objectid'] = self.hexes.index
+
+		#Creates the County Border Once, and Prepares it for Point Tests
+		self.border = self.hexes.geometry.unary_union
+		self.preparedBorder = prep(self.border)
+
+		#Builds the Spatial Index of the Hexes
+		self.sindex = self.hexes.sindex
+
+		#Builds the Hex Lattice for Arithmetic Binning, and Makes Sure it Agrees with the Spatial Index
+		self.lattice = None
+		if binning == 'arithmetic':
+			self.lattice = self.loadHexLattice(sourceHexes)
+			if self.lattice is not None and not self.checkHexLattice():
+				self.lattice = None
+			if self.lattice is None:
+				print("Hexes Aren't a Uniform Grid - Using the Spatial Index to Bin Points")
+
+	#Builds the hex lattice in the hexes' projected CRS
+	def loadHexLattice(self, sourceHexes):
+		latticeHexes = sourceHexes if sourceHexes.crs is not None and sourceHexes.crs.is_projected else sourceHexes.to_crs(hexLatticeCRS)
+		self.transformer = Transformer.from_crs(self.crs, latticeHexes.crs, always_xy = True)
+		self.inverseTransformer = Transformer.from_crs(latticeHexes.crs, self.crs, always_xy = True)
+
+		centers = np.array([[center.x, center.y] for center in latticeHexes.geometry.centroid])
+		firstHexVertices = np.array(latticeHexes.geometry.iloc[0].exterior.coords)[:-1]
+		return buildHexLattice(centers, firstHexVertices, self.hexes['objectid'].values)
+
+	#Bins every hex's center and a random sample of points in the county's bounds both ways - arithmetic binning is only used if they all agree
+	def checkHexLattice(self):
+		centers = self.hexes.geometry.representative_point()
+		left, bottom, right, top = self.hexes.total_bounds
+		randomPoints = np.random.default_rng(0).random((latticeCheckPoints, 2))
+		longitudes = np.concatenate([centers.x.values, left + randomPoints[:, 0] * (right - left)])
+		latitudes = np.concatenate([centers.y.values, bottom + randomPoints[:, 1] * (top - bottom)])
+
+		return (self.binHexes(longitudes, latitudes) == self.assignHexesSpatially(longitudes, latitudes)).all()
+
+	#Returns the resolutions the map can publish - every one in hexResolutions if the hexes are a uniform lattice, otherwise just the base hexes
+	def getResolutions(self):
+		if self.lattice is None:
+			return [0]
+		return list(range(len(hexResolutions)))
+
+	#Returns (hex ids, projected centers) of every hex at a resolution. The base hexes are the grid's own, and each coarser resolution has the hexes the finer one's centers fall in.
+	def getResolutionHexes(self, resolution):
+		if not hasattr(self, 'resolutionHexes'):
+			self.resolutionHexes = {0: (self.hexes['objectid'].values, self.lattice['Centers'])}
+
+		if resolution not in self.resolutionHexes:
+			parentHexes = self.getParentHexes(resolution)
+			parentKeys = np.unique(parentHexes.values)
+			q = parentKeys // (2 * axialKeyOffset) - axialKeyOffset
+			r = parentKeys % (2 * axialKeyOffset) - axialKeyOffset
+			self.resolutionHexes[resolution] = (parentKeys, axialCenters(q, r, self.getResolutionLattice(resolution)))
+
+		return self.resolutionHexes[resolution]
+
+	#Returns the lattice of a resolution (the base lattice, scaled up)
+	def getResolutionLattice(self, resolution):
+		return dict(self.lattice, Size = self.lattice['Size'] * hexResolutions[resolution])
+
+	#Returns a series of the hex each hex of the next finer resolution is in (indexed by the finer hex ids)
+	def getParentHexes(self, resolution):
+		childIds, childCenters = self.getResolutionHexes(resolution - 1)
+		q, r = cubeRound(*axialCoordinates(childCenters[:, 0], childCenters[:, 1], self.getResolutionLattice(resolution)))
+		return pd.Series(axialKeys(q, r), index = childIds)
+
+	#Returns a dictionary of hex id to (published properties, GeoJSON geometry string) of every hex at a resolution, encoded once for the whole layer.
+	#Coarser hexes don't have the grid's own properties, so theirs are blank.
+	def getHexFeatures(self, resolution = 0):
+		if not hasattr(self, 'hexFeatures'):
+			self.hexFeatures = {}
+
+		if resolution not in self.hexFeatures:
+			propertyColumns = [column for column in self.hexes.columns if column not in unpublishedHexColumns and column != self.hexes.geometry.name]
+
+			if resolution == 0:
+				hexIds = self.hexes['objectid'].tolist()
+				hexProperties = self.hexes[propertyColumns].to_dict('records')
+				hexGeometries = [json.dumps(mapping(geometry), default = toJSONValue) for geometry in self.hexes.geometry]
+			else:
+				hexIds, centers = self.getResolutionHexes(resolution)
+				hexIds = hexIds.tolist()
+				hexProperties = [{column: None for column in propertyColumns} for hexId in hexIds]
+
+				#Six Vertices Around Each Center (closing the ring), Projected Back to the Map's CRS
+				size = self.getResolutionLattice(resolution)['Size']
+				angles = self.lattice['Rotation'] + np.arange(7) * np.pi / 3
+				vertexX = (centers[:, 0][:, None] + size * np.cos(angles)[None, :]).ravel()
+				vertexY = (centers[:, 1][:, None] + size * np.sin(angles)[None, :]).ravel()
+				longitudes, latitudes = self.inverseTransformer.transform(vertexX, vertexY)
+				vertices = np.column_stack([longitudes, latitudes]).reshape(len(hexIds), 7, 2)
+				hexGeometries = [json.dumps({'type': 'Polygon', 'coordinates': [hexVertices.tolist()]}) for hexVertices in vertices]
+
+			self.hexFeatures[resolution] = dict(zip(hexIds, zip(hexProperties, hexGeometries)))
+
+		return self.hexFeatures[resolution]
+
+	#Returns a boolean series of which points are within Jackson County's border
+	def withinCounty(self, points):
+		return pd.Series([self.preparedBorder.contains(point) for point in points], index = points.index, dtype = bool)
+
+	#Assigns each point (longitude, latitude arrays) to the hex it's in - arithmetically if the lattice checked out, otherwise with the spatial index.
+	#Points outside the county (or without coordinates) get -1.
+	def assignHexes(self, longitudes, latitudes):
+		if self.lattice is not None:
+			return self.binHexes(longitudes, latitudes)
+		return self.assignHexesSpatially(longitudes, latitudes)
+
+	#Bins points with axial hex coordinates - projected, rounded to a hex, then looked up in the grid's hexes (a hex that isn't in the grid is outside the county)
+	def binHexes(self, longitudes, latitudes):
+		longitudes = np.asarray(longitudes, dtype = float)
+		latitudes = np.asarray(latitudes, dtype = float)
+		hexIds = np.full(len(longitudes), -1, dtype = np.int64)
+
+		hasCoordinates = np.isfinite(longitudes) & np.isfinite(latitudes)
+		x, y = self.transformer.transform(longitudes[hasCoordinates], latitudes[hasCoordinates])
+		q, r = cubeRound(*axialCoordinates(np.asarray(x), np.asarray(y), self.lattice))
+		keys = axialKeys(q, r)
+
+		positions = np.clip(np.searchsorted(self.lattice['Keys'], keys), 0, len(self.lattice['Keys']) - 1)
+		inGrid = self.lattice['Keys'][positions] == keys
+		hexIds[np.flatnonzero(hasCoordinates)] = np.where(inGrid, self.lattice['Objectids'][positions], -1)
+		return hexIds
+
+	#Assigns points with the prepared border and the spatial index. A point on a shared edge goes to the first hex.
+	def assignHexesSpatially(self, longitudes, latitudes):
+		points = gpd.GeoSeries(gpd.points_from_xy(longitudes, latitudes), crs = self.crs)
+		hexIds = np.full(len(points), -1, dtype = np.int64)
+
+		inCounty = self.withinCounty(points).values
+		if inCounty.any():
+			countyPoints = points[inCounty]
+			pointIndexes, hexIndexes = self.sindex.query_bulk(countyPoints, predicate = 'intersects', sort = True)
+			pointIndexes, firstMatches = np.unique(pointIndexes, return_index = True)
+			hexIds[np.flatnonzero(inCounty)[pointIndexes]] = self.hexes['objectid'].values[hexIndexes[firstMatches]]
+
+		return hexIds
@@ -0,0 +1,51 @@
+import pandas as pd
+
+# Script:   KarpelSchema.py
+# Purpose:  This script declares the column types of the Karpel dataframes (and the helper datasets merged into them).
+#           Repeated labels (race, sex, agency, charge codes, etc.) are loaded as categoricals, years as small integers, and dates as datetimes,
+#           so the consolidated history takes less memory and every groupby works on codes instead of strings.
+# Author:   Henry Chapman, hchapman@jacksongov.org
+# Dependencies:
+#	 External: Pandas
+#	 Functions: None
+
+#Columns with a small set of repeated labels
+categoryColumns = ['Def. Race', 'Def. Sex', 'Agency', 'Disp. Code', 'Ref. Charge Code', 'Category', 'Activity', 'Reason', 'PD NAME', 'Assigned Atty']
+
+#Integer Columns and their types (nullable, since some stages don't have a year on every row)
+integerColumns = {'Year': 'Int16'}
+
+#Date Columns
+dateColumns = ['Referral Date', 'Enter Dt.', 'Filing Dt.', 'Disp. Dt.', 'Def. DOB']
+
+# Function:  applyKarpelSchema
+# Purpose:   This function converts every schema column that's in a dataframe to its declared type. Columns that already have the right type are left alone.
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: caseType (dataframe of cases or a helper dataset)
+# Return:    Returns the dataframe with the declared types
+def applyKarpelSchema(caseType):
+
+	#Categorical Columns
+	for column in categoryColumns:
+		if column in caseType.columns and not pd.api.types.is_categorical_dtype(caseType[column]):
+			caseType[column] = caseType[column].astype('category')
+
+	#Integer Columns
+	for column in integerColumns:
+		if column in caseType.columns and caseType[column].dtype != integerColumns[column]:
+			caseType[column] = caseType[column].astype(integerColumns[column])
+
+	#Date Columns - anything that can't be read as a date becomes NaT
+	for column in dateColumns:
+		if column in caseType.columns and not pd.api.types.is_datetime64_any_dtype(caseType[column]):
+			caseType[column] = pd.to_datetime(caseType[column], errors = 'coerce')
+
+	return caseType
+
+# Function:  readKarpelCSV
+# Purpose:   This function reads a CSV, then applies the Karpel schema to it
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: path (FilePath of the CSV), any other pd.read_csv arguments
+# Return:    Returns a dataframe with the declared types
+def readKarpelCSV(path, **kwargs):
+	return applyKarpelSchema(pd.read_csv(path, **kwargs))
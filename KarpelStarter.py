@@ -1,14 +1,19 @@
 import pandas as pd
-from HelperMethods import getUniqueListOfFiledCases
+from HelperMethods import getCaseType, getUniqueListOfFiledCases, loadTestDefendantBlocklist, scrubTestDefendants, loadConcurrently
+from DropSnapshots import readDropFile
+from KarpelSchema import applyKarpelSchema
+from AddressNormalizer import normalizeAddressColumns
+from DropDeltas import findChangedChargeCodes
 import os
+from functools import partial
 
 # Script:   karpelStarter.py
 # Purpose:  This script retrieves the most recent cases that are extracted from Karpel via daily data query.
 #           It  cleans the data set, then returns it for analysis.
 # Author:   Henry Chapman, hchapman@jacksongov.org
 # Dependencies:
-#	 External: Pandas, os,
-#	 Functions: None
+#	 External: Pandas, os, functools
+#	 Functions: getCaseType, loadConcurrently, loadTestDefendantBlocklist, scrubTestDefendants, readDropFile, applyKarpelSchema, findChangedChargeCodes, normalizeAddressColumns
 
 # Function:  getNewestFile
 # Purpose:   This function gets the latest date (or most recent file) from the Karpel Weekly Data Drop
@@ -44,11 +49,11 @@ def getNewestFile(weeklyUpload):
 # Function:  loadMostRecentFile
 # Purpose:   This loads the most recent 2021 cases out of Karpel from the WeeklyUpload folder on the H Drive.
 #            It renames columns so they are all standard accross the three types of case categories.
-#            It also consolidates every address column into one column (Street Address, Town, ZipCode)
+#            It also normalizes every address column into one address key (Street Address, Town, ZipCode) with its street, city, and zip, and drops the test defendants
 # Author:    Henry Chapman, hchapman@jacksongov.org
-# Arguments: newestFile, weeklyUpload
+# Arguments: newestFile, weeklyUpload, blocklistPattern, ruleNames (from loadTestDefendantBlocklist)
 # Return:    Returns a list of 3 dataframes (Received Cases, Filed Cases, Disposed Cases)
-def loadMostRecentFile(newestFile, weeklyUpload):
+def loadMostRecentFile(newestFile, weeklyUpload, blocklistPattern, ruleNames):
 
 	#Loads Weekly Upload Folder
 	directoryList = os.listdir(weeklyUpload)
@@ -62,73 +67,67 @@ def loadMostRecentFile(newestFile, weeklyUpload):
 	#Loads Spreadsheet to Fix Misspelled Column Labels
 	fixedRowlabels = pd.ExcelFile('HelperDatasets\\FixedRowLabels.xlsx')
 
-	#Loops Through Weekly Upload Directory
-	for item in directoryList:
+	#Checking if it's the most recent file (Received,Disposed,Filed)
+	newestItems = [item for item in directoryList if newestFile in item and ("_1800" in item) and ("CaseNo" not in item)]
 
-		#Checking if it's the most recent file (Received,Disposed,Filed)
-		if newestFile in item and ("_1800" in item) and ("CaseNo" not in item):
+	#Load the Most Recent Files as DataFrames (from their snapshots) at the same time
+	newestDFs = loadConcurrently([partial(readDropFile, weeklyUpload, item) for item in newestItems])
 
-			#print(newestFile)
-			#if "CaseNo" in newestFile:
-			#	continue
+	#Loops Through the Most Recent Files (in the same order as the directory)
+	for tempUpdatedDF in newestDFs:
 
-			#Load the Most Recent File as a DataFrame
-			tempUpdatedDF = pd.read_csv(weeklyUpload + item)
+		#Fix the Misspelled/Incorrect Column Headers/Standardize Column Headers
+		fixedRowLabel = pd.read_excel(fixedRowlabels, sheet_name = fixedRowlabels.sheet_names[i])
+		fixedRowLabelDict = pd.Series(fixedRowLabel['New Name'].values,index=fixedRowLabel['Original Name']).to_dict()
+		tempUpdatedDF = tempUpdatedDF.rename(columns=fixedRowLabelDict)
 
-			#Fix the Misspelled/Incorrect Column Headers/Standardize Column Headers
-			fixedRowLabel = pd.read_excel(fixedRowlabels, sheet_name = fixedRowlabels.sheet_names[i])
-			fixedRowLabelDict = pd.Series(fixedRowLabel['New Name'].values,index=fixedRowLabel['Original Name']).to_dict()
-			tempUpdatedDF = tempUpdatedDF.rename(columns=fixedRowLabelDict)
+		#Normalizes the Address Fields into One Address Key (and the Offense Street, City, and Zip), and drops the old fields that we don't need.
+		defendantAddresses = normalizeAddressColumns(tempUpdatedDF, "Def. Street Address", "Def. Street Address2", "Def. City", "Def. State", "Def. Zipcode")
+		offenseAddresses = normalizeAddressColumns(tempUpdatedDF, "Offense Street Address", "Offense Street Address 2", "Offense City", "Offense State", "Off. Zipcode")
+		tempUpdatedDF["Def. Street Address"] = defendantAddresses['Address Key']
+		tempUpdatedDF["Offense Street Address"] = offenseAddresses['Address Key']
+		tempUpdatedDF["Offense Address Street"] = offenseAddresses['Street']
+		tempUpdatedDF["Offense Address City"] = offenseAddresses['City']
+		tempUpdatedDF["Offense Address Zip"] = offenseAddresses['Zip']
+		tempUpdatedDF = tempUpdatedDF.drop(columns=["Def. Street Address2", "Def. City", "Def. State", "Def. Zipcode", "Offense Street Address 2", "Offense City", "Offense State", "Off. Zipcode", "Def. SSN"])
 
-			#Concatenates Address Field into One Field, and drops the old fields that we don't need. 
-			tempUpdatedDF["Def. Street Address"] = tempUpdatedDF["Def. Street Address"].fillna('').astype(str) + ", " + tempUpdatedDF["Def. Street Address2"].fillna('').astype(str) + ", " + tempUpdatedDF["Def. City"].fillna('').astype(str) + ", " + tempUpdatedDF["Def. State"].fillna('').astype(str) + ", " + tempUpdatedDF["Def. Zipcode"].fillna('').astype(str)
-			tempUpdatedDF["Offense Street Address"] = tempUpdatedDF["Offense Street Address"].fillna('').astype(str) + ", " + tempUpdatedDF["Offense Street Address 2"].fillna('').astype(str) + ", " + tempUpdatedDF["Offense City"].fillna('').astype(str) + ", " + tempUpdatedDF["Offense State"].fillna('').astype(str) + ", " + tempUpdatedDF["Off. Zipcode"].fillna('').astype(str)
-			tempUpdatedDF = tempUpdatedDF.drop(columns=["Def. Street Address2", "Def. City", "Def. State", "Def. Zipcode", "Offense Street Address 2", "Offense City", "Offense State", "Off. Zipcode", "Def. SSN"])
+		#Drop the Test Defendants (Bogus, Darth Vader, etc.)
+		tempUpdatedDF = scrubTestDefendants(tempUpdatedDF, blocklistPattern, ruleNames)
 
-			#print(oldDisposedCases.columns)
-			tempUpdatedDF = tempUpdatedDF[tempUpdatedDF['Def. Name'] != 'badguy, john wayne ']
-			tempUpdatedDF = tempUpdatedDF[~tempUpdatedDF['Def. Name'].str.contains('bogus')]
-			tempUpdatedDF = tempUpdatedDF[~tempUpdatedDF['Def. Name'].str.contains('Bogus')]
-			tempUpdatedDF = tempUpdatedDF[~tempUpdatedDF['Def. Name'].str.contains('darth')]
-			tempUpdatedDF = tempUpdatedDF[~tempUpdatedDF['Def. Name'].str.contains('Darth')]
-			tempUpdatedDF = tempUpdatedDF[~tempUpdatedDF['Def. Name'].str.contains('vader')]
+		#Set the Column Types (categories, dates, etc.)
+		tempUpdatedDF = applyKarpelSchema(tempUpdatedDF)
 
-			updatedCompleteDFs.append(tempUpdatedDF)
-			i = i + 1
+		updatedCompleteDFs.append(tempUpdatedDF)
+		i = i + 1
 	return updatedCompleteDFs
 
 
 # Function:  cleanDataset
 # Purpose:   This Performs Basic Cleanings and Filters the Data so we just get 2021 data.
-#            It filters just 2021 cases (by date and file number). It also removes anyone named "Bogus" or "Test"
-#            Finally, it saves the 2021 cases in a the RawData folder. It saves a CSV for Received, Filed, and Disposed Cases
+#            It filters just 2021 cases (by date and file number). The stages are in the same order as loadMostRecentFile (received, not-filed, filed, disposed).
 # Author:    Henry Chapman, hchapman@jacksongov.org
-# Arguments: newestFile, weeklyUpload
-# Return:    None
+# Arguments: updatedCompleteDFs, uniqueFiledCRNs
+# Return:    Returns the cleaned list of dataframes (received, not-filed, filed, disposed), and dataframes of disposed and not-filed file numbers
 def cleanDataSet(updatedCompleteDFs, uniqueFiledCRNs):
 
-	#List of File Names in RawData
-	fileNames = os.listdir("RawData")
-
 	disposedCases = []
 	notFiledCases = []
+	cleanedDFs = []
 
-	i = 0
+	caseInput = 0
 	for caseType in updatedCompleteDFs:
-		#Drop All the Defendants Named Bogus/Test
-		caseTypeClean = caseType[~caseType['Def. Name'].str.contains("Bogus")]
-		caseTypeClean = caseTypeClean[~caseTypeClean['Def. Name'].str.contains("Bogus", na=False)]
-		caseTypeClean = caseTypeClean[~caseTypeClean['Def. Name'].str.contains("Test", na=False)]
-		caseTypeClean = caseTypeClean.reset_index()
+		#The Test Defendants were already dropped in loadMostRecentFile
+		caseTypeClean = caseType.reset_index()
+		stage = getCaseType(caseInput)
 		
 		#If it's a received case, it filters by only 2021 file numbers
-		if '1 - Received' in fileNames[i]:
+		if stage == "Received":
 			caseTypeClean['Referral Date'] = pd.to_datetime(caseTypeClean["Referral Date"])
 			caseTypeClean = caseTypeClean[(caseTypeClean['Referral Date'] > '2022-1-1')]
 			caseTypeClean['Year'] = caseTypeClean['Referral Date'].dt.year
 
 		#If it's a not filed case, we only want not filed cases with a 2021 not-filed date
-		if '2 - Not Filed' in fileNames[i]:
+		if stage == "Not-Filed":
 			caseTypeClean["Disp. Dt."] = pd.to_datetime(caseTypeClean["Disp. Dt."])
 			caseTypeClean = caseTypeClean[~caseTypeClean['File #'].isin(uniqueFiledCRNs)]
 			caseTypeClean = caseTypeClean[(caseTypeClean['Disp. Dt.'] > '2022-1-1')]
@@ -136,48 +135,60 @@ def cleanDataSet(updatedCompleteDFs, uniqueFiledCRNs):
 			notFiledCases.append(caseTypeClean)
 
 		#If it's a filed case, we only look at cases that have a 2021 file date
-		if '3 - Filed' in fileNames[i]:
+		if stage == "Filed":
 			caseTypeClean["Filing Dt."] = pd.to_datetime(caseTypeClean["Filing Dt."])
 			caseTypeClean = caseTypeClean[(caseTypeClean['Filing Dt.'] > '2022-1-1')]
 			caseTypeClean['Year'] = caseTypeClean['Filing Dt.'].dt.year
 
-		if '4 - Disposed' in fileNames[i]:
+		if stage == "Disposed":
 			caseTypeClean["Disp. Dt."] = pd.to_datetime(caseTypeClean["Disp. Dt."])
 			caseTypeClean = caseTypeClean[(caseTypeClean['Disp. Dt.'] > '2022-1-1')]
 			caseTypeClean['Year'] = caseTypeClean['Disp. Dt.'].dt.year
 			disposedCases.append(caseTypeClean)
 
-		#Updates File Names 
-		caseTypeClean.to_csv("RawData\\" + fileNames[i], index = False)
+		#Sets the type of the new Year column
+		caseTypeClean = applyKarpelSchema(caseTypeClean)
+		cleanedDFs.append(caseTypeClean)
 
-		#Increment File Name Counter by One
-		i = i + 1
+		#Increment Stage Counter by One
+		caseInput = caseInput + 1
 
 	disposedCases = pd.concat(disposedCases)
 	disposedCases = disposedCases[['File #']]
 	disposedCases = disposedCases.drop_duplicates(subset = ["File #"])
-	disposedCases.to_csv("AllDisposedFileNumbers.csv")
 
 	notFiledCases = pd.concat(notFiledCases)
 	notFiledCases = notFiledCases[['File #']]
 	notFiledCases = notFiledCases.drop_duplicates(subset = ["File #"])
-	notFiledCases.to_csv("NotFiledCases.csv")
+
+	return cleanedDFs, disposedCases, notFiledCases
 
 # Function:  karpelStarter
-# Purpose:   This is the main runner of Karpel Starter. It grabs the most recent data, cleans it, then saves it.
+# Purpose:   This is the main runner of Karpel Starter. It grabs the most recent data, cleans it, then returns it for the CaseStore.
 # Author:    Henry Chapman, hchapman@jacksongov.org
 # Arguments: None
-# Return:    None
+# Return:    Returns the cleaned list of dataframes (received, not-filed, filed, disposed), the list of filed file numbers, 
+#            dataframes of disposed and not-filed file numbers, the set of charge codes that changed since the last analyzed drop (None if everything has to be recomputed),
+#            and the record of today's drop to save once it's analyzed
 def karpelStarter():
 
 	#FilePath of Weekly Updating Cases
 	weeklyUpload = "H:\\Units Attorneys and Staff\\01 - Units\\DT Crime Strategies Unit\\Weekly Update\\"
 	uniqueFiledCRNs = getUniqueListOfFiledCases(weeklyUpload)
 	
+	#Load the Blocklist of Test Defendants
+	blocklistPattern, ruleNames = loadTestDefendantBlocklist()
+
 	#Get Newly Updated Karpel Data from H Drive
-	updatedCompleteDFs = loadMostRecentFile(getNewestFile(weeklyUpload), weeklyUpload)
+	newestFile = getNewestFile(weeklyUpload)
+	updatedCompleteDFs = loadMostRecentFile(newestFile, weeklyUpload, blocklistPattern, ruleNames)
+
+	#Compare it to the Last Analyzed Drop to see which charges changed
+	changedChargeCodes, analyzedDrop = findChangedChargeCodes(updatedCompleteDFs, newestFile)
+
+	#Cleaned Dataset
+	cleanedDFs, disposedCases, notFiledCases = cleanDataSet(updatedCompleteDFs, uniqueFiledCRNs)
 
-	#Cleaned and Saved Dataset
-	cleanDataSet(updatedCompleteDFs, uniqueFiledCRNs)
+	return cleanedDFs, uniqueFiledCRNs, disposedCases, notFiledCases, changedChargeCodes, analyzedDrop
 
 
@@ -0,0 +1,143 @@
+import pandas as pd
+import bisect
+import re
+import os
+from AddressNormalizer import normalizeAddress, cleanAddressParts, cleanZipCodes
+
+# Script:   LocalGeocoder.py
+# Purpose:  This script geocodes addresses without the network, from the county's address points. It builds two in-memory indexes once:
+#           an exact one keyed by house number, street, and zip (or city), and a street one that interpolates between the nearest house numbers on the same side of the street.
+#           geocodeCases tries it first, and only sends the addresses it can't find to LocationIQ.
+# Author:   Henry Chapman, hchapman@jacksongov.org
+# Dependencies:
+#	 External: Pandas, bisect, re, os
+#	 Functions: normalizeAddress, cleanAddressParts, cleanZipCodes
+
+#Location of the County Address Points (optional - without it, everything goes to LocationIQ)
+addressPointsPath = "Maps\\JacksonCountyAddressPoints.csv"
+
+#Columns of the Address Points File, and the names the geocoder uses for them
+addressPointColumns = {'House Number': 'House Number', 'Street': 'Street', 'City': 'City', 'Zip': 'Zip', 'Latitude': 'Latitude', 'Longitude': 'Longitude'}
+
+#Interpolate only between house numbers this close together (so we don't guess across a long gap in the address points)
+maxInterpolationGap = 200
+
+# Function:  parseAddress
+# Purpose:   This function splits an address key (415 E 12TH ST, KANSAS CITY, MO, 64106) into its house number, street, city, and zip
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: address (string of the street address)
+# Return:    Returns (house number, street, city, zip) - house number is None if the address doesn't start with one
+def parseAddress(address):
+	parts = address.split(", ")
+
+	#House Number and Street
+	streetMatch = re.match(r'^(\d+)\s+(.+)$', parts[0])
+	if streetMatch is None:
+		return None, parts[0], None, None
+	houseNumber = int(streetMatch.group(1))
+	street = streetMatch.group(2)
+
+	#Zip is the last 5 digit part, and City is the first part after the street that isn't a state or zip
+	zipCode = None
+	city = None
+	for part in parts[1:]:
+		if re.match(r'^\d{5}(-\d{4})?$', part):
+			zipCode = part[:5]
+		elif city is None and len(part) > 2:
+			city = part
+
+	return houseNumber, street, city, zipCode
+
+# Class:     LocalGeocoderBackend
+# Purpose:   Geocodes addresses from the county address points, by an exact match or by interpolating along the street. It has the same geocode(address) as the remote backends.
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: addressPoints (dataframe with House Number, Street, City, Zip, Latitude, and Longitude columns)
+class LocalGeocoderBackend:
+	def __init__(self, addressPoints):
+		addressPoints = addressPoints.dropna(subset = ['House Number', 'Street', 'Latitude', 'Longitude']).copy()
+		addressPoints['House Number'] = pd.to_numeric(addressPoints['House Number'], errors = 'coerce')
+		addressPoints = addressPoints.dropna(subset = ['House Number'])
+		addressPoints['House Number'] = addressPoints['House Number'].astype(int)
+		addressPoints['Street'] = cleanAddressParts(addressPoints['Street'])
+		addressPoints['City'] = cleanAddressParts(addressPoints['City'])
+		addressPoints['Zip'] = cleanZipCodes(addressPoints['Zip'])
+
+		#Exact Index - (house number, street, zip) and (house number, street, city)
+		self.exactIndex = {}
+		#Street Index - (street, zip) and (street, city) to sorted house numbers and their coordinates
+		self.streetIndex = {}
+
+		for houseNumber, street, city, zipCode, latitude, longitude in zip(addressPoints['House Number'].tolist(), addressPoints['Street'].tolist(), addressPoints['City'].tolist(),
+			addressPoints['Zip'].tolist(), addressPoints['Latitude'].astype(float).tolist(), addressPoints['Longitude'].astype(float).tolist()):
+			for place in (zipCode, city):
+				if place != '':
+					self.exactIndex.setdefault((houseNumber, street, place), (latitude, longitude))
+					self.streetIndex.setdefault((street, place), {}).setdefault(houseNumber, (latitude, longitude))
+
+		#Split Each Street into its odd and even sides, sorted by house number
+		for key in self.streetIndex:
+			houseNumbers = sorted(self.streetIndex[key])
+			self.streetIndex[key] = {side: ([houseNumber for houseNumber in houseNumbers if houseNumber % 2 == side], [self.streetIndex[key][houseNumber] for houseNumber in houseNumbers if houseNumber % 2 == side]) for side in (0, 1)}
+
+	#Interpolates between the closest house numbers around the house number (on one side of the street)
+	def interpolate(self, houseNumbers, coordinates, houseNumber):
+		position = bisect.bisect_left(houseNumbers, houseNumber)
+		if position == 0 or position == len(houseNumbers):
+			return None
+
+		lowNumber = houseNumbers[position - 1]
+		highNumber = houseNumbers[position]
+		if highNumber - lowNumber > maxInterpolationGap:
+			return None
+
+		lowPoint = coordinates[position - 1]
+		highPoint = coordinates[position]
+		fraction = (houseNumber - lowNumber) / (highNumber - lowNumber)
+		return (lowPoint[0] + (highPoint[0] - lowPoint[0]) * fraction, lowPoint[1] + (highPoint[1] - lowPoint[1]) * fraction)
+
+	#Returns (latitude, longitude), or None if the address isn't in the address points
+	def geocode(self, address):
+		address = normalizeAddress(address)
+		if address is None:
+			return None
+
+		houseNumber, street, city, zipCode = parseAddress(address)
+		if houseNumber is None:
+			return None
+
+		#Exact Match First (by zip, then by city), then Interpolate Along the Street
+		places = [place for place in (zipCode, city) if place is not None]
+		for place in places:
+			if (houseNumber, street, place) in self.exactIndex:
+				return self.exactIndex[(houseNumber, street, place)]
+
+		for place in places:
+			if (street, place) in self.streetIndex:
+				houseNumbers, streetCoordinates = self.streetIndex[(street, place)][houseNumber % 2]
+				coordinates = self.interpolate(houseNumbers, streetCoordinates, houseNumber)
+				if coordinates is not None:
+					return coordinates
+
+		return None
+
+	#Geocodes every address it can. Returns a dictionary of address to (latitude, longitude) for the addresses it found.
+	def geocodeAll(self, addresses):
+		results = {}
+		for address in addresses:
+			coordinates = self.geocode(address)
+			if coordinates is not None:
+				results[address] = coordinates
+		return results
+
+# Function:  loadLocalGeocoder
+# Purpose:   This function builds the local geocoder from the county address points, if we have them
+# Author:    Henry Chapman, hchapman@jacksongov.org
+# Arguments: path (FilePath of the address points CSV), columns (dictionary of the file's column names for House Number, Street, City, Zip, Latitude, and Longitude)
+# Return:    Returns a LocalGeocoderBackend, or None if there isn't an address points file
+def loadLocalGeocoder(path = addressPointsPath, columns = addressPointColumns):
+	if not os.path.exists(path):
+		return None
+
+	addressPoints = pd.read_csv(path, usecols = list(columns.values()), encoding = 'utf-8')
+	addressPoints = addressPoints.rename(columns = {fileColumn: column for column, fileColumn in columns.items()})
+	return LocalGeocoderBackend(addressPoints)
@@ -2,7 +2,22 @@ import pandas as pd
 from KarpelStarter import karpelStarter
 import plotly.graph_objects as go
 import numpy as np
-from DispositionCounter import disposedCaseCounter, declinedCaseCounter
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from DispositionCounter import countCaseReasons
+from CaseLifecycle import getLifecycleSlice
+
+#Folder the Sankeys are Published From (it also holds the one shared copy of plotly.min.js)
+sankeyFolder = "C:\\Users\\hchapman\\OneDrive - Jackson County Missouri\\Documents\\Dashboards\\KCPD Clearance Dashboard\\Sankeys\\KarpelDashboard\\"
+
+#Hashes of the link data behind each published Sankey, so unchanged Sankeys aren't written again
+sankeyHashPath = "SankeyHashes.csv"
+
+#Node/Link Data of every Sankey in one file (bump the version when the layout of the file changes)
+sankeyDataPath = sankeyFolder + "SankeyData.json"
+sankeyDataVersion = 1
 
 def factorize(s):
     a = pd.factorize(s, sort=True)[0]
@@ -18,53 +33,48 @@ def reasonsToNodes(reasonDF, links):
 
 	return links
 
-def generateJCPOCaseHistory(year, crimeCategory, receivedFileNumbers, listOfKarpelCases):
+#caseLifecycle is the table from buildCaseLifecycle - built once per run, so each Sankey just counts the states of its received cases
+#Returns a dataframe of the Sankey links (source, target, value)
+def sankeyLinks(receivedFileNumbers, caseLifecycle):
 
 	#Received - Count Unique File Numbers - Number of Received Cases
-	#print("Received Cases: " + str(len(receivedFileNumbers)))
+	lifecycleSlice = getLifecycleSlice(caseLifecycle, receivedFileNumbers)
+	stateCounts = lifecycleSlice['State'].value_counts()
 
-	#Filed - Count How Many of Those File Numbers Appear in Filed
-	filedSet = set(listOfKarpelCases[1]['File #'].tolist())
-	filedFileNumbers = filedSet.intersection(receivedFileNumbers)
+	#Filed - Active and Disposed Cases
+	filedCount = int(stateCounts.get('Active', 0) + stateCounts.get('Disposed', 0))
 
-	#Not Filed - Count How Many of Those File Numbers Appear in Not-Filed
-	declinedSet = set(listOfKarpelCases[3]['File #'].tolist())
-	declinedFileNumbers = declinedSet.intersection(receivedFileNumbers)
-	declinedFileNumbers = declinedFileNumbers.difference(filedSet)
-	declineReasons = declinedCaseCounter(declinedFileNumbers, listOfKarpelCases[3])
+	#Not Filed - Declined Cases That Were Never Filed
+	declinedFileNumbers = lifecycleSlice.index[lifecycleSlice['State'] == 'Declined'].tolist()
+	declineCounts = countCaseReasons(declinedFileNumbers, caseLifecycle['Decline Reason'], 'B - Declined', "C - ")
 
 	#Under Review = Received - Filed - Not Filed
-	reviewSet = set(receivedFileNumbers).difference(filedSet).difference(declinedFileNumbers)
+	reviewCount = int(stateCounts.get('Under Review', 0))
 
 	#Disposed Cases
-	disposedSet = set(listOfKarpelCases[2]['File #'].tolist())
-	disposedFileNumbers = disposedSet.intersection(receivedFileNumbers)
-	disposedFileNumbers = list(disposedSet.intersection(filedFileNumbers))
-	disposalReasons = disposedCaseCounter(disposedFileNumbers, listOfKarpelCases[2])
-	#print(disposalReasons.head())
+	disposedFileNumbers = lifecycleSlice.index[lifecycleSlice['State'] == 'Disposed'].tolist()
+	disposalCounts = countCaseReasons(disposedFileNumbers, caseLifecycle['Disposal Reason'], 'C - Cases Disposed', "D - ")
 
 	#Currently Pending/Under Warrant Status
 	#Currently Pending = Filed - Disposed
-	activeSet = set(filedFileNumbers).difference(disposedFileNumbers)
-
-	reviewPos = len(reviewSet)/len(receivedFileNumbers)
-	declinePos = reviewPos - len(declinedFileNumbers)/len(receivedFileNumbers)
-	filedPos = declinePos - len(filedFileNumbers)/len(receivedFileNumbers)
-	activePos = filedPos - len(activeSet)/len(receivedFileNumbers)
-	disposedPos = len(declinedFileNumbers)/len(receivedFileNumbers)
+	activeCount = int(stateCounts.get('Active', 0))
 
 	links = [
 		{'source': 'A - Received by Office', 'target':'B - Declined', 'value':len(declinedFileNumbers)},
-		{'source': 'A - Received by Office', 'target':'B - Under Review', 'value':len(reviewSet)},
-		{'source': 'A - Received by Office', 'target':'B - Cases Filed', 'value':len(filedFileNumbers)},
-		{'source': 'B - Cases Filed', 'target':'C - Case Active', 'value':len(activeSet)},
+		{'source': 'A - Received by Office', 'target':'B - Under Review', 'value':reviewCount},
+		{'source': 'A - Received by Office', 'target':'B - Cases Filed', 'value':filedCount},
+		{'source': 'B - Cases Filed', 'target':'C - Case Active', 'value':activeCount},
 		{'source': 'B - Cases Filed', 'target':'C - Cases Disposed', 'value':len(disposedFileNumbers)},
 	]
 
-	reasonsToNodes(disposalReasons, links)
-	reasonsToNodes(declineReasons, links)
+	reasonsToNodes(disposalCounts, links)
+	reasonsToNodes(declineCounts, links)
+
+	return pd.DataFrame(links)
 
-	df = pd.DataFrame(links)
+
+#Gives each node an id and a position (by the letter in front of its name)
+def sankeyNodes(df):
 
 	nodes = np.unique(df[["source","target"]], axis=None)
 	nodes = pd.Series(index=nodes, data=range(len(nodes)))
@@ -76,6 +86,13 @@ def generateJCPOCaseHistory(year, crimeCategory, receivedFileNumbers, listOfKarp
 			y = lambda d: factorize(d.index.str[0])/3,
 		)
 	)
+	return nodes
+
+
+#Draws the Sankey and writes it to the Sankey folder. The page points at the shared plotly.min.js next to it instead of embedding its own copy.
+def renderSankey(year, crimeCategory, df):
+
+	nodes = sankeyNodes(df)
 
 	fig = go.Figure(
     	go.Sankey(
@@ -99,6 +116,73 @@ def generateJCPOCaseHistory(year, crimeCategory, receivedFileNumbers, listOfKarp
     #                           font =dict(size=30,
     #                           color = 'White')), font_size=15, title_x=0.5, plot_bgcolor='rgba(34,34,34,255)', paper_bgcolor='rgba(34,34,34,255)',)
 
-	path = "C:\\Users\\hchapman\\OneDrive - Jackson County Missouri\\Documents\\Dashboards\\KCPD Clearance Dashboard\\Sankeys\\KarpelDashboard\\"
-	fig.write_html(path + str(year) + " - " +crimeCategory + ".html")
-
+	fig.write_html(sankeyFolder + str(year) + " - " +crimeCategory + ".html", include_plotlyjs = 'directory')
+
+
+def generateJCPOCaseHistory(year, crimeCategory, receivedFileNumbers, caseLifecycle):
+	renderSankey(year, crimeCategory, sankeyLinks(receivedFileNumbers, caseLifecycle))
+
+
+#Hashes the link data (and title) of a Sankey
+def hashSankey(year, crimeCategory, df):
+	sankeyHash = hashlib.md5()
+	sankeyHash.update((str(year) + " - " + crimeCategory).encode('utf-8'))
+	sankeyHash.update(df.to_csv(index = False).encode('utf-8'))
+	return sankeyHash.hexdigest()
+
+
+def loadSankeyHashes():
+	if not os.path.exists(sankeyHashPath):
+		return {}
+	sankeyHashes = pd.read_csv(sankeyHashPath, dtype = str)
+	return pd.Series(sankeyHashes['Hash'].values, index = sankeyHashes['Sankey']).to_dict()
+
+
+#Publishes every Sankey (a list of (year, crimeCategory, links dataframe)). Sankeys whose links haven't changed since the last run are skipped,
+#and the rest are rendered across a process pool.
+def publishSankeys(sankeys, maxWorkers = None):
+	sankeyHashes = loadSankeyHashes()
+
+	#Find the Sankeys that changed (or were never written)
+	changedSankeys = []
+	for year, crimeCategory, df in sankeys:
+		sankeyName = str(year) + " - " + crimeCategory
+		sankeyHash = hashSankey(year, crimeCategory, df)
+		if sankeyHashes.get(sankeyName) != sankeyHash or not os.path.exists(sankeyFolder + sankeyName + ".html"):
+			changedSankeys.append((year, crimeCategory, df))
+			sankeyHashes[sankeyName] = sankeyHash
+	print("Rendering " + str(len(changedSankeys)) + " of " + str(len(sankeys)) + " Sankeys")
+
+	#Write the shared plotly.min.js once, before the pool starts writing pages
+	if len(changedSankeys) != 0 and not os.path.exists(sankeyFolder + "plotly.min.js"):
+		year, crimeCategory, df = changedSankeys[0]
+		renderSankey(year, crimeCategory, df)
+		changedSankeys = changedSankeys[1:]
+
+	#Render the Rest in Parallel
+	if len(changedSankeys) != 0:
+		years, crimeCategories, links = zip(*changedSankeys)
+		with ProcessPoolExecutor(max_workers = maxWorkers) as executor:
+			list(executor.map(renderSankey, years, crimeCategories, links))
+
+	#Only save the hashes once the pages are written
+	pd.DataFrame({'Sankey': list(sankeyHashes.keys()), 'Hash': list(sankeyHashes.values())}).to_csv(sankeyHashPath, index = False)
+
+
+#Writes the nodes and links of every Sankey (a list of (year, crimeCategory, links dataframe)) into one JSON file next to the Sankey pages,
+#so the front end can draw any of them from a single fetch. The hash changes whenever the data does, so it can be used to bust the browser cache.
+def writeSankeyData(sankeys):
+	sankeyData = []
+	for year, crimeCategory, df in sankeys:
+		nodes = sankeyNodes(df)
+		sankeyData.append({
+			'year': None if pd.isna(year) else int(year),
+			'category': crimeCategory,
+			'title': "Current Progress of " + crimeCategory + " Cases Received in " + str(year),
+			'nodes': [{'id': int(node['id']), 'label': label[3:], 'x': float(node['x']), 'y': float(node['y'])} for label, node in nodes.iterrows()],
+			'links': [{'source': int(nodes.loc[link['source'], 'id']), 'target': int(nodes.loc[link['target'], 'id']), 'value': int(link['value'])} for link in df.to_dict(orient = 'records')],
+		})
+
+	sankeyHash = hashlib.md5(json.dumps(sankeyData, separators = (',', ':')).encode('utf-8')).hexdigest()
+	with open(sankeyDataPath, 'w', encoding = 'utf-8') as sankeyFile:
+		json.dump({'version': sankeyDataVersion, 'hash': sankeyHash, 'sankeys': sankeyData}, sankeyFile, separators = (',', ':'))
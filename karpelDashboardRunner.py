@@ -1,12 +1,13 @@
 import pandas as pd
-from KarpelStarter import karpelStarter
-from DefendantDemographics import defendantDemographics
-from CaseDetails import caseDetails
-from HelperMethods import readDataForList, combineAllCSVs, getListOfCrimeCategories, filterLargerDataFrame, getCaseYear
+from CaseStore import buildCaseStore
+from AnalysisEngine import analyzeCategories
+from HelperMethods import combineAllCSVs, getListOfCrimeCategories, getChangedCategories, removeCategoryCSVs, readHelperDataset
 from DashboardMapGenerator import geocoderRunner
 from DataUploaderRunner import DataUploaderRunner
-from CaseHistoryCollector import caseHistoryCollector, generateCSV
-from caseHistoryGenerator import generateJCPOCaseHistory 
+from CaseHistoryCollector import generateCSV
+from caseHistoryGenerator import sankeyLinks, publishSankeys, writeSankeyData
+from CaseLifecycle import buildCaseLifecycle, caseHistorySlices
+from DropDeltas import recordAnalyzedDrop
 import os 
 import shutil
 
@@ -19,98 +20,85 @@ warnings.simplefilter(action='ignore', category = FutureWarning)
 # Author:   Henry Chapman, hchapman@jacksongov.org
 # Dependencies:
 #	 External: Pandas, os, shutil
-#	 Functions: KarpelStarter, DefendantDemographics, Case Details, HelperMethods, DashboardMapGenerator, DataUploaderRunner
+#	 Functions: CaseStore, AnalysisEngine, HelperMethods, DashboardMapGenerator, DataUploaderRunner, recordAnalyzedDrop
 
 
 #Change This Path To Become More Portable
 homeFolder = r"C:\\Users\\hchapman\\OneDrive - Jackson County Missouri\\Documents\\Dashboards\\"
 
-#Step 1: Collect Most Recent Karpel Cases
-print("Starting Karpel")
-karpelStarter()
-consolidatedCases = caseHistoryCollector(homeFolder)
+#The Sankeys render across a process pool, which re-imports this script, so the run only starts from here
+def main():
 
-#Get List of Crime Categories:
-crimeCategoryList = getListOfCrimeCategories()
+	#Step 1: Collect Most Recent Karpel Cases and the Case History - Everything Below Uses This One CaseStore
+	print("Starting Karpel")
+	caseStore = buildCaseStore(homeFolder)
+	consolidatedCases = caseStore.consolidatedCases
 
-#Get List of Jail Inmates
-jailInmateList = pd.read_csv(homeFolder + "Jail Dashboard\\JailInmateLibrary.csv")
+	#Get List of Crime Categories:
+	crimeCategoryList = getListOfCrimeCategories()
 
-#Get List of Bond Amounts
-bondAmounts = pd.read_csv(homeFolder + "BondGatherer\\AllBonds.csv")
+	#Get List of Jail Inmates
+	jailInmateList = pd.read_csv(homeFolder + "Jail Dashboard\\JailInmateLibrary.csv")
 
-#Get File Numbers of Disposed Cases
-disposedCases = pd.read_csv("AllDisposedFileNumbers.csv")
+	#Get List of Bond Amounts
+	bondAmounts = pd.read_csv(homeFolder + "BondGatherer\\AllBonds.csv")
 
-#Get File Numbers of Not Filed Cases
-notFiledCases = pd.read_csv("NotFiledCases.csv")
+	#Year of the Current Cases
+	year = caseStore.year
 
-print("reading data")
-xls = readDataForList()
-year = getCaseYear(xls)
+	#Get the Categories that changed since the last analyzed drop (None means every category gets recomputed)
+	changedCategories = getChangedCategories(caseStore.changedChargeCodes)
+	if not os.path.exists("DataForDashboard"):
+		changedCategories = None
 
-#Deletes and Remakes Data For Dashboard Folder
-if os.path.exists("DataForDashboard"):
-	shutil.rmtree("DataForDashboard")
-os.makedirs("DataForDashboard")
-print("finished reading data - " + str(year))
+	#Deletes and Remakes Data For Dashboard Folder if everything is being recomputed, otherwise just removes the changed categories
+	if changedCategories is None:
+		if os.path.exists("DataForDashboard"):
+			shutil.rmtree("DataForDashboard")
+		os.makedirs("DataForDashboard")
+	else:
+		print("Changed Categories: " + str(sorted(changedCategories)))
+		for tempCaseCategory in changedCategories:
+			removeCategoryCSVs(tempCaseCategory)
+	print("finished reading data - " + str(year))
 
-#Loops through every Crime Category, and Conducts Analysis on Each One
-for tempCaseCategory in crimeCategoryList:
+	#Step 2: Conduct Analysis on Most Recent Karpel Cases for every Crime Category and "All" (Defendant Based Analysis and Case Details)
+	analyzeCategories(caseStore, crimeCategoryList, jailInmateList, bondAmounts, changedCategories)
 
-	#Filters Received, Filed, and Disposed cases by that particular category
-	tempXls = filterLargerDataFrame(xls, tempCaseCategory)
+	#The Analysis Finished - the next run only has to recompute what changed after this drop
+	recordAnalyzedDrop(caseStore.analyzedDrop)
 
-	#if Category is Empty, it skips it, and doesn't analyze it
-	if tempXls == False:
-		print("Skipping " + tempCaseCategory)
-		continue
+	#Loop Through Years
+	listOfYears = list(set(consolidatedCases[0]["Year"].tolist()))
+	print(listOfYears)
+	chargesDictionary = readHelperDataset("HelperDatasets\\ChargeCodeCategories.csv")
 
-	#Prints out Case Category as an indication that it's completed
-	print(tempCaseCategory)
+	#Build the Lifecycle of every received case once - each Sankey just counts it
+	caseLifecycle = buildCaseLifecycle(caseStore, chargesDictionary)
 
-	#Step 2: Conduct Analysis on Most Recent Karpel Cases by category (Defendant Based Analysis and Case Details)
-	defendantDemographics(tempXls, tempCaseCategory, year, jailInmateList, disposedCases, notFiledCases, bondAmounts)
-	caseDetails(tempXls, tempCaseCategory, year)
+	#Loop Through Years and Categories - the received file numbers of every (year, category) come from one merge
+	sankeys = []
+	for year, tempCaseCategory, receivedFileNumbers in caseHistorySlices(consolidatedCases[0], chargesDictionary, crimeCategoryList):
+		sankeys.append((year, tempCaseCategory, sankeyLinks(receivedFileNumbers, caseLifecycle)))
 
+	#Publish the Sankeys that changed (in parallel, sharing one copy of plotly.js)
+	publishSankeys(sankeys)
 
-#Loop Through Years
-listOfYears = list(set(consolidatedCases[0]["Year"].tolist()))
-print(listOfYears)
-chargesDictionary = pd.read_csv("HelperDatasets\\ChargeCodeCategories.csv", encoding = 'utf-8')
-for year in listOfYears:
+	#Write the Data Behind Every Sankey into one JSON file for the front end
+	writeSankeyData(sankeys)
 
-	#Loop Through Categories
-	for tempCaseCategory in crimeCategoryList:
+	#Step 3: Collect All Analysis into one CSV File
+	print("Combining All CSVs")
+	combineAllCSVs(year)
+	generateCSV(homeFolder)
 
-		#Merge In Case Charges
-		tempCategoryDF = consolidatedCases[0].merge(chargesDictionary, on='Ref. Charge Code')
-		tempCategoryDF = tempCategoryDF[tempCategoryDF['Category']==tempCaseCategory]
-		tempCategoryDF = tempCategoryDF[tempCategoryDF['Year']==year]
-		receivedFileNumbers = list(set(tempCategoryDF['File #'].tolist()))
+	#Step 4: Run Geocoding Analysis (This Handles the Mapping Aspect)
+	print("Geocoding and Preparing Maps")
+	geocoderRunner(caseStore)
 
-		if len(receivedFileNumbers)!=0:
-			generateJCPOCaseHistory(year, tempCaseCategory, receivedFileNumbers, consolidatedCases)
+	#Step 5: Upload to ESRI Dashboard
+	print("Uploading Data to ESRI Online")
+	DataUploaderRunner()
 
-	#Merge In Case Charges
-	tempCategoryDF = consolidatedCases[0].merge(chargesDictionary, on='Ref. Charge Code')
-	tempCategoryDF = tempCategoryDF[tempCategoryDF['Year']==year]
-	receivedFileNumbers = list(set(tempCategoryDF['File #'].tolist()))
-	generateJCPOCaseHistory(year, "All", receivedFileNumbers, consolidatedCases)
-
-#Step 2.5 = Run All 2022 Cases - Once it's done with each case category, it'll do all of them
-defendantDemographics(xls, "All", year, jailInmateList, disposedCases, notFiledCases, bondAmounts)
-caseDetails(xls, "All", year)
-
-#Step 3: Collect All Analysis into one CSV File
-print("Combining All CSVs")
-combineAllCSVs(year)
-generateCSV(homeFolder)
-
-#Step 4: Run Geocoding Analysis (This Handles the Mapping Aspect)
-print("Geocoding and Preparing Maps")
-geocoderRunner(xls, year)
-
-#Step 5: Upload to ESRI Dashboard
-print("Uploading Data to ESRI Online")
-DataUploaderRunner()
\ No newline at end of file
+if __name__ == "__main__":
+	main()